@@ -0,0 +1,104 @@
+"""Бенчмарк фильтра бюджета в поиске блогеров.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_budget_filter
+
+Сравнивает на 100k блогеров:
+- прежний фильтр (OR по колонкам цен, min и max проверяются отдельно) -
+  полный проход по таблице и неверный результат;
+- правильное условие по всем колонкам цен без индекса - тоже полный проход;
+- подзапрос к blogger_offers с индексом (offer_type, price) - поиск по диапазону.
+Проверяет, что правильное условие и blogger_offers дают одинаковый результат.
+"""
+import random
+import sqlite3
+import time
+
+from database.models import OFFER_PRICE_COLUMNS
+
+BLOGGERS = 100_000
+REPEATS = 5
+BUDGET = (14_000, 15_000)
+
+SCHEMA = """
+    CREATE TABLE bloggers (
+        id INTEGER PRIMARY KEY, name TEXT,
+        price_stories INTEGER, price_reels INTEGER, price_post INTEGER, price_video INTEGER
+    );
+    CREATE TABLE blogger_offers (
+        blogger_id INTEGER NOT NULL, offer_type TEXT NOT NULL, price INTEGER NOT NULL,
+        PRIMARY KEY (blogger_id, offer_type)
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_blogger_offers_type_price ON blogger_offers (offer_type, price);
+"""
+
+OFFER_TYPES = [offer_type for offer_type, _ in OFFER_PRICE_COLUMNS]
+
+LEGACY_QUERY = """
+    SELECT id FROM bloggers
+    WHERE (price_stories >= ? OR price_post >= ? OR price_video >= ?)
+      AND (price_stories <= ? OR price_post <= ? OR price_video <= ?)
+"""
+
+SCAN_QUERY = "SELECT id FROM bloggers WHERE " + " OR ".join(
+    f"{column} BETWEEN ? AND ?" for _, column in OFFER_PRICE_COLUMNS
+)
+
+OFFERS_QUERY = f"""
+    SELECT id FROM bloggers WHERE id IN (
+        SELECT blogger_id FROM blogger_offers
+        WHERE offer_type IN ({', '.join('?' * len(OFFER_TYPES))}) AND price >= ? AND price <= ?
+    )
+"""
+
+
+def price():
+    return random.choice([None, random.randint(1, 300) * 500])
+
+
+def create_database() -> sqlite3.Connection:
+    random.seed(7)
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    rows = [(i, f"blogger_{i}", price(), price(), random.choice([None, None, price()]), None)
+            for i in range(1, BLOGGERS + 1)]
+    conn.executemany("INSERT INTO bloggers VALUES (?, ?, ?, ?, ?, ?)", rows)
+    for offer_type, column in OFFER_PRICE_COLUMNS:
+        conn.execute(
+            f"INSERT INTO blogger_offers SELECT id, ?, {column} FROM bloggers WHERE {column} IS NOT NULL",
+            (offer_type,)
+        )
+    conn.execute("ANALYZE")
+    return conn
+
+
+def best_time(function) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    conn = create_database()
+    low, high = BUDGET
+    queries = [
+        ("Прежний фильтр (OR по колонкам)", LEGACY_QUERY, [low] * 3 + [high] * 3),
+        ("Все колонки цен, без индекса", SCAN_QUERY, [low, high] * len(OFFER_PRICE_COLUMNS)),
+        ("blogger_offers + индекс", OFFERS_QUERY, OFFER_TYPES + [low, high]),
+    ]
+
+    results = {name: {row[0] for row in conn.execute(query, params)} for name, query, params in queries}
+    assert results[queries[1][0]] == results[queries[2][0]], "blogger_offers расходится с колонками цен"
+
+    print(f"Блогеров: {BLOGGERS}, бюджет {low:,}-{high:,}₽, лучший из {REPEATS} прогонов")
+    for name, query, params in queries:
+        seconds = best_time(lambda: conn.execute(query, params).fetchall())
+        plan = "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params))
+        print(f"{name:<34} {seconds * 1000:>7.2f} мс  найдено {len(results[name]):>5}  [{plan}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Бенчмарк полнотекстового поиска блогеров на 1M строк.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_fts
+
+Схема bloggers_fts та же, что в init_blogger_search (database/database.py).
+Сравнивает LIKE '%слово%' по имени, ссылке и описанию (полный проход
+по таблице; к тому же LIKE в SQLite различает регистр кириллицы) с MATCH
+по FTS5 и сортировкой по bm25, top-10.
+"""
+import random
+import sqlite3
+import time
+
+ROWS = 1_000_000
+REPEATS = 5
+TOP = 10
+
+SCHEMA = """
+    CREATE TABLE bloggers (id INTEGER PRIMARY KEY, name TEXT, url TEXT, description TEXT);
+    CREATE VIRTUAL TABLE bloggers_fts USING fts5(
+        name, url, description,
+        tokenize = "unicode61 tokenchars '_'",
+        prefix = '2 3'
+    );
+"""
+
+FIRST_NAMES = ["Анна", "Мария", "Ольга", "Иван", "Пётр", "Дарья", "Алексей", "Екатерина", "Никита", "Софья",
+               "Юлия", "Артём", "Полина", "Максим", "Алина", "Денис", "Вера", "Глеб", "Ксения", "Роман"]
+SYLLABLES = ["ко", "ва", "ле", "ми", "ро", "за", "ну", "те", "бо", "ли", "са", "ре", "мо", "ки", "да", "пу"]
+LATIN = ["ka", "lo", "mi", "ra", "te", "zu", "no", "vi", "sa", "do", "be", "li", "ro", "ma", "ne", "ko"]
+TOPICS = ["фитнес и правильное питание", "путешествия по России", "уход за кожей", "рецепты на каждый день",
+          "ремонт квартир и дизайн", "обзоры гаджетов", "материнство", "мода и стиль", "автомобили"]
+
+
+def make_rows(count: int):
+    """Имена из словаря, фамилии и ники из слогов (десятки тысяч разных слов)"""
+    random.seed(11)
+    for i in range(1, count + 1):
+        surname = "".join(random.choices(SYLLABLES, k=3)).capitalize() + random.choice(["ва", "в", "на", "ин"])
+        handle = "".join(random.choices(LATIN, k=3)) + random.choice(["", "_blog", "_fit", str(i % 100)])
+        yield (
+            i,
+            f"{random.choice(FIRST_NAMES)} {surname}",
+            f"https://instagram.com/{handle}",
+            f"Блог про {random.choice(TOPICS)}. Сотрудничество в директ.",
+        )
+
+
+def create_database() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO bloggers VALUES (?, ?, ?, ?)", make_rows(ROWS))
+    conn.execute("""
+        INSERT INTO bloggers_fts (rowid, name, url, description)
+        SELECT id, replace(name, 'ё', 'е'), url, description FROM bloggers
+    """)
+    conn.commit()
+    return conn
+
+
+def like_search(conn, text: str):
+    """Без индекса: для ранжирования нужны все совпадения, то есть проход по таблице"""
+    conditions, params = [], []
+    for term in text.split():
+        conditions.append("(name LIKE ? OR url LIKE ? OR description LIKE ?)")
+        params.extend([f"%{term}%"] * 3)
+    return conn.execute(f"SELECT id FROM bloggers WHERE {' AND '.join(conditions)}", params).fetchall()
+
+
+def fts_search(conn, text: str):
+    match = " ".join(f'"{term}"*' for term in text.lower().split())
+    return conn.execute("""
+        SELECT b.id FROM bloggers b JOIN bloggers_fts ON bloggers_fts.rowid = b.id
+        WHERE bloggers_fts MATCH ? ORDER BY bm25(bloggers_fts, 10.0, 5.0, 1.0) LIMIT ?
+    """, (match, TOP)).fetchall()
+
+
+def best_time(function) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    started = time.perf_counter()
+    conn = create_database()
+    print(f"Блогеров: {ROWS}, индексация {time.perf_counter() - started:.1f} с, top-{TOP}, лучший из {REPEATS}")
+
+    # Запросы по одному из блогеров: фамилия, имя и фамилия, ник, начало ника,
+    # и слово из описания, которое есть у каждого девятого блогера
+    name, url = conn.execute("SELECT name, url FROM bloggers WHERE id = ?", (ROWS // 2,)).fetchone()
+    first_name, surname = name.split()
+    handle = url.rsplit("/", 1)[1]
+    queries = [surname, f"{first_name.lower()} {surname.lower()}", handle, handle[:4], "фитнес"]
+
+    for text in queries:
+        like = best_time(lambda: like_search(conn, text))
+        fts = best_time(lambda: fts_search(conn, text))
+        count = conn.execute("SELECT COUNT(*) FROM bloggers_fts WHERE bloggers_fts MATCH ?",
+                             (" ".join(f'"{term}"*' for term in text.lower().split()),)).fetchone()[0]
+        print(f"{'«' + text + '»':<22} {count:>7} совпадений: LIKE {like * 1000:7.1f} мс, FTS5 + bm25 {fts * 1000:7.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Микробенчмарк реестра клавиатур (bot/keyboards.py).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_keyboards
+
+Для каждой клавиатуры сравнивает сборку InlineKeyboardMarkup заново
+(исходная функция, доступная через __wrapped__) с получением готового
+объекта из реестра. Реестр хранит неизменяемые копии, поэтому клавиатуры
+сравниваются по содержимому (model_dump).
+"""
+import time
+
+from bot import keyboards
+
+CALLS = 20_000
+
+
+def best_time(function, repeats: int = 5) -> float:
+    """Лучшее среднее время одного вызова в микросекундах"""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(CALLS):
+            function()
+        best = min(best, time.perf_counter() - started)
+    return best / CALLS * 1_000_000
+
+
+def main():
+    selected = ["instagram", "telegram"]
+    cases = [
+        ("get_category_keyboard", lambda: keyboards.get_category_keyboard.__wrapped__(True),
+         lambda: keyboards.get_category_keyboard(True)),
+        ("get_subscription_keyboard", keyboards.get_subscription_keyboard.__wrapped__,
+         keyboards.get_subscription_keyboard),
+        ("get_yes_no_keyboard", keyboards.get_yes_no_keyboard.__wrapped__,
+         keyboards.get_yes_no_keyboard),
+        ("get_platforms_multi_keyboard", lambda: keyboards._platforms_multi_keyboard.__wrapped__(0b01001),
+         lambda: keyboards.get_platforms_multi_keyboard(selected)),
+        ("get_blogger_edit_field_keyboard", lambda: keyboards.get_blogger_edit_field_keyboard.__wrapped__(42),
+         lambda: keyboards.get_blogger_edit_field_keyboard(42)),
+    ]
+
+    print(f"{CALLS} вызовов, лучший из 5 прогонов, мкс на вызов")
+    for name, build, cached in cases:
+        assert build().model_dump() == cached().model_dump(), f"{name}: реестр вернул другую клавиатуру"
+        build_us, cached_us = best_time(build), best_time(cached)
+        print(f"{name:<34} сборка {build_us:8.2f}  реестр {cached_us:6.3f}  (x{build_us / cached_us:,.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Микробенчмарк маппинга строк БД в модели (строк в секунду).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_mappers
+
+Сравнивает прежний маппинг через sqlite3.Row с проверками 'x' in row.keys()
+и скомпилированные мапперы из database/mappers.py на кортежах.
+"""
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+from database.mappers import blogger_mapper, user_mapper, select_columns
+from database.models import Blogger, User, Platform, BlogCategory
+
+ROWS = 50_000
+REPEATS = 3
+
+SCHEMA = """
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY, telegram_id INTEGER, username TEXT, first_name TEXT, last_name TEXT,
+        subscription_status TEXT, subscription_start_date TIMESTAMP, subscription_end_date TIMESTAMP,
+        rating REAL, reviews_count INTEGER, is_vip BOOLEAN, penalty_amount INTEGER, is_blocked BOOLEAN,
+        created_at TIMESTAMP, updated_at TIMESTAMP
+    );
+    CREATE TABLE user_roles (user_id INTEGER, role TEXT);
+    CREATE TABLE bloggers (
+        id INTEGER PRIMARY KEY, seller_id INTEGER, name TEXT, url TEXT, platforms TEXT,
+        audience_13_17_percent INTEGER, audience_18_24_percent INTEGER, audience_25_35_percent INTEGER,
+        audience_35_plus_percent INTEGER, female_percent INTEGER, male_percent INTEGER, categories TEXT,
+        price_stories INTEGER, price_post INTEGER, price_video INTEGER, price_reels INTEGER,
+        stories_reach_min INTEGER, stories_reach_max INTEGER, reels_reach_min INTEGER, reels_reach_max INTEGER,
+        has_reviews BOOLEAN, is_registered_rkn BOOLEAN, official_payment_possible BOOLEAN,
+        subscribers_count INTEGER, avg_views INTEGER, avg_likes INTEGER, engagement_rate REAL,
+        stats_images TEXT, description TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+    );
+"""
+
+
+def create_database() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    conn.execute("""INSERT INTO users VALUES (1, 100, 'seller', 'Иван', NULL, 'active', '2024-01-01 00:00:00',
+                    '2025-01-01 00:00:00', 4.5, 10, 0, 0, 0, '2024-01-01 00:00:00', '2024-01-01 00:00:00')""")
+    conn.execute("INSERT INTO user_roles VALUES (1, 'seller')")
+    conn.executemany(
+        """INSERT INTO bloggers (seller_id, name, url, platforms, categories, price_stories, price_reels,
+                                 subscribers_count, female_percent, male_percent, stats_images,
+                                 created_at, updated_at)
+           VALUES (1, ?, ?, ?, ?, ?, ?, ?, 60, 40, '[]', '2024-05-01 12:00:00', '2024-05-02 12:00:00')""",
+        (
+            (f"blogger_{i}", f"https://instagram.com/blogger_{i}",
+             json.dumps(["instagram"]), json.dumps(["sport"]), 1000 + i, 2000 + i, 10_000 + i)
+            for i in range(ROWS)
+        ),
+    )
+    return conn
+
+
+def legacy_blogger(row) -> Blogger:
+    """Маппинг в стиле прежних get_blogger/get_user_bloggers"""
+    return Blogger(
+        id=row['id'],
+        seller_id=row['seller_id'],
+        name=row['name'],
+        url=row['url'],
+        platforms=[Platform(p) for p in json.loads(row['platforms'])] if row['platforms'] else [],
+        categories=[BlogCategory(c) for c in json.loads(row['categories'])] if row['categories'] else [],
+        price_stories=row['price_stories'],
+        price_reels=row['price_reels'] if 'price_reels' in row.keys() else None,
+        subscribers_count=row['subscribers_count'],
+        stories_reach_min=row['stories_reach_min'] if 'stories_reach_min' in row.keys() else None,
+        stories_reach_max=row['stories_reach_max'] if 'stories_reach_max' in row.keys() else None,
+        reels_reach_min=row['reels_reach_min'] if 'reels_reach_min' in row.keys() else None,
+        reels_reach_max=row['reels_reach_max'] if 'reels_reach_max' in row.keys() else None,
+        description=row['description'],
+        created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else datetime.now(),
+        updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else datetime.now(),
+    )
+
+
+def rows_per_second(build, rows) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        build(rows)
+        best = min(best, time.perf_counter() - started)
+    return len(rows) / best
+
+
+def main():
+    conn = create_database()
+
+    conn.row_factory = sqlite3.Row
+    dict_rows = conn.execute("SELECT * FROM bloggers").fetchall()
+    conn.row_factory = None
+
+    cursor = conn.execute("SELECT * FROM bloggers")
+    rows = cursor.fetchall()
+    to_blogger = blogger_mapper(cursor.description)
+    to_lazy = blogger_mapper(cursor.description, lazy=True)
+
+    cursor = conn.execute(
+        f"SELECT b.*, {select_columns(User, 'u', prefix='u_')} FROM bloggers b JOIN users u ON b.seller_id = u.id"
+    )
+    joined_rows = cursor.fetchall()
+    to_joined_blogger = blogger_mapper(cursor.description, lazy=True)
+    to_seller = user_mapper(cursor.description, lazy=True, prefix='u_')
+
+    results = [
+        ("sqlite3.Row + проверки keys()", rows_per_second(lambda rs: [legacy_blogger(r) for r in rs], dict_rows)),
+        ("Кортежи + маппер Blogger", rows_per_second(lambda rs: [to_blogger(r) for r in rs], rows)),
+        ("Кортежи + маппер LazyBlogger", rows_per_second(lambda rs: [to_lazy(r) for r in rs], rows)),
+        ("JOIN: LazyBlogger + LazyUser", rows_per_second(
+            lambda rs: [(to_joined_blogger(r), to_seller(r)) for r in rs], joined_rows)),
+    ]
+
+    print(f"Строк: {ROWS}, лучший из {REPEATS} прогонов")
+    for name, rate in results:
+        print(f"{name:<32} {rate:>12,.0f} строк/с")
+
+
+if __name__ == "__main__":
+    main()
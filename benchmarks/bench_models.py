@@ -0,0 +1,129 @@
+"""Бенчмарк моделей Blogger: память и CPU на выборке из 100k строк.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_models
+
+Сравнивает сборку списка блогеров из строк БД:
+- обычный dataclass (с __dict__, как было до __slots__) с полным декодированием;
+- Blogger со __slots__ и полным декодированием JSON/дат;
+- LazyBlogger, когда нужны только id и имя (как в get_search_results_keyboard);
+- LazyBlogger с обращением ко всем ленивым полям.
+"""
+import asyncio
+import dataclasses
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import database.database as database
+from database.mappers import BLOGGER_CONVERTERS, blogger_mapper, compile_mapper
+from database.models import Blogger
+
+ROWS = 100_000
+
+
+def make_dict_blogger_class():
+    """Копия Blogger без __slots__ - базовая линия для сравнения"""
+    spec = []
+    for f in dataclasses.fields(Blogger):
+        if f.default is not dataclasses.MISSING:
+            spec.append((f.name, f.type, dataclasses.field(default=f.default)))
+        elif f.default_factory is not dataclasses.MISSING:
+            spec.append((f.name, f.type, dataclasses.field(default_factory=f.default_factory)))
+        else:
+            spec.append((f.name, f.type))
+    return dataclasses.make_dataclass("DictBlogger", spec)
+
+
+def fill_database(db_path: str):
+    database.DATABASE_PATH = db_path
+    asyncio.run(database.init_db())
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (telegram_id, username) VALUES (1, 'seller')")
+    conn.executemany(
+        """INSERT INTO bloggers (seller_id, name, url, platforms, categories, price_stories,
+                                 subscribers_count, stats_images, created_at, updated_at)
+           VALUES (1, ?, ?, ?, ?, ?, ?, ?, '2024-05-01 12:00:00', '2024-05-02 12:00:00')""",
+        (
+            (
+                f"blogger_{i}",
+                f"https://instagram.com/blogger_{i}",
+                json.dumps(["instagram", "telegram"]),
+                json.dumps(["sport", "lifestyle"]),
+                1000 + i % 5000,
+                10_000 + i,
+                json.dumps([f"file_{i}_1", f"file_{i}_2"]),
+            )
+            for i in range(ROWS)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def fetch_rows(db_path: str):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute("SELECT * FROM bloggers")
+    rows = cursor.fetchall()
+    description = cursor.description
+    conn.close()
+    return rows, description
+
+
+def build_with(to_blogger, touch=None):
+    def build(rows):
+        bloggers = [to_blogger(row) for row in rows]
+        if touch:
+            for blogger in bloggers:
+                touch(blogger)
+        return bloggers
+    return build
+
+
+def touch_names(blogger):
+    blogger.id, blogger.name
+
+
+def touch_lazy_fields(blogger):
+    blogger.platforms, blogger.categories, blogger.stats_images, blogger.created_at, blogger.updated_at
+
+
+def measure(name: str, build, rows):
+    # Время и память меряются в разных прогонах: tracemalloc сильно замедляет аллокации
+    started = time.perf_counter()
+    result = build(rows)
+    elapsed = time.perf_counter() - started
+    del result
+
+    tracemalloc.start()
+    result = build(rows)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{name:<36} {elapsed * 1000:>9.0f} мс {current / 1024 / 1024:>9.1f} МБ")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        fill_database(db_path)
+        rows, description = fetch_rows(db_path)
+
+    names = [column[0] for column in description]
+    to_dict_blogger = compile_mapper(make_dict_blogger_class(), BLOGGER_CONVERTERS, names)
+    to_lazy = blogger_mapper(description, lazy=True)
+
+    print(f"Строк: {len(rows)}")
+    print(f"{'Вариант':<36} {'Время':>12} {'Память':>12}")
+    measure("dataclass с __dict__ (базовая)", build_with(to_dict_blogger), rows)
+    measure("Blogger со __slots__, полный", build_with(blogger_mapper(description)), rows)
+    measure("LazyBlogger, только id и имя", build_with(to_lazy, touch_names), rows)
+    measure("LazyBlogger, все поля", build_with(to_lazy, touch_lazy_fields), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Бенчмарк ранжирования результатов поиска на 100k кандидатов.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_ranking
+
+Сравнивает построчную оценку на чистом Python с полной сортировкой и
+векторную оценку NumPy из utils/ranking.py с частичной сортировкой
+(argpartition) по строкам кандидатов (candidate_row - те же кортежи, что
+search_bloggers_ranked читает из БД). Проверяет, что оба способа выбирают
+одних и тех же блогеров.
+"""
+import math
+import random
+import time
+
+import numpy as np
+
+from database.models import AGE_BUCKETS, Blogger, BlogCategory, Platform, User
+from utils.ranking import DEFAULT_WEIGHTS, FEATURES, candidate_row, feature_matrix, rank_candidates, top_k
+
+CANDIDATES = 100_000
+TOP = 10
+REPEATS = 3
+
+FILTERS = {
+    'categories': ['sport', 'lifestyle', 'beauty'],
+    'target_age_min': 18,
+    'target_age_max': 30,
+    'target_gender': 'female',
+}
+
+
+def make_candidates(count: int):
+    random.seed(42)
+    categories = list(BlogCategory)
+    sellers = [User(id=i, telegram_id=i, rating=random.uniform(1, 5), is_vip=random.random() < 0.1)
+               for i in range(1, 1001)]
+    candidates = []
+    for i in range(count):
+        young, adult = random.randint(0, 50), random.randint(0, 40)
+        female = random.randint(0, 100)
+        reach = random.randint(500, 50_000)
+        candidates.append((
+            Blogger(
+                id=i, seller_id=0, name=f"blogger_{i}", url=f"https://instagram.com/blogger_{i}",
+                platforms=[Platform.INSTAGRAM], categories=random.sample(categories, random.randint(1, 3)),
+                audience_13_17_percent=100 - young - adult, audience_18_24_percent=young,
+                audience_25_35_percent=adult, audience_35_plus_percent=0,
+                female_percent=female, male_percent=100 - female,
+                price_stories=random.choice([None, random.randint(1, 50) * 1000]),
+                stories_reach_min=reach, stories_reach_max=reach * 2,
+                price_reels=random.choice([None, random.randint(1, 50) * 1000]),
+                reels_reach_min=reach // 2, reels_reach_max=reach * 3,
+            ),
+            random.choice(sellers),
+        ))
+    return candidates
+
+
+def reach_per_ruble(reach_min, reach_max, price) -> float:
+    if not price or reach_min is None and reach_max is None:
+        return 0.0
+    return ((reach_min or reach_max) + (reach_max or reach_min)) / 2 / price
+
+
+def python_rank(candidates, limit: int):
+    """Построчная оценка и полная сортировка - базовая линия"""
+    wanted = set(FILTERS['categories'])
+    age_columns = [name for low, high, name in AGE_BUCKETS
+                   if FILTERS['target_age_min'] <= high and FILTERS['target_age_max'] >= low]
+    efficiency = [
+        math.log1p(max(reach_per_ruble(b.stories_reach_min, b.stories_reach_max, b.price_stories),
+                       reach_per_ruble(b.reels_reach_min, b.reels_reach_max, b.price_reels)))
+        for b, _ in candidates
+    ]
+    max_efficiency = max(efficiency) or 1
+    weights = [getattr(DEFAULT_WEIGHTS, name) for name in FEATURES]
+
+    scored = []
+    for index, (blogger, seller) in enumerate(candidates):
+        values = (
+            sum(getattr(blogger, name) or 0 for name in age_columns) / 100,
+            (blogger.female_percent or 0) / 100,
+            efficiency[index] / max_efficiency,
+            sum(category.value in wanted for category in blogger.categories) / len(wanted),
+            (seller.rating - 1) / 4,
+            float(seller.is_vip),
+        )
+        score = sum(min(max(value, 0.0), 1.0) * weight for value, weight in zip(values, weights))
+        scored.append((-score, index))
+    scored.sort()
+    return [candidates[index] for _, index in scored[:limit]]
+
+
+def best_time(function) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    candidates = make_candidates(CANDIDATES)
+    rows = [candidate_row(blogger, seller) for blogger, seller in candidates]
+
+    python_result = python_rank(candidates, TOP)
+    numpy_result = rank_candidates(rows, TOP, **FILTERS)
+    assert [b.id for b, _ in python_result] == [row[0] for row in numpy_result], "результаты ранжирования различаются"
+
+    features = feature_matrix(rows, **FILTERS)
+    weights = np.array([getattr(DEFAULT_WEIGHTS, name) for name in FEATURES])
+    scores = features @ weights
+
+    results = [
+        ("Python: оценка + sort", best_time(lambda: python_rank(candidates, TOP))),
+        ("NumPy: признаки + оценка + top-k", best_time(lambda: rank_candidates(rows, TOP, **FILTERS))),
+        ("NumPy: только оценка + top-k", best_time(lambda: top_k(features @ weights, TOP))),
+        ("NumPy: полная сортировка оценок", best_time(lambda: np.argsort(-scores)[:TOP])),
+    ]
+
+    print(f"Кандидатов: {CANDIDATES}, top-{TOP}, лучший из {REPEATS} прогонов")
+    for name, seconds in results:
+        print(f"{name:<34} {seconds * 1000:>9.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Бенчмарк холодного старта бота: от запуска процесса до on_startup.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup
+
+В отдельном процессе повторяет main() без сети: импорт main (aiogram,
+обработчики), configure_database, create_dispatcher, init_db на пустой базе
+и emit_startup - тот же момент, который on_startup пишет в лог как
+"Время запуска до первого polling". Проверяет, что gspread/google-auth/платежи
+не загружаются при старте.
+
+get_me и delete_webhook в main() идут параллельно с init_db и зависят от
+задержки до Telegram, поэтому здесь не измеряются. Импорт aiogram (сотни
+pydantic-моделей) выводится отдельно: он занимает основную часть старта
+(CPython 3.11 в контейнере Linux - около 2.7 с) и от кода бота не зависит.
+Цель TARGET_MS относится к остальной части старта - импорту обработчиков,
+сборке диспетчера и миграциям - на CPython 3.11 с прогретым кешем ФС и
+скомпилированными .pyc; окружение выводится вместе с результатом.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+TARGET_MS = 300
+RUNS = 5
+
+CHILD = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+import aiogram
+aiogram_loaded = time.perf_counter()
+import main
+from database.database import configure_database, init_db
+
+async def run():
+    configure_database(sys.argv[1])
+    dp = main.create_dispatcher()
+    reached = []
+
+    async def record_startup():
+        reached.append(time.perf_counter())
+
+    dp.startup.register(record_startup)
+    await init_db()
+    await dp.emit_startup()
+    return reached[0]
+
+startup_at = asyncio.run(run())
+print(json.dumps({
+    "aiogram_ms": (aiogram_loaded - started) * 1000,
+    "startup_ms": (startup_at - started) * 1000,
+    "heavy_modules": sorted(m for m in ("gspread", "google.auth", "utils.payments") if m in sys.modules),
+}))
+"""
+
+
+def run_once() -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, BOT_TOKEN="123456:bench", DATABASE_URL=os.path.join(tmp, "bench.db"))
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD, os.path.join(tmp, "bench.db")],
+            check=True, capture_output=True, text=True, env=env,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    results = [run_once() for _ in range(RUNS)]
+    aiogram_ms = sorted(r["aiogram_ms"] for r in results)[RUNS // 2]
+    startup_ms = sorted(r["startup_ms"] for r in results)[RUNS // 2]
+    own_ms = sorted(r["startup_ms"] - r["aiogram_ms"] for r in results)[RUNS // 2]
+
+    print(f"Окружение:                     Python {platform.python_version()}, {platform.platform()}")
+    print(f"До on_startup (медиана):       {startup_ms:.1f} мс без запросов к Telegram")
+    print(f"  импорт aiogram:              {aiogram_ms:.1f} мс")
+    print(f"  остальной старт:             {own_ms:.1f} мс (цель < {TARGET_MS} мс)")
+    print(f"Тяжелые модули при старте:     {results[-1]['heavy_modules'] or 'нет'}")
+
+    if own_ms > TARGET_MS or results[-1]["heavy_modules"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Число соединений и SQL-запросов на одну операцию записи в database.py.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_write_statements
+
+Выполняет create_user, повторный create_user (двойной /start),
+update_user_roles и create_blogger на временной БД и считает открытые
+соединения и вызовы execute/executemany (executemany - один вызов на все
+строки, триггеры и COMMIT не считаются). Проверяет, что каждая операция
+укладывается в одно соединение и заданное число запросов, а одновременные
+create_user с одним telegram_id не падают на UNIQUE.
+"""
+import asyncio
+import functools
+import os
+import sqlite3
+import tempfile
+
+import aiosqlite
+
+import database.database as db_module
+from database.models import BlogCategory, Platform, UserRole
+
+# Операция -> (соединений, запросов)
+BUDGETS = {
+    "create_user": (1, 2),
+    "create_user (повторно)": (1, 2),
+    "update_user_roles": (1, 3),
+    "create_blogger": (1, 1),
+}
+
+connections = 0
+statements = []
+
+
+class CountingConnection(sqlite3.Connection):
+    """Соединение sqlite3, которое запоминает запросы, переданные aiosqlite"""
+
+    def __init__(self, *args, **kwargs):
+        global connections
+        super().__init__(*args, **kwargs)
+        connections += 1
+
+    def execute(self, sql, *args):
+        statements.append(sql)
+        return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        statements.append(sql)
+        return super().executemany(sql, *args)
+
+
+async def measure(name: str, operation):
+    global connections
+    connections = 0
+    statements.clear()
+    await operation()
+    executed = [" ".join(sql.split()) for sql in statements]
+    max_connections, max_statements = BUDGETS[name]
+    print(f"{name:<24} соединений {connections}, запросов {len(executed)}")
+    assert connections <= max_connections and len(executed) <= max_statements, \
+        f"{name}: больше {max_connections} соединений или {max_statements} запросов:\n" + "\n".join(executed)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        db_module.configure_database(os.path.join(directory, "bench.db"))
+        await db_module.init_db()
+        aiosqlite.connect = functools.partial(aiosqlite.connect, factory=CountingConnection)
+
+        await measure("create_user", lambda: db_module.create_user(1001, "seller", roles=[UserRole.SELLER]))
+        await measure("create_user (повторно)",
+                      lambda: db_module.create_user(1001, "seller", roles=[UserRole.BUYER]))
+        await measure("update_user_roles",
+                      lambda: db_module.update_user_roles(1001, [UserRole.SELLER, UserRole.BUYER]))
+
+        user = await db_module.get_user(1001)
+        await measure("create_blogger", lambda: db_module.create_blogger(
+            user.id, "Анна", "https://instagram.com/anna", [Platform.INSTAGRAM], [BlogCategory.BEAUTY],
+            price_stories=10_000, stories_reach_min=5_000, stories_reach_max=8_000,
+        ))
+
+        # Двойной /start: оба вызова возвращают одного пользователя
+        first, second = await asyncio.gather(
+            db_module.create_user(2002, "buyer", roles=[UserRole.BUYER]),
+            db_module.create_user(2002, "buyer", roles=[UserRole.BUYER]),
+        )
+        assert first.id == second.id, "одновременные create_user создали двух пользователей"
+        print("Одновременные create_user с одним telegram_id: один пользователь, без ошибок")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,91 @@
+from functools import lru_cache, update_wrapper, wraps
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from pydantic import ConfigDict
 from database.models import UserRole
 
+# Реестр клавиатур. Разметка без параметров строится один раз при импорте
+# (@static_keyboard), клавиатуры с параметрами запоминаются по значениям
+# параметров (@cached_keyboard): флаг, маска выбранных платформ, id блогера.
+# Обработчики получают общие объекты, поэтому в реестре хранятся неизменяемые
+# копии (freeze_keyboard): присваивание полей и изменение рядов кнопок
+# падают с ошибкой.
+BLOGGER_KEYBOARD_CACHE_SIZE = 1024
+
+
+class FrozenList(list):
+    """Список только для чтения. Подкласс list, а не tuple: сессия aiogram
+    убирает пустые поля кнопок только внутри списков."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("клавиатура из реестра не изменяется, соберите новую")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+
+class FrozenInlineKeyboardButton(InlineKeyboardButton):
+    model_config = ConfigDict(frozen=True)
+
+
+class FrozenKeyboardButton(KeyboardButton):
+    model_config = ConfigDict(frozen=True)
+
+
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+
+class FrozenReplyKeyboardMarkup(ReplyKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+
+# Тип разметки -> (неизменяемый тип, поле с рядами, неизменяемый тип кнопки)
+FROZEN_MARKUPS = {
+    InlineKeyboardMarkup: (FrozenInlineKeyboardMarkup, 'inline_keyboard', FrozenInlineKeyboardButton),
+    ReplyKeyboardMarkup: (FrozenReplyKeyboardMarkup, 'keyboard', FrozenKeyboardButton),
+}
+
 
+def freeze_keyboard(markup):
+    """Неизменяемая копия клавиатуры (подклассы типов aiogram, отправляются как обычные)"""
+    frozen_markup, rows_field, frozen_button = FROZEN_MARKUPS[type(markup)]
+    rows = FrozenList(
+        FrozenList(frozen_button.model_construct(button.model_fields_set, **dict(button)) for button in row)
+        for row in getattr(markup, rows_field)
+    )
+    fields = {**dict(markup), rows_field: rows}
+    return frozen_markup.model_construct(markup.model_fields_set, **fields)
+
+
+def static_keyboard(builder):
+    """Строит клавиатуру при импорте и возвращает один и тот же неизменяемый объект"""
+    markup = freeze_keyboard(builder())
+
+    @wraps(builder)
+    def get_keyboard():
+        return markup
+
+    return get_keyboard
+
+
+def cached_keyboard(maxsize=None):
+    """lru_cache для клавиатур с параметрами: запоминается неизменяемая копия.
+    
+    __wrapped__, как у lru_cache, - исходная функция сборки.
+    """
+    def decorator(builder):
+        @lru_cache(maxsize=maxsize)
+        def get_keyboard(*args, **kwargs):
+            return freeze_keyboard(builder(*args, **kwargs))
+
+        return update_wrapper(get_keyboard, builder)
+
+    return decorator
+
+
+
+@static_keyboard
 def get_role_selection_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора роли"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -10,6 +94,7 @@ def get_role_selection_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard(maxsize=None)
 def get_main_menu_seller(has_active_subscription: bool) -> ReplyKeyboardMarkup:
     """Главное меню для продажника"""
     keyboard_buttons = [
@@ -30,6 +115,7 @@ def get_main_menu_seller(has_active_subscription: bool) -> ReplyKeyboardMarkup:
     )
 
 
+@cached_keyboard(maxsize=None)
 def get_main_menu_buyer(has_active_subscription: bool) -> ReplyKeyboardMarkup:
     """Главное меню для закупщика"""
     keyboard_buttons = [
@@ -50,6 +136,7 @@ def get_main_menu_buyer(has_active_subscription: bool) -> ReplyKeyboardMarkup:
     )
 
 
+@static_keyboard
 def get_settings_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура настроек"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -59,6 +146,7 @@ def get_settings_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard(maxsize=None)
 def get_platform_keyboard(with_navigation: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура множественного выбора платформ"""
     keyboard = [
@@ -76,6 +164,7 @@ def get_platform_keyboard(with_navigation: bool = False) -> InlineKeyboardMarkup
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@cached_keyboard(maxsize=None)
 def get_category_keyboard(with_navigation: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура выбора категорий"""
     keyboard = [
@@ -107,6 +196,7 @@ def get_category_keyboard(with_navigation: bool = False) -> InlineKeyboardMarkup
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@static_keyboard
 def get_yes_no_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура да/нет"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -123,22 +213,30 @@ def get_blogger_list_keyboard(bloggers, action="view") -> InlineKeyboardMarkup:
         callback_data = f"blogger_{blogger.id}_{action}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=callback_data)])
     
+    if action == "view":
+        buttons.append([InlineKeyboardButton(text="📥 Скачать CSV", callback_data="export_my_bloggers")])
+    
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
 def get_blogger_details_keyboard(blogger, action="view") -> InlineKeyboardMarkup:
     """Клавиатура деталей блогера"""
+    return _blogger_details_keyboard(blogger.id, action)
+
+
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
+def _blogger_details_keyboard(blogger_id: int, action: str) -> InlineKeyboardMarkup:
     buttons = []
     
     if action == "edit":
         buttons.extend([
-            [InlineKeyboardButton(text="✏️ Редактировать", callback_data=f"edit_blogger_{blogger.id}")],
-            [InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"delete_blogger_{blogger.id}")]
+            [InlineKeyboardButton(text="✏️ Редактировать", callback_data=f"edit_blogger_{blogger_id}")],
+            [InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"delete_blogger_{blogger_id}")]
         ])
     else:
         buttons.extend([
-            [InlineKeyboardButton(text="📞 Получить контакты", callback_data=f"contact_{blogger.id}")],
-            [InlineKeyboardButton(text="⚠️ Пожаловаться", callback_data=f"complain_{blogger.id}")]
+            [InlineKeyboardButton(text="📞 Получить контакты", callback_data=f"contact_{blogger_id}")],
+            [InlineKeyboardButton(text="⚠️ Пожаловаться", callback_data=f"complain_{blogger_id}")]
         ])
     
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_bloggers")])
@@ -146,26 +244,76 @@ def get_blogger_details_keyboard(blogger, action="view") -> InlineKeyboardMarkup
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_search_results_keyboard(results) -> InlineKeyboardMarkup:
-    """Клавиатура результатов поиска"""
+def get_search_results_keyboard(results, sorted_by_cpm: bool = False,
+                                show_actions: bool = True) -> InlineKeyboardMarkup:
+    """Клавиатура результатов поиска (show_actions - сортировка, сохранение и выгрузка)"""
     buttons = []
     for blogger, seller in results:
-        button_text = f"📝 {blogger.name} ({seller.rating:.1f}⭐)"
+        if sorted_by_cpm and blogger.cpm is not None:
+            button_text = f"📝 {blogger.name} (CPM {blogger.cpm:,.0f}₽)"
+        else:
+            button_text = f"📝 {blogger.name} ({seller.rating:.1f}⭐)"
         callback_data = f"blogger_{blogger.id}"
         buttons.append([InlineKeyboardButton(text=button_text, callback_data=callback_data)])
     
+    if not show_actions:
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+    
+    if not sorted_by_cpm:
+        buttons.append([InlineKeyboardButton(text="💸 Сначала низкий CPM", callback_data="sort_results_cpm")])
+    buttons.append([InlineKeyboardButton(text="💾 Сохранить поиск", callback_data="save_search")])
+    buttons.append([InlineKeyboardButton(text="📥 Скачать все результаты (CSV)", callback_data="export_search")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_saved_searches_keyboard(searches) -> InlineKeyboardMarkup:
+    """Клавиатура сохраненных поисков (удаление)"""
+    buttons = [
+        [InlineKeyboardButton(text=f"🗑️ Удалить поиск #{index}", callback_data=f"unsave_search_{search.id}")]
+        for index, search in enumerate(searches, start=1)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_search_history_keyboard(entries, next_cursor: str = None, is_first_page: bool = True) -> InlineKeyboardMarkup:
+    """Клавиатура истории поиска: повтор поиска и листание"""
+    buttons = [
+        [InlineKeyboardButton(text=f"🔁 Повторить поиск #{index}", callback_data=f"repeat_search_{entry.id}")]
+        for index, entry in enumerate(entries, start=1)
+    ]
+
+    navigation = []
+    if not is_first_page:
+        navigation.append(InlineKeyboardButton(text="⏮️ К последним", callback_data="history_page"))
+    if next_cursor:
+        navigation.append(InlineKeyboardButton(text="➡️ Ранее", callback_data=f"history_page_{next_cursor}"))
+    if navigation:
+        buttons.append(navigation)
+
+    buttons.append([InlineKeyboardButton(text="💾 Сохраненные поиски", callback_data="show_saved_searches")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_blogger_selection_keyboard(blogger) -> InlineKeyboardMarkup:
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
+def get_blogger_selection_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     """Клавиатура выбора блогера"""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📞 Получить контакты", callback_data=f"contact_{blogger.id}")],
-        [InlineKeyboardButton(text="⚠️ Пожаловаться", callback_data=f"complain_{blogger.id}")],
+        [InlineKeyboardButton(text="📞 Получить контакты", callback_data=f"contact_{blogger_id}")],
+        [InlineKeyboardButton(text="⚠️ Пожаловаться", callback_data=f"complain_{blogger_id}")],
         [InlineKeyboardButton(text="🔙 Назад к результатам", callback_data="back_to_results")]
     ])
 
 
+def get_contact_rating_keyboard(contact_id: int) -> InlineKeyboardMarkup:
+    """Оценка общения с продавцом по контакту (1-5)"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=f"{score}⭐", callback_data=f"rate_contact_{contact_id}_{score}")
+        for score in range(1, 6)
+    ]])
+
+
+@static_keyboard
 def get_price_stories_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора цены за истории"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -177,6 +325,7 @@ def get_price_stories_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@static_keyboard
 def get_price_post_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора цены за пост"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -188,6 +337,7 @@ def get_price_post_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@static_keyboard
 def get_price_video_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора цены за видео"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -199,22 +349,34 @@ def get_price_video_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+MULTI_KEYBOARD_PLATFORMS = [
+    ("📱 Instagram", "instagram"),
+    ("📺 YouTube", "youtube"),
+    ("📱 TikTok", "tiktok"),
+    ("📱 Telegram", "telegram"),
+    ("📱 VK", "vk")
+]
+
+
 def get_platforms_multi_keyboard(selected_platforms=None) -> InlineKeyboardMarkup:
     """Клавиатура множественного выбора платформ"""
-    if selected_platforms is None:
-        selected_platforms = []
+    selected_platforms = selected_platforms or []
+    
+    # Выбор сводится к битовой маске: всего 2^5 вариантов клавиатуры
+    mask = 0
+    for bit, (_, platform) in enumerate(MULTI_KEYBOARD_PLATFORMS):
+        if platform in selected_platforms:
+            mask |= 1 << bit
     
+    return _platforms_multi_keyboard(mask)
+
+
+@cached_keyboard(maxsize=None)
+def _platforms_multi_keyboard(mask: int) -> InlineKeyboardMarkup:
     buttons = []
-    platforms = [
-        ("📱 Instagram", "instagram"),
-        ("📺 YouTube", "youtube"),
-        ("📱 TikTok", "tiktok"),
-        ("📱 Telegram", "telegram"),
-        ("📱 VK", "vk")
-    ]
     
-    for name, platform in platforms:
-        if platform in selected_platforms:
+    for bit, (name, platform) in enumerate(MULTI_KEYBOARD_PLATFORMS):
+        if mask & (1 << bit):
             button_text = f"✅ {name}"
         else:
             button_text = f"❌ {name}"
@@ -222,9 +384,10 @@ def get_platforms_multi_keyboard(selected_platforms=None) -> InlineKeyboardMarku
     
     buttons.append([InlineKeyboardButton(text="✅ Завершить выбор", callback_data="finish_platforms_selection")])
     
-    return InlineKeyboardMarkup(inline_keyboard=buttons) 
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@static_keyboard
 def get_subscription_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для подписки"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -255,6 +418,7 @@ def get_payment_confirmation_keyboard(payment_data) -> InlineKeyboardMarkup:
         ])
 
 
+@cached_keyboard(maxsize=None)
 def get_subscription_management_keyboard(auto_renewal_enabled: bool = True) -> InlineKeyboardMarkup:
     """Клавиатура управления подпиской"""
     buttons = []
@@ -274,6 +438,7 @@ def get_subscription_management_keyboard(auto_renewal_enabled: bool = True) -> I
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@static_keyboard
 def get_subscription_cancel_confirmation_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения отмены подписки"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -282,6 +447,7 @@ def get_subscription_cancel_confirmation_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@static_keyboard
 def get_platform_selection_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора платформ для поиска"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -294,6 +460,7 @@ def get_platform_selection_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@static_keyboard
 def get_role_management_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура управления ролями"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -305,10 +472,15 @@ def get_role_management_keyboard() -> InlineKeyboardMarkup:
 
 def get_combined_main_menu(user, has_active_subscription: bool) -> ReplyKeyboardMarkup:
     """Комбинированное главное меню для пользователей с несколькими ролями"""
+    return _combined_main_menu(user.has_role(UserRole.SELLER), user.has_role(UserRole.BUYER))
+
+
+@cached_keyboard(maxsize=None)
+def _combined_main_menu(is_seller: bool, is_buyer: bool) -> ReplyKeyboardMarkup:
     keyboard_buttons = []
     
     # Функции продажника
-    if user.has_role(UserRole.SELLER):
+    if is_seller:
         keyboard_buttons.extend([
             [KeyboardButton(text="📝 Добавить блогера")],
             [KeyboardButton(text="📋 Мои блогеры")],
@@ -316,7 +488,7 @@ def get_combined_main_menu(user, has_active_subscription: bool) -> ReplyKeyboard
         ])
     
     # Функции закупщика
-    if user.has_role(UserRole.BUYER):
+    if is_buyer:
         keyboard_buttons.extend([
             [KeyboardButton(text="🔍 Поиск блогеров")],
             [KeyboardButton(text="📋 История поиска")],
@@ -336,6 +508,7 @@ def get_combined_main_menu(user, has_active_subscription: bool) -> ReplyKeyboard
     )
 
 
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
 def get_blogger_success_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     """Клавиатура после успешного добавления блогера"""
     buttons = [
@@ -355,6 +528,7 @@ def get_blogger_success_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons) 
 
 
+@static_keyboard
 def get_blogger_addition_navigation() -> InlineKeyboardMarkup:
     """Навигационные кнопки для добавления блогера"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -365,6 +539,7 @@ def get_blogger_addition_navigation() -> InlineKeyboardMarkup:
     ])
 
 
+@static_keyboard
 def get_blogger_addition_navigation_with_back() -> InlineKeyboardMarkup:
     """Навигационные кнопки с возможностью возврата"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -377,6 +552,7 @@ def get_blogger_addition_navigation_with_back() -> InlineKeyboardMarkup:
     ])
 
 
+@static_keyboard
 def get_blogger_addition_navigation_first_step() -> InlineKeyboardMarkup:
     """Навигационные кнопки для первого шага (только отмена)"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -386,6 +562,7 @@ def get_blogger_addition_navigation_first_step() -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
 def get_blogger_edit_field_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     """Клавиатура для редактирования полей блогера"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -418,6 +595,7 @@ def get_blogger_edit_field_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
 def get_blogger_success_keyboard_enhanced(blogger_id: int) -> InlineKeyboardMarkup:
     """Расширенная клавиатура после успешного добавления блогера"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -434,6 +612,7 @@ def get_blogger_success_keyboard_enhanced(blogger_id: int) -> InlineKeyboardMark
     ])
 
 
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
 def get_edit_blogger_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     """Клавиатура для редактирования блогера"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -452,6 +631,7 @@ def get_edit_blogger_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
 def get_blogger_management_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     """Клавиатура управления блогером в списке"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -467,6 +647,7 @@ def get_blogger_management_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
 def get_blogger_management_keyboard_with_stats(blogger_id: int, has_stats_photos: bool) -> InlineKeyboardMarkup:
     """Клавиатура управления блогером в списке с учетом наличия фото статистики"""
     keyboard = [
@@ -491,6 +672,7 @@ def get_blogger_management_keyboard_with_stats(blogger_id: int, has_stats_photos
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@static_keyboard
 def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения действия"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -501,6 +683,7 @@ def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard(maxsize=BLOGGER_KEYBOARD_CACHE_SIZE)
 def get_delete_confirmation_keyboard(blogger_id: int) -> InlineKeyboardMarkup:
     """Клавиатура подтверждения удаления блогера"""
     return InlineKeyboardMarkup(inline_keyboard=[
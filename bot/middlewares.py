@@ -0,0 +1,391 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+
+def unwrap_update(event: TelegramObject) -> Optional[TelegramObject]:
+    """Сообщение или нажатие из Update; другие события возвращаются как есть.
+
+    Схлопывание, ограничение частоты и очередь чата регистрируются на уровне
+    Update (до FSMContextMiddleware), но решают по вложенному событию.
+    """
+    if isinstance(event, Update):
+        return event.message or event.callback_query
+    return event
+
+
+class AlbumWindow:
+    """Сбор альбома первой частью, к которому остальные части идут без очереди чата.
+
+    ChatSerializerMiddleware создает окно для первой части альбома и передает
+    его в data["album_window"]; AlbumMiddleware открывает окно, когда начинает
+    собирать альбом, и закрывает по окончании сбора - до вызова обработчика.
+    """
+
+    def __init__(self, albums: Dict[Tuple[int, str], "AlbumWindow"], key: Tuple[int, str]):
+        self._albums = albums
+        self._key = key
+        self.closed = False
+        # Установлено, когда окно открыто или уже закрыто
+        self.settled = asyncio.Event()
+
+    def open(self):
+        self.settled.set()
+
+    def close(self):
+        self.closed = True
+        self.settled.set()
+        if self._albums.get(self._key) is self:
+            del self._albums[self._key]
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """Сборка альбома (сообщений с общим media_group_id) в один вызов обработчика.
+
+    Telegram присылает альбом отдельными сообщениями почти одновременно.
+    Первое сообщение альбома ждет, пока новые части перестанут приходить
+    latency секунд, и вызывает обработчик со всеми сообщениями в data["album"];
+    остальные части только добавляются в буфер и обработчик не вызывают.
+    Сообщения без media_group_id проходят без задержки.
+
+    Регистрируется как inner-middleware роутера: в буфер попадают только
+    сообщения, прошедшие фильтры обработчика. Окно data["album_window"]
+    (см. AlbumWindow) открыто ровно на время сбора.
+    """
+
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+        self._albums: Dict[Tuple[int, str], List[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Message) or not event.media_group_id:
+            return await handler(event, data)
+
+        key = (event.chat.id, event.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(event)
+            return None
+
+        self._albums[key] = album = [event]
+        window: Optional[AlbumWindow] = data.get("album_window")
+        if window is not None:
+            window.open()
+        try:
+            # Ждем, пока альбом не перестанет пополняться
+            while True:
+                received = len(album)
+                await asyncio.sleep(self.latency)
+                if len(album) == received:
+                    break
+        finally:
+            del self._albums[key]
+            if window is not None:
+                window.close()
+
+        album.sort(key=lambda message: message.message_id)
+        logger.debug(f"Альбом {event.media_group_id}: {len(album)} сообщений")
+        data["album"] = album
+        return await handler(event, data)
+
+
+class CallbackCoalescingMiddleware(BaseMiddleware):
+    """Схлопывание повторных нажатий одной кнопки.
+
+    Пока обработчик callback (пользователь, callback_data) выполняется,
+    такие же callback от того же пользователя сразу получают ответ и не
+    обрабатываются: двойное нажатие не запускает второй поиск, удаление или
+    оплату. Повторное нажатие после завершения обработчика выполняется как
+    обычно.
+
+    Регистрируется как outer-middleware для update диспетчера первым из
+    своих: повтор, ждущий в очереди чата, тоже схлопывается.
+    """
+
+    def __init__(self, notice: str = "⏳ Уже выполняется..."):
+        self.notice = notice
+        self._in_flight: Set[Tuple[int, str]] = set()
+        # Сколько нажатий схлопнуто - всего и по действию (callback_data без id)
+        self.coalesced = 0
+        self.coalesced_by_action: Counter = Counter()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = unwrap_update(event)
+        if not isinstance(callback, CallbackQuery) or not callback.data:
+            return await handler(event, data)
+
+        key = (callback.from_user.id, callback.data)
+        if key in self._in_flight:
+            self.coalesced += 1
+            self.coalesced_by_action[callback.data.rstrip("0123456789_")] += 1
+            logger.debug(f"Повторное нажатие {callback.data} от {callback.from_user.id} пропущено")
+            try:
+                await callback.answer(self.notice)
+            except Exception as e:
+                logger.warning(f"Не удалось ответить на повторное нажатие: {e}")
+            return None
+
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'in_flight': len(self._in_flight), 'coalesced': self.coalesced,
+                'by_action': dict(self.coalesced_by_action.most_common(10))}
+
+
+# Дорогие действия: поиск, выгрузки и списки блогеров
+EXPENSIVE_TEXTS = {
+    "📋 Мои блогеры", "👥 Мои блогеры", "✏️ Редактировать блогера",
+    "📋 История поиска", "📊 Статистика",
+}
+EXPENSIVE_COMMANDS = ("/find",)
+EXPENSIVE_CALLBACK_PREFIXES = (
+    "yes_no_", "sort_results_cpm", "repeat_search_", "history_page",
+    "export_search", "export_my_bloggers", "show_my_bloggers",
+)
+
+
+def is_expensive(event: TelegramObject) -> bool:
+    """Действие нагружает БД (поиск, выгрузка, список блогеров)"""
+    if isinstance(event, CallbackQuery):
+        return bool(event.data) and event.data.startswith(EXPENSIVE_CALLBACK_PREFIXES)
+    if isinstance(event, Message) and event.text:
+        return event.text in EXPENSIVE_TEXTS or event.text.split(maxsplit=1)[0] in EXPENSIVE_COMMANDS
+    return False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничение частоты запросов пользователя (token bucket).
+
+    У каждого пользователя два бюджета: любое сообщение или нажатие тратит
+    токен из общего, дорогие действия (is_expensive) - еще и из отдельного,
+    который пополняется медленнее. Токены восполняются со временем до
+    размера burst. Без токенов обновление не обрабатывается, а пользователь
+    получает предупреждение: нажатие - ответом на callback, сообщение - одним
+    сообщением на серию отброшенных.
+
+    Альбом списывает токен один раз: части после первой (media_group_id уже
+    встречался) без списания пропускаются или отбрасываются вместе с первой.
+
+    На пользователя хранится одна запись из четырех чисел; записи тех, кто
+    молчит дольше idle_ttl секунд, удаляются. Регистрируется как
+    outer-middleware для update диспетчера - после схлопывания нажатий,
+    чтобы отброшенные повторы не тратили токены, и до очереди чата, чтобы
+    отброшенные обновления в нее не попадали.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: float = 10.0,
+                 expensive_rate: float = 0.2, expensive_burst: float = 3.0,
+                 idle_ttl: float = 600.0, album_ttl: float = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.expensive_rate = expensive_rate
+        self.expensive_burst = expensive_burst
+        self.idle_ttl = idle_ttl
+        self.album_ttl = album_ttl
+        # telegram_id -> [токены, дорогие токены, время обновления, предупрежден ли]
+        self._buckets: "OrderedDict[int, list]" = OrderedDict()
+        # Альбомы по первой части: (chat_id, media_group_id) -> (время, пропущена ли)
+        self._albums: "OrderedDict[Tuple[int, str], Tuple[float, bool]]" = OrderedDict()
+        self.throttled = 0
+
+    def _evict_idle(self, now: float):
+        while self._buckets:
+            user_id, bucket = next(iter(self._buckets.items()))
+            if now - bucket[2] < self.idle_ttl:
+                break
+            del self._buckets[user_id]
+
+    def _album_key(self, event: TelegramObject) -> Optional[Tuple[int, str]]:
+        """Ключ альбома для части альбома, иначе None; заодно удаляет старые альбомы"""
+        if not isinstance(event, Message) or not event.media_group_id:
+            return None
+        now = time.monotonic()
+        while self._albums and now - next(iter(self._albums.values()))[0] >= self.album_ttl:
+            self._albums.popitem(last=False)
+        return event.chat.id, event.media_group_id
+
+    def check(self, user_id: int, expensive: bool) -> Tuple[bool, float]:
+        """Списать токены. Возвращает (разрешено, через сколько секунд повторить)"""
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        bucket = self._buckets.pop(user_id, None)
+        if bucket is None:
+            bucket = [self.burst, self.expensive_burst, now, False]
+        else:
+            elapsed = now - bucket[2]
+            bucket[0] = min(self.burst, bucket[0] + elapsed * self.rate)
+            bucket[1] = min(self.expensive_burst, bucket[1] + elapsed * self.expensive_rate)
+        bucket[2] = now
+        # Записи упорядочены по времени последнего обращения
+        self._buckets[user_id] = bucket
+
+        if bucket[0] < 1:
+            return False, (1 - bucket[0]) / self.rate
+        if expensive and bucket[1] < 1:
+            return False, (1 - bucket[1]) / self.expensive_rate
+
+        bucket[0] -= 1
+        if expensive:
+            bucket[1] -= 1
+        bucket[3] = False
+        return True, 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        target = unwrap_update(event)
+        user = getattr(target, "from_user", None)
+        if user is None:
+            return await handler(event, data)
+
+        album_key = self._album_key(target)
+        album = self._albums.get(album_key) if album_key else None
+        if album is not None:
+            # Остальные части альбома разделяют решение по первой
+            return await handler(event, data) if album[1] else None
+
+        allowed, retry_after = self.check(user.id, is_expensive(target))
+        if album_key is not None:
+            self._albums[album_key] = (time.monotonic(), allowed)
+        if allowed:
+            return await handler(event, data)
+
+        self.throttled += 1
+        notice = f"⏳ Слишком много запросов. Повторите через {max(1, round(retry_after))} с."
+        try:
+            if isinstance(target, CallbackQuery):
+                await target.answer(notice)
+            elif isinstance(target, Message) and not self._buckets[user.id][3]:
+                self._buckets[user.id][3] = True
+                await target.answer(notice)
+        except Exception as e:
+            logger.warning(f"Не удалось предупредить пользователя {user.id} об ограничении: {e}")
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {'active_users': len(self._buckets), 'throttled': self.throttled}
+
+
+class ChatSerializerMiddleware(BaseMiddleware):
+    """Последовательная обработка обновлений одного чата и общий лимит параллельности.
+
+    Обновления одного чата выполняются строго по очереди (asyncio.Lock
+    отдает блокировку в порядке ожидания). Middleware регистрируется на
+    уровне update до FSMContextMiddleware, поэтому второе из двух быстрых
+    сообщений читает состояние FSM уже после обработки первого и попадает
+    в обработчик нового состояния. Разные чаты выполняются
+    параллельно, но одновременно работает не больше max_concurrency
+    обработчиков; остальные ждут, не обращаясь к БД. Очередь чата удаляется,
+    когда в ней не остается обновлений.
+
+    Лимит ограничивает работающие обработчики, а не задачи: aiogram создает
+    задачу на каждое обновление раньше любых middleware, и при всплеске эти
+    задачи ждут здесь (их число видно в waiting и max_waiting).
+
+    Части альбома после первой проходят без очереди, только пока первая
+    собирает альбом в AlbumMiddleware, удерживая очередь чата (AlbumWindow);
+    от проверки окна до буфера альбома управление циклу событий не отдается
+    (FSM в MemoryStorage). Части, пришедшие после
+    сбора или когда первая часть попала в обработчик без сборки альбома,
+    идут через очередь и лимит как обычные сообщения.
+    """
+
+    def __init__(self, max_concurrency: int = 64):
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # chat_id -> [блокировка, число обновлений в очереди и в работе]
+        self._chats: Dict[int, list] = {}
+        # Альбомы, первая часть которых в очереди или собирает альбом
+        self._albums: Dict[Tuple[int, str], AlbumWindow] = {}
+        self.waiting = 0
+        self.running = 0
+        self.max_waiting = 0
+        self.max_chat_depth = 0
+
+    @staticmethod
+    def _chat_id(event: Optional[TelegramObject]) -> Optional[int]:
+        if isinstance(event, Message):
+            return event.chat.id
+        if isinstance(event, CallbackQuery):
+            return event.message.chat.id if event.message else event.from_user.id
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        target = unwrap_update(event)
+        chat_id = self._chat_id(target)
+        if chat_id is None:
+            return await handler(event, data)
+
+        window = None
+        if isinstance(target, Message) and target.media_group_id:
+            album_key = (chat_id, target.media_group_id)
+            while album_key in self._albums:
+                # Дождаться, пока первая часть альбома начнет сбор или закончит
+                current = self._albums[album_key]
+                await current.settled.wait()
+                if not current.closed:
+                    return await handler(event, data)
+            window = self._albums[album_key] = AlbumWindow(self._albums, album_key)
+            data["album_window"] = window
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = [asyncio.Lock(), 0]
+        chat[1] += 1
+        self.max_chat_depth = max(self.max_chat_depth, chat[1])
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = False
+        try:
+            async with chat[0], self._semaphore:
+                self.waiting -= 1
+                self.running += 1
+                started = True
+                return await handler(event, data)
+        finally:
+            if started:
+                self.running -= 1
+            else:
+                self.waiting -= 1
+            chat[1] -= 1
+            if chat[1] == 0:
+                del self._chats[chat_id]
+            if window is not None:
+                window.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {'chats': len(self._chats), 'waiting': self.waiting, 'running': self.running,
+                'max_waiting': self.max_waiting, 'max_chat_depth': self.max_chat_depth}
@@ -45,6 +45,9 @@ class SellerStates(StatesGroup):
     editing_blogger = State()
     waiting_for_edit_field = State()
     waiting_for_new_value = State()
+    
+    # Пакетный импорт блогеров из файла
+    waiting_for_import_file = State()
 
 
 class BuyerStates(StatesGroup):
@@ -57,6 +60,7 @@ class BuyerStates(StatesGroup):
     waiting_for_categories = State()  # Категории
     waiting_for_budget = State()  # Бюджет минимальный (кратный 1000)
     waiting_for_budget_max = State()  # Бюджет максимальный (кратный 1000)
+    waiting_for_cpm_max = State()  # Максимальный CPM (0 - не важно)
     waiting_for_additional_criteria = State()  # Дополнительные критерии
     
     # Просмотр результатов
@@ -2,19 +2,125 @@ import aiosqlite
 import os
 import json
 import logging
-from typing import List, Optional, Tuple
+import re
+import sqlite3
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional, Sequence, Set, Tuple
 from datetime import datetime
 
-from .models import User, Blogger, Review, Subscription, Contact, SearchFilter
-from .models import UserRole, SubscriptionStatus, Platform, BlogCategory
+from .models import User, Blogger, Review, Subscription, Contact, SearchFilter, SearchHistoryEntry, UserStats
+from .models import UserRole, SubscriptionStatus, Platform, BlogCategory, OFFER_PRICE_COLUMNS, AGE_BUCKETS
+from utils.url_normalizer import canonical_url
+from .mappers import (
+    user_mapper, blogger_mapper, search_filter_mapper, search_history_mapper, user_stats_mapper,
+    select_columns, ROLES_SUBQUERY
+)
 
-DATABASE_PATH = "bot_database.db"
 logger = logging.getLogger(__name__)
 
+# === РАСПОЛОЖЕНИЕ БД ===
+
+DEFAULT_DATABASE_PATH = "bot_database.db"
+MEMORY_DSN_PREFIX = "memory://"
+
+# Соединение, которое держит общую БД в памяти, пока процесс с ней работает
+_memory_anchor: Optional[sqlite3.Connection] = None
+_memory_anchor_target: Optional[str] = None
+
+
+def database_target(dsn: str) -> str:
+    """Путь или URI для sqlite по DSN.
+    
+    Поддерживаются:
+    - путь к файлу или sqlite:///путь (sqlite:////абсолютный/путь);
+    - memory://имя (и sqlite:///:memory:) - общая (shared-cache) БД в памяти
+      процесса: все соединения с одним именем видят одни данные.
+    """
+    if dsn.startswith("sqlite:///"):
+        dsn = dsn[len("sqlite:///"):]
+    if dsn == ":memory:":
+        dsn = MEMORY_DSN_PREFIX
+    if dsn.startswith(MEMORY_DSN_PREFIX):
+        name = dsn[len(MEMORY_DSN_PREFIX):] or "default"
+        return f"file:{name}?mode=memory&cache=shared"
+    return dsn
+
+
+def configure_database(dsn: str = None) -> str:
+    """Выбор БД для процесса: dsn, переменная DATABASE_URL или bot_database.db"""
+    global DATABASE_PATH
+    DATABASE_PATH = database_target(dsn or os.getenv("DATABASE_URL") or DEFAULT_DATABASE_PATH)
+    _ensure_memory_anchor()
+    logger.info(f"База данных: {DATABASE_PATH}")
+    return DATABASE_PATH
+
+
+def _ensure_memory_anchor():
+    """Общую БД в памяти держит открытым соединение-якорь: без него она
+    исчезала бы после закрытия последнего рабочего соединения"""
+    global _memory_anchor, _memory_anchor_target
+    if _memory_anchor_target == DATABASE_PATH:
+        return
+    if _memory_anchor is not None:
+        _memory_anchor.close()
+        _memory_anchor = None
+    if DATABASE_PATH.startswith("file:") and "mode=memory" in DATABASE_PATH:
+        _memory_anchor = sqlite3.connect(DATABASE_PATH, uri=True, check_same_thread=False)
+    _memory_anchor_target = DATABASE_PATH
+
+
+def _connect() -> aiosqlite.Connection:
+    """Соединение с БД процесса (файл или общая БД в памяти)"""
+    _ensure_memory_anchor()
+    return aiosqlite.connect(DATABASE_PATH, uri=True)
+
+
+# Текущая БД процесса: путь к файлу или URI общей БД в памяти (см. configure_database)
+DATABASE_PATH = database_target(os.getenv("DATABASE_URL") or DEFAULT_DATABASE_PATH)
+
+
+# Подписчики на изменения пользователя, влияющие на рейтинг продавцов
+# (рейтинг, VIP, блокировка, роли) - например, лидерборд в памяти
+_user_change_listeners: List[Callable[[int], None]] = []
+
+
+def on_user_changed(listener: Callable[[int], None]) -> Callable[[int], None]:
+    """Регистрация обработчика изменений пользователя (вызывается с users.id)"""
+    _user_change_listeners.append(listener)
+    return listener
+
+
+def _user_changed(*user_ids: int):
+    for listener in _user_change_listeners:
+        for user_id in user_ids:
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменений пользователя {user_id}: {e}")
+
+
+# Подписчики на изменение, создание и удаление блогеров - кеши блогеров
+# и их карточек в памяти
+_blogger_change_listeners: List[Callable[[int], None]] = []
+
+
+def on_blogger_changed(listener: Callable[[int], None]) -> Callable[[int], None]:
+    """Регистрация обработчика изменений блогера (вызывается с bloggers.id)"""
+    _blogger_change_listeners.append(listener)
+    return listener
+
+
+def _blogger_changed(*blogger_ids: int):
+    for listener in _blogger_change_listeners:
+        for blogger_id in blogger_ids:
+            try:
+                listener(blogger_id)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменений блогера {blogger_id}: {e}")
+
 
 async def init_db():
     """Инициализация базы данных и создание таблиц"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         # Создание таблицы пользователей
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -115,6 +221,7 @@ async def init_db():
                 categories TEXT,  -- JSON массив категорий
                 budget_min INTEGER,
                 budget_max INTEGER,
+                cpm_max INTEGER,
                 has_reviews BOOLEAN,
                 is_registered_rkn BOOLEAN,
                 official_payment_required BOOLEAN,
@@ -123,6 +230,26 @@ async def init_db():
             )
         """)
         
+        # История поиска: критерии хранятся один раз на хеш, в истории - только ссылка на них
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS search_queries (
+                filter_hash TEXT PRIMARY KEY,
+                filters TEXT NOT NULL  -- канонический JSON аргументов search_bloggers
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS search_history (
+                id INTEGER PRIMARY KEY,
+                buyer_id INTEGER NOT NULL,
+                filter_hash TEXT NOT NULL,
+                results_count INTEGER NOT NULL,
+                latency_ms INTEGER NOT NULL,
+                created_at INTEGER NOT NULL,  -- unix time, секунды
+                FOREIGN KEY (buyer_id) REFERENCES users (id),
+                FOREIGN KEY (filter_hash) REFERENCES search_queries (filter_hash)
+            )
+        """)
+        
         # Создание таблицы отзывов
         await db.execute("""
             CREATE TABLE IF NOT EXISTS reviews (
@@ -197,6 +324,10 @@ async def init_db():
         await db.execute("CREATE INDEX IF NOT EXISTS idx_user_roles_user_id ON user_roles (user_id)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_user_roles_role ON user_roles (role)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_bloggers_seller_id ON bloggers (seller_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_search_filters_buyer_id ON search_filters (buyer_id)")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_search_history_buyer_created ON search_history (buyer_id, created_at)"
+        )
         
         # Проверяем наличие колонки platform перед созданием индекса
         cursor = await db.execute("PRAGMA table_info(bloggers)")
@@ -362,115 +493,544 @@ async def init_db():
             if 'reels_reach_max' not in columns:
                 await db.execute("ALTER TABLE bloggers ADD COLUMN reels_reach_max INTEGER")
                 logger.info("Added reels_reach_max column to bloggers table")
+            
+            cursor = await db.execute("PRAGMA table_info(search_filters)")
+            columns = [col[1] for col in await cursor.fetchall()]
+            if 'cpm_max' not in columns:
+                await db.execute("ALTER TABLE search_filters ADD COLUMN cpm_max INTEGER")
+                logger.info("Added cpm_max column to search_filters table")
                 
         except Exception as e:
             logger.error(f"Error during migration: {e}")
         
+        await init_user_stats(db, backfill='user_stats' not in tables)
+        await init_ratings(db)
+        await init_cpm(db)
+        await init_offers(db, backfill='blogger_offers' not in tables)
+        await init_blogger_search(db, backfill='bloggers_fts' not in tables)
+        await init_canonical_urls(db)
+        
         await db.commit()
         logger.info("Database initialization completed")
 
 
+# === CPM ===
+# Цена за 1000 просмотров по середине вилки охвата. Колонки генерируемые
+# (VIRTUAL): SQLite пересчитывает их при любом INSERT/UPDATE цены или охвата,
+# а индекс по cpm хранит готовые значения, поэтому фильтр и сортировка
+# в поиске не считают CPM для каждой строки.
+
+def _cpm_expression(price: str, reach_min: str, reach_max: str) -> str:
+    # Деление на 0 в SQLite дает NULL
+    return (f"CASE WHEN {price} > 0 THEN {price} * 2000.0 / "
+            f"(COALESCE({reach_min}, {reach_max}) + COALESCE({reach_max}, {reach_min})) END")
+
+
+CPM_COLUMNS = {
+    'cpm_stories': _cpm_expression('price_stories', 'stories_reach_min', 'stories_reach_max'),
+    'cpm_reels': _cpm_expression('price_reels', 'reels_reach_min', 'reels_reach_max'),
+    # Лучший CPM из двух форматов - по нему фильтр cpm_max и сортировка
+    'cpm': "MIN(COALESCE(cpm_stories, cpm_reels), COALESCE(cpm_reels, cpm_stories))",
+}
+
+
+async def init_cpm(db):
+    """Миграция: генерируемые колонки CPM у блогеров и индекс по лучшему CPM"""
+    # Генерируемые колонки видны только в table_xinfo
+    cursor = await db.execute("PRAGMA table_xinfo(bloggers)")
+    columns = [row[1] for row in await cursor.fetchall()]
+    for name, expression in CPM_COLUMNS.items():
+        if name not in columns:
+            await db.execute(f"ALTER TABLE bloggers ADD COLUMN {name} REAL GENERATED ALWAYS AS ({expression}) VIRTUAL")
+            logger.info(f"Added {name} column to bloggers table")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_bloggers_cpm ON bloggers (cpm)")
+
+
+# === ЦЕНЫ РАЗМЕЩЕНИЙ ===
+# blogger_offers - по строке на каждую указанную цену блогера (сторис, рилс,
+# старые пост и видео). Таблица ведется триггерами на bloggers, а индекс
+# (offer_type, price) превращает фильтр бюджета в поиск по диапазону.
+
+def _offers_insert(row: str) -> str:
+    """INSERT цен строки bloggers (NEW) в blogger_offers"""
+    prices = " UNION ALL ".join(
+        f"SELECT '{offer_type}' AS offer_type, {row}.{column} AS price"
+        for offer_type, column in OFFER_PRICE_COLUMNS
+    )
+    return (f"INSERT INTO blogger_offers (blogger_id, offer_type, price) "
+            f"SELECT {row}.id, offer_type, price FROM ({prices}) WHERE price IS NOT NULL;")
+
+
+BLOGGER_OFFERS_TRIGGERS = {
+    'trg_blogger_offers_insert': (
+        "AFTER INSERT ON bloggers",
+        _offers_insert("NEW"),
+    ),
+    'trg_blogger_offers_update': (
+        f"AFTER UPDATE OF {', '.join(column for _, column in OFFER_PRICE_COLUMNS)} ON bloggers",
+        "DELETE FROM blogger_offers WHERE blogger_id = OLD.id;" + _offers_insert("NEW"),
+    ),
+    'trg_blogger_offers_delete': (
+        "AFTER DELETE ON bloggers",
+        "DELETE FROM blogger_offers WHERE blogger_id = OLD.id;",
+    ),
+}
+
+
+async def init_offers(db, backfill: bool = False):
+    """Создание blogger_offers и триггеров; backfill - заполнение по существующим блогерам"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS blogger_offers (
+            blogger_id INTEGER NOT NULL,
+            offer_type TEXT NOT NULL,  -- stories, reels, post, video
+            price INTEGER NOT NULL,
+            PRIMARY KEY (blogger_id, offer_type),
+            FOREIGN KEY (blogger_id) REFERENCES bloggers (id)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_blogger_offers_type_price ON blogger_offers (offer_type, price)")
+    
+    for name, (event, body) in BLOGGER_OFFERS_TRIGGERS.items():
+        await db.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+    
+    if backfill:
+        for offer_type, column in OFFER_PRICE_COLUMNS:
+            await db.execute(
+                f"INSERT OR REPLACE INTO blogger_offers (blogger_id, offer_type, price) "
+                f"SELECT id, ?, {column} FROM bloggers WHERE {column} IS NOT NULL",
+                (offer_type,)
+            )
+        logger.info("blogger_offers заполнена по существующим блогерам")
+
+
+# === ПОЛНОТЕКСТОВЫЙ ПОИСК ===
+# bloggers_fts (FTS5) по имени, ссылке и описанию, rowid = bloggers.id.
+# unicode61 приводит регистр и кириллицы, но не заменяет «ё» на «е» -
+# это делается при записи (fts_text) и в запросе (fts_query). «_» - часть
+# слова, поэтому ник из ссылки (instagram.com/anna_fit) - один токен.
+# Префиксные индексы на 2 и 3 символа ускоряют поиск по началу слова.
+
+def fts_text(column: str) -> str:
+    """SQL выражение: значение колонки в том виде, в каком оно индексируется"""
+    return f"replace(replace(COALESCE({column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fts_insert(row: str) -> str:
+    return (f"INSERT INTO bloggers_fts (rowid, name, url, description) VALUES "
+            f"({row}.id, {fts_text(row + '.name')}, {fts_text(row + '.url')}, {fts_text(row + '.description')});")
+
+
+BLOGGER_SEARCH_TRIGGERS = {
+    'trg_bloggers_fts_insert': (
+        "AFTER INSERT ON bloggers",
+        _fts_insert("NEW"),
+    ),
+    'trg_bloggers_fts_update': (
+        "AFTER UPDATE OF name, url, description ON bloggers",
+        "DELETE FROM bloggers_fts WHERE rowid = OLD.id;" + _fts_insert("NEW"),
+    ),
+    'trg_bloggers_fts_delete': (
+        "AFTER DELETE ON bloggers",
+        "DELETE FROM bloggers_fts WHERE rowid = OLD.id;",
+    ),
+}
+
+# Веса колонок bm25: совпадение в имени важнее, чем в ссылке и описании
+FTS_RANK = "bm25(bloggers_fts, 10.0, 5.0, 1.0)"
+FTS_MAX_TERMS = 8
+_FTS_TERM = re.compile(r"\w+")
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Текст пользователя -> запрос MATCH: все слова, каждое как префикс.
+    
+    Спецсимволы FTS5 (кавычки, *, NEAR, OR) в запрос не попадают.
+    """
+    terms = _FTS_TERM.findall(text.lower().replace('ё', 'е'))[:FTS_MAX_TERMS]
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+
+async def init_blogger_search(db, backfill: bool = False):
+    """Создание bloggers_fts и триггеров; backfill - индексация существующих блогеров"""
+    await db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS bloggers_fts USING fts5(
+            name, url, description,
+            tokenize = "unicode61 tokenchars '_'",
+            prefix = '2 3'
+        )
+    """)
+    
+    for name, (event, body) in BLOGGER_SEARCH_TRIGGERS.items():
+        await db.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+    
+    if backfill:
+        await db.execute(f"""
+            INSERT INTO bloggers_fts (rowid, name, url, description)
+            SELECT id, {fts_text('name')}, {fts_text('url')}, {fts_text('description')} FROM bloggers
+        """)
+        logger.info("bloggers_fts заполнена по существующим блогерам")
+
+
+# === ДУБЛИКАТЫ БЛОГЕРОВ ===
+# canonical_url - ссылка в каноническом виде (utils/url_normalizer.py).
+# По индексу на ней дубликат находится при добавлении одним поиском.
+# has_duplicates отмечает блогеров, чья ссылка встречается больше одного
+# раза (ведется триггерами), и поиск схлопывает только их.
+
+CANONICAL_URL_BATCH_SIZE = 1000
+
+
+def _duplicates_mark(row: str) -> str:
+    """UPDATE флага has_duplicates для группы ссылки {row}.canonical_url"""
+    return (f"UPDATE bloggers SET has_duplicates = "
+            f"((SELECT COUNT(*) FROM bloggers WHERE canonical_url = {row}.canonical_url) > 1) "
+            f"WHERE canonical_url = {row}.canonical_url;")
+
+
+BLOGGER_DUPLICATES_TRIGGERS = {
+    'trg_bloggers_duplicates_insert': (
+        "AFTER INSERT ON bloggers WHEN NEW.canonical_url IS NOT NULL",
+        _duplicates_mark("NEW"),
+    ),
+    'trg_bloggers_duplicates_update': (
+        "AFTER UPDATE OF canonical_url ON bloggers",
+        "UPDATE bloggers SET has_duplicates = 0 WHERE id = NEW.id;"
+        + _duplicates_mark("OLD") + _duplicates_mark("NEW"),
+    ),
+    'trg_bloggers_duplicates_delete': (
+        "AFTER DELETE ON bloggers WHEN OLD.canonical_url IS NOT NULL",
+        _duplicates_mark("OLD"),
+    ),
+}
+
+DUPLICATES_RECOMPUTE = """
+    UPDATE bloggers SET has_duplicates = COALESCE(canonical_url IN (
+        SELECT canonical_url FROM bloggers WHERE canonical_url IS NOT NULL
+        GROUP BY canonical_url HAVING COUNT(*) > 1
+    ), 0)
+"""
+
+
+async def init_canonical_urls(db):
+    """Миграция: canonical_url и has_duplicates, индексы, триггеры и заполнение"""
+    cursor = await db.execute("PRAGMA table_info(bloggers)")
+    columns = [row[1] for row in await cursor.fetchall()]
+    if 'has_duplicates' not in columns:
+        await db.execute("ALTER TABLE bloggers ADD COLUMN has_duplicates INTEGER NOT NULL DEFAULT 0")
+        logger.info("Added has_duplicates column to bloggers table")
+    if 'canonical_url' not in columns:
+        await db.execute("ALTER TABLE bloggers ADD COLUMN canonical_url TEXT")
+        logger.info("Added canonical_url column to bloggers table")
+        updated = await _refresh_canonical_urls(db)
+        logger.info(f"Канонические ссылки заполнены: {updated} блогеров")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_bloggers_canonical_url ON bloggers (canonical_url)")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bloggers_duplicates ON bloggers (canonical_url) WHERE has_duplicates = 1"
+    )
+    for name, (event, body) in BLOGGER_DUPLICATES_TRIGGERS.items():
+        await db.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+async def _refresh_canonical_urls(db) -> int:
+    """Пересчет canonical_url там, где он отличается от текущей нормализации, и флагов дубликатов.
+    
+    Страницы читаются целиком по id > последнего id и только потом обновляются:
+    открытый курсор по bloggers во время UPDATE той же таблицы может пропустить
+    строки или отдать их дважды.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        cursor = await db.execute(
+            "SELECT id, url, canonical_url FROM bloggers WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, CANONICAL_URL_BATCH_SIZE)
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        changes = [(key, blogger_id) for blogger_id, url, old_key in rows
+                   if (key := canonical_url(url)) != old_key]
+        if changes:
+            await db.executemany("UPDATE bloggers SET canonical_url = ? WHERE id = ?", changes)
+            updated += len(changes)
+    await db.execute(DUPLICATES_RECOMPUTE)
+    return updated
+
+
+async def refresh_canonical_urls() -> int:
+    """Пересчет канонических ссылок всех блогеров (после изменения правил нормализации)"""
+    async with _connect() as db:
+        updated = await _refresh_canonical_urls(db)
+        await db.commit()
+        return updated
+
+
+async def find_bloggers_by_url(url: str) -> List[Blogger]:
+    """Блогеры с той же канонической ссылкой (поиск по индексу)"""
+    key = canonical_url(url)
+    if key is None:
+        return []
+    async with _connect() as db:
+        cursor = await db.execute("SELECT * FROM bloggers WHERE canonical_url = ?", (key,))
+        rows = await cursor.fetchall()
+        to_blogger = blogger_mapper(cursor.description, lazy=True)
+        return [to_blogger(row) for row in rows]
+
+
+async def get_seller_canonical_urls(seller_id: int) -> Set[str]:
+    """Канонические ссылки всех блогеров продавца (проверка дубликатов при импорте)"""
+    async with _connect() as db:
+        cursor = await db.execute(
+            "SELECT canonical_url FROM bloggers WHERE seller_id = ? AND canonical_url IS NOT NULL", (seller_id,)
+        )
+        return {key for (key,) in await cursor.fetchall()}
+
+
+async def count_placed_by_others(blogger_ids: Iterable[int]) -> int:
+    """Сколько из блогеров blogger_ids с той же канонической ссылкой есть у других продавцов"""
+    async with _connect() as db:
+        cursor = await db.execute("""
+            SELECT COUNT(*) FROM bloggers b
+            WHERE b.id IN (SELECT value FROM json_each(?))
+              AND EXISTS (SELECT 1 FROM bloggers o
+                          WHERE o.canonical_url = b.canonical_url AND o.seller_id != b.seller_id)
+        """, (json.dumps(list(blogger_ids)),))
+        (count,) = await cursor.fetchone()
+        return count
+
+
+async def get_duplicate_clusters(min_size: int = 2, limit: int = -1) -> List[Tuple[str, List[int]]]:
+    """Группы блогеров с одинаковой канонической ссылкой: (ссылка, id блогеров), крупные первыми"""
+    async with _connect() as db:
+        cursor = await db.execute("""
+            SELECT canonical_url, GROUP_CONCAT(id) FROM bloggers
+            WHERE canonical_url IS NOT NULL
+            GROUP BY canonical_url HAVING COUNT(*) >= ?
+            ORDER BY COUNT(*) DESC, canonical_url
+            LIMIT ?
+        """, (min_size, limit))
+        return [(key, [int(blogger_id) for blogger_id in ids.split(',')])
+                for key, ids in await cursor.fetchall()]
+
+
+# === СЧЕТЧИКИ ПОЛЬЗОВАТЕЛЕЙ ===
+# user_stats обновляется триггерами при записи в bloggers, search_history,
+# contacts и complaints, поэтому экран статистики - один запрос
+# по первичному ключу, сколько бы истории ни накопилось. Число и сумма оценок
+# здесь не хранятся: они есть только в users (см. РЕЙТИНГ ПРОДАВЦОВ).
+
+def _stats_upsert(user_expr: str, **deltas: str) -> str:
+    """INSERT ... ON CONFLICT для прибавления к счетчикам пользователя user_expr"""
+    columns = ", ".join(deltas)
+    values = ", ".join(deltas.values())
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in deltas)
+    return (f"INSERT INTO user_stats (user_id, {columns}) SELECT {user_expr}, {values} WHERE {user_expr} IS NOT NULL "
+            f"ON CONFLICT (user_id) DO UPDATE SET {updates};")
+
+
+def _stats_update(user_expr: str, **deltas: str) -> str:
+    """UPDATE счетчиков существующей строки (для удаления записей)"""
+    updates = ", ".join(f"{column} = {column} + ({delta})" for column, delta in deltas.items())
+    return f"UPDATE user_stats SET {updates} WHERE user_id = {user_expr};"
+
+
+def _stats_set(user_expr: str, **values: str) -> str:
+    """INSERT ... ON CONFLICT для записи значений (не счетчиков) пользователя user_expr"""
+    columns = ", ".join(values)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in values)
+    return (f"INSERT INTO user_stats (user_id, {columns}) SELECT {user_expr}, {', '.join(values.values())} "
+            f"WHERE {user_expr} IS NOT NULL ON CONFLICT (user_id) DO UPDATE SET {updates};")
+
+
+BLOGGER_SELLER = "(SELECT seller_id FROM bloggers WHERE id = NEW.blogger_id)"
+
+USER_STATS_TRIGGERS = {
+    'trg_user_stats_blogger_insert': (
+        "AFTER INSERT ON bloggers",
+        _stats_upsert("NEW.seller_id", bloggers_count="1"),
+    ),
+    'trg_user_stats_blogger_delete': (
+        "AFTER DELETE ON bloggers",
+        _stats_update("OLD.seller_id", bloggers_count="-1"),
+    ),
+    'trg_user_stats_search': (
+        "AFTER INSERT ON search_history",
+        _stats_upsert("NEW.buyer_id", searches_count="1"),
+    ),
+    'trg_user_stats_contact': (
+        "AFTER INSERT ON contacts",
+        _stats_upsert("NEW.buyer_id", contacts_requested="1")
+        + _stats_upsert("NEW.seller_id", contacts_received="1"),
+    ),
+    'trg_user_stats_complaint': (
+        "AFTER INSERT ON complaints",
+        _stats_upsert("NEW.user_id", complaints_filed="1")
+        + _stats_upsert(BLOGGER_SELLER, complaints_received="1"),
+    ),
+    'trg_user_stats_last_contact_rating': (
+        "AFTER UPDATE OF rating_given ON contacts "
+        "WHEN OLD.rating_given IS NULL AND NEW.rating_given IS NOT NULL",
+        _stats_set("NEW.seller_id", last_review_at="CURRENT_TIMESTAMP"),
+    ),
+}
+
+# Триггеры прежних версий, считавшие оценки в user_stats отдельно от users
+# (их колонки reviews_received и rating_sum в старых БД остаются неиспользуемыми),
+# и триггер по таблице reviews, в которую бот не пишет
+OBSOLETE_USER_STATS_TRIGGERS = (
+    'trg_user_stats_review_insert', 'trg_user_stats_review_delete', 'trg_user_stats_last_review',
+)
+
+USER_STATS_BACKFILL = """
+    INSERT OR REPLACE INTO user_stats (
+        user_id, bloggers_count, searches_count, contacts_requested, contacts_received,
+        complaints_filed, complaints_received, last_review_at
+    )
+    SELECT
+        u.id,
+        (SELECT COUNT(*) FROM bloggers b WHERE b.seller_id = u.id),
+        (SELECT COUNT(*) FROM search_history h WHERE h.buyer_id = u.id),
+        (SELECT COUNT(*) FROM contacts c WHERE c.buyer_id = u.id),
+        (SELECT COUNT(*) FROM contacts c WHERE c.seller_id = u.id),
+        (SELECT COUNT(*) FROM complaints c WHERE c.user_id = u.id),
+        (SELECT COUNT(*) FROM complaints c JOIN bloggers b ON b.id = c.blogger_id WHERE b.seller_id = u.id),
+        -- время оценки в contacts не хранится, берется дата последнего оцененного контакта
+        (SELECT MAX(c.created_at) FROM contacts c WHERE c.seller_id = u.id AND c.rating_given IS NOT NULL)
+    FROM users u
+"""
+
+
+async def init_user_stats(db, backfill: bool = False):
+    """Создание user_stats и триггеров; backfill - однократный пересчет по существующим данным"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            bloggers_count INTEGER NOT NULL DEFAULT 0,
+            searches_count INTEGER NOT NULL DEFAULT 0,
+            contacts_requested INTEGER NOT NULL DEFAULT 0,
+            contacts_received INTEGER NOT NULL DEFAULT 0,
+            complaints_filed INTEGER NOT NULL DEFAULT 0,
+            complaints_received INTEGER NOT NULL DEFAULT 0,
+            last_review_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    
+    for name in OBSOLETE_USER_STATS_TRIGGERS:
+        await db.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for name, (event, body) in USER_STATS_TRIGGERS.items():
+        await db.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+    
+    if backfill:
+        await db.execute(USER_STATS_BACKFILL)
+        logger.info("Счетчики user_stats пересчитаны по существующим данным")
+
+
+async def get_user_stats(user_id: int) -> UserStats:
+    """Счетчики пользователя (нулевые, если активности еще не было)"""
+    async with _connect() as db:
+        cursor = await db.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,))
+        row = await cursor.fetchone()
+        return user_stats_mapper(cursor.description)(row) if row else UserStats(user_id=user_id)
+
+
 # Функции для работы с пользователями
 async def create_user(telegram_id: int, username: str = None, first_name: str = None, 
                      last_name: str = None, roles: List[UserRole] = None) -> User:
-    """Создание нового пользователя с поддержкой множественных ролей"""
+    """Создание нового пользователя с поддержкой множественных ролей.
+    
+    Повторный вызов с тем же telegram_id (двойной /start) не падает на UNIQUE,
+    а обновляет имя и добавляет роли. Пользователь собирается из RETURNING,
+    без повторного чтения из БД.
+    """
     if roles is None:
         roles = [UserRole.SELLER]  # По умолчанию продажник
     
     logger.info(f"Создание пользователя: telegram_id={telegram_id}, username={username}, first_name={first_name}, last_name={last_name}, roles={[r.value for r in roles]}")
     
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            logger.info(f"Подключение к базе данных: {DATABASE_PATH}")
-            
-            # Создаем пользователя
-            cursor = await db.execute("""
-                INSERT INTO users (telegram_id, username, first_name, last_name, is_vip, penalty_amount, is_blocked)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (telegram_id, username, first_name, last_name, False, 0, False))
-            
-            user_id = cursor.lastrowid
-            logger.info(f"Пользователь создан с ID: {user_id}")
+        async with _connect() as db:
+            # Создаем пользователя (или обновляем, если он уже есть)
+            cursor = await db.execute(f"""
+                INSERT INTO users (telegram_id, username, first_name, last_name, is_vip, penalty_amount, is_blocked,
+                                   rating)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (telegram_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING *, {ROLES_SUBQUERY.format(alias='users')} AS roles
+            """, (telegram_id, username, first_name, last_name, False, 0, False, RATING_PRIOR_MEAN))
+            row = await cursor.fetchone()
+            created_user = user_mapper(cursor.description)(row)
+            await cursor.close()
             
-            # Добавляем роли
-            for role in roles:
-                await db.execute("""
-                    INSERT INTO user_roles (user_id, role)
-                    VALUES (?, ?)
-                """, (user_id, role.value))
-                logger.info(f"Добавлена роль {role.value} для пользователя {user_id}")
+            # Добавляем роли одним executemany
+            await db.executemany("""
+                INSERT OR IGNORE INTO user_roles (user_id, role)
+                VALUES (?, ?)
+            """, [(created_user.id, role.value) for role in roles])
             
             await db.commit()
-            logger.info("Транзакция зафиксирована")
-            
-            # Получаем созданного пользователя
-            created_user = await get_user(telegram_id)
-            logger.info(f"Созданный пользователь: {created_user}")
-            
-            return created_user
+        
+        created_user.roles = created_user.roles | set(roles)
+        _user_changed(created_user.id)
+        logger.info(f"Пользователь создан с ID: {created_user.id}, роли: {[r.value for r in created_user.roles]}")
+        return created_user
             
     except Exception as e:
         logger.error(f"Ошибка при создании пользователя: {e}")
         raise
 
 
+USER_SELECT = f"SELECT u.*, {ROLES_SUBQUERY.format(alias='u')} AS roles FROM users u"
+
+
 async def get_user(telegram_id: int) -> Optional[User]:
     """Получение пользователя по telegram_id с ролями"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            
-            # Получаем основную информацию о пользователе
-            cursor = await db.execute("""
-                SELECT * FROM users WHERE telegram_id = ?
-            """, (telegram_id,))
-            
+        async with _connect() as db:
+            cursor = await db.execute(f"{USER_SELECT} WHERE u.telegram_id = ?", (telegram_id,))
             row = await cursor.fetchone()
             if not row:
                 return None
-            
-            # Получаем роли пользователя
-            cursor = await db.execute("""
-                SELECT role FROM user_roles WHERE user_id = ?
-            """, (row['id'],))
-            
-            role_rows = await cursor.fetchall()
-            roles = {UserRole(role_row['role']) for role_row in role_rows}
-            
-            # Создаем объект пользователя
-            user = User(
-                id=row['id'],
-                telegram_id=row['telegram_id'],
-                username=row['username'],
-                first_name=row['first_name'],
-                last_name=row['last_name'],
-                roles=roles,
-                subscription_status=SubscriptionStatus(row['subscription_status']) if row['subscription_status'] else SubscriptionStatus.INACTIVE,
-                subscription_end_date=datetime.fromisoformat(row['subscription_end_date']) if row['subscription_end_date'] else None,
-                subscription_start_date=datetime.fromisoformat(row['subscription_start_date']) if row['subscription_start_date'] else None,
-                rating=row['rating'],
-                reviews_count=row['reviews_count'],
-                is_vip=bool(row['is_vip']),
-                penalty_amount=row['penalty_amount'],
-                is_blocked=bool(row['is_blocked']),
-                created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else datetime.now(),
-                updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else datetime.now()
-            )
-            
-            return user
+            return user_mapper(cursor.description)(row)
             
     except Exception as e:
         logger.error(f"Ошибка при получении пользователя: {e}")
         return None
 
 
+async def get_user_by_id(user_id: int) -> Optional[User]:
+    """Получение пользователя по внутреннему ID с ролями"""
+    try:
+        async with _connect() as db:
+            cursor = await db.execute(f"{USER_SELECT} WHERE u.id = ?", (user_id,))
+            row = await cursor.fetchone()
+            if not row:
+                return None
+            return user_mapper(cursor.description)(row)
+            
+    except Exception as e:
+        logger.error(f"Ошибка при получении пользователя по ID: {e}")
+        return None
+
+
 async def update_user_roles(telegram_id: int, roles: List[UserRole]) -> bool:
     """Обновление ролей пользователя (заменяет все существующие роли)"""
+    role_values = [role.value for role in roles]
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            # Получаем ID пользователя
-            cursor = await db.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
+        async with _connect() as db:
+            # ID пользователя и отметка об изменении одним запросом
+            cursor = await db.execute(
+                "UPDATE users SET updated_at = CURRENT_TIMESTAMP WHERE telegram_id = ? RETURNING id",
+                (telegram_id,)
+            )
             user_row = await cursor.fetchone()
+            await cursor.close()
             
             if not user_row:
                 logger.error(f"Пользователь с telegram_id {telegram_id} не найден")
@@ -478,19 +1038,21 @@ async def update_user_roles(telegram_id: int, roles: List[UserRole]) -> bool:
             
             user_id = user_row[0]
             
-            # Удаляем все существующие роли
-            await db.execute("DELETE FROM user_roles WHERE user_id = ?", (user_id,))
-            
-            # Добавляем новые роли
-            for role in roles:
-                await db.execute("""
-                    INSERT INTO user_roles (user_id, role)
-                    VALUES (?, ?)
-                """, (user_id, role.value))
+            # Удаляем только роли, которых нет в новом списке, и добавляем недостающие
+            await db.execute(
+                f"DELETE FROM user_roles WHERE user_id = ? AND role NOT IN ({', '.join('?' * len(role_values))})",
+                [user_id] + role_values
+            )
+            await db.executemany(
+                "INSERT OR IGNORE INTO user_roles (user_id, role) VALUES (?, ?)",
+                [(user_id, value) for value in role_values]
+            )
             
             await db.commit()
-            logger.info(f"Роли пользователя {telegram_id} обновлены: {[r.value for r in roles]}")
-            return True
+        
+        _user_changed(user_id)
+        logger.info(f"Роли пользователя {telegram_id} обновлены: {role_values}")
+        return True
             
     except Exception as e:
         logger.error(f"Ошибка при обновлении ролей пользователя: {e}")
@@ -500,7 +1062,7 @@ async def update_user_roles(telegram_id: int, roles: List[UserRole]) -> bool:
 async def add_user_role(telegram_id: int, role: UserRole) -> bool:
     """Добавление роли пользователю (не заменяет существующие)"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with _connect() as db:
             # Получаем ID пользователя
             cursor = await db.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
             user_row = await cursor.fetchone()
@@ -518,6 +1080,7 @@ async def add_user_role(telegram_id: int, role: UserRole) -> bool:
             """, (user_id, role.value))
             
             await db.commit()
+            _user_changed(user_id)
             logger.info(f"Роль {role.value} добавлена пользователю {telegram_id}")
             return True
             
@@ -529,7 +1092,7 @@ async def add_user_role(telegram_id: int, role: UserRole) -> bool:
 async def remove_user_role(telegram_id: int, role: UserRole) -> bool:
     """Удаление роли у пользователя"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
+        async with _connect() as db:
             # Получаем ID пользователя
             cursor = await db.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
             user_row = await cursor.fetchone()
@@ -546,6 +1109,7 @@ async def remove_user_role(telegram_id: int, role: UserRole) -> bool:
             """, (user_id, role.value))
             
             await db.commit()
+            _user_changed(user_id)
             
             if cursor.rowcount > 0:
                 logger.info(f"Роль {role.value} удалена у пользователя {telegram_id}")
@@ -568,7 +1132,7 @@ async def update_user_role(telegram_id: int, role: UserRole) -> bool:
 async def update_subscription_status(user_id: int, status: SubscriptionStatus, 
                                    end_date: datetime = None, start_date: datetime = None) -> bool:
     """Обновление статуса подписки"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         cursor = await db.execute("""
             UPDATE users SET subscription_status = ?, subscription_start_date = ?, subscription_end_date = ?, 
                            updated_at = CURRENT_TIMESTAMP
@@ -581,6 +1145,21 @@ async def update_subscription_status(user_id: int, status: SubscriptionStatus,
 
 
 # Функции для работы с блогерами
+BLOGGER_INSERT = """
+    INSERT INTO bloggers (
+        seller_id, name, url, platforms, categories,
+        price_stories, price_reels,
+        subscribers_count, 
+        stories_reach_min, stories_reach_max,
+        reels_reach_min, reels_reach_max,
+        stats_images,
+        description,
+        canonical_url
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
 async def create_blogger(
     seller_id: int,
     name: str,
@@ -589,25 +1168,14 @@ async def create_blogger(
     categories: List[BlogCategory],
     **kwargs,
 ) -> Blogger:
-    """Создание нового блогера"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    """Создание нового блогера (блогер собирается из RETURNING, без повторного чтения)"""
+    async with _connect() as db:
         # Преобразуем платформы и категории в JSON
         platforms_json = json.dumps([p.value for p in platforms]) if platforms else None
         categories_json = json.dumps([c.value for c in categories]) if categories else None
 
         cursor = await db.execute(
-            """
-            INSERT INTO bloggers (
-                seller_id, name, url, platforms, categories,
-                price_stories, price_reels,
-                subscribers_count, 
-                stories_reach_min, stories_reach_max,
-                reels_reach_min, reels_reach_max,
-                stats_images,
-                description
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
+            BLOGGER_INSERT + " RETURNING *",
             (
                 seller_id,
                 name,
@@ -623,305 +1191,396 @@ async def create_blogger(
                 kwargs.get("reels_reach_max"),
                 json.dumps(kwargs.get("stats_images", [])),
                 kwargs.get("description"),
+                canonical_url(url),
             ),
         )
         
-        blogger_id = cursor.lastrowid
+        blogger = blogger_mapper(cursor.description)(await cursor.fetchone())
+        await cursor.close()
         await db.commit()
-        
-        return await get_blogger(blogger_id)
+    
+    # Сбрасывает запомненное отсутствие блогера с этим id
+    _blogger_changed(blogger.id)
+    return blogger
+
+
+BLOGGER_BATCH_SIZE = 500
+
+
+async def create_bloggers_batch(bloggers: AsyncIterable[Blogger],
+                                batch_size: int = BLOGGER_BATCH_SIZE) -> List[int]:
+    """Пакетное создание блогеров одной транзакцией (для импорта из файла).
+    
+    bloggers - асинхронный итератор (импорт разбирает файл в отдельном потоке):
+    в памяти держится не больше batch_size строк.
+    При любой ошибке транзакция откатывается и исключение пробрасывается дальше.
+    Возвращает id добавленных блогеров; после коммита, как и create_blogger,
+    оповещает подписчиков on_blogger_changed.
+    """
+    async with _connect() as db:
+        inserted_ids = []
+        batch = []
+
+        async def insert_batch():
+            await db.executemany(BLOGGER_INSERT, batch)
+            # executemany не отдает строки RETURNING. Транзакция держит блокировку
+            # записи, а id с AUTOINCREMENT выдаются подряд, поэтому пачка получила
+            # id, заканчивающиеся на last_insert_rowid()
+            async with db.execute("SELECT last_insert_rowid()") as cursor:
+                last_id = (await cursor.fetchone())[0]
+            inserted_ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+            batch.clear()
+
+        try:
+            async for blogger in bloggers:
+                batch.append((
+                    blogger.seller_id,
+                    blogger.name,
+                    blogger.url,
+                    json.dumps([p.value for p in blogger.platforms]),
+                    json.dumps([c.value for c in blogger.categories]) if blogger.categories else None,
+                    blogger.price_stories,
+                    blogger.price_reels,
+                    blogger.subscribers_count,
+                    blogger.stories_reach_min,
+                    blogger.stories_reach_max,
+                    blogger.reels_reach_min,
+                    blogger.reels_reach_max,
+                    json.dumps(blogger.stats_images),
+                    blogger.description,
+                    canonical_url(blogger.url),
+                ))
+                if len(batch) >= batch_size:
+                    await insert_batch()
+            if batch:
+                await insert_batch()
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    
+    # Сбрасывает запомненное отсутствие блогеров с этими id
+    _blogger_changed(*inserted_ids)
+    return inserted_ids
 
 
 async def get_blogger(blogger_id: int) -> Optional[Blogger]:
     """Получение блогера по ID"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with _connect() as db:
         cursor = await db.execute(
             "SELECT * FROM bloggers WHERE id = ?", (blogger_id,)
         )
         row = await cursor.fetchone()
         
         if row:
-            # Парсим платформы из JSON
-            platforms = []
-            if row['platforms']:
-                try:
-                    platform_values = json.loads(row['platforms'])
-                    platforms = [Platform(platform) for platform in platform_values]
-                except (json.JSONDecodeError, ValueError):
-                    # Fallback для старых данных с одной платформой
-                    try:
-                        platform_value = row.get('platform') if hasattr(row, 'get') else row['platform']
-                        platforms = [Platform(platform_value)] if platform_value else []
-                    except (ValueError, KeyError):
-                        pass
-            
-            # Парсим категории из JSON
-            categories = []
-            if row['categories']:
-                try:
-                    category_values = json.loads(row['categories'])
-                    categories = [BlogCategory(cat) for cat in category_values]
-                except (json.JSONDecodeError, ValueError):
-                    pass
-            
-            return Blogger(
-                id=row['id'],
-                seller_id=row['seller_id'],
-                name=row['name'],
-                url=row['url'],
-                platforms=platforms,
-                categories=categories,
-                price_stories=row['price_stories'],
-                price_reels=row['price_reels'] if 'price_reels' in row.keys() else None,
-                subscribers_count=row['subscribers_count'],
-                stories_reach_min=row['stories_reach_min'] if 'stories_reach_min' in row.keys() else None,
-                stories_reach_max=row['stories_reach_max'] if 'stories_reach_max' in row.keys() else None,
-                reels_reach_min=row['reels_reach_min'] if 'reels_reach_min' in row.keys() else None,
-                reels_reach_max=row['reels_reach_max'] if 'reels_reach_max' in row.keys() else None,
-                description=row['description'],
-                created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else datetime.now(),
-                updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else datetime.now()
-            )
+            return blogger_mapper(cursor.description)(row)
         return None
 
 
-async def get_user_bloggers(seller_id: int) -> List[Blogger]:
-    """Получение всех блогеров пользователя"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
+async def get_user_bloggers(seller_id: int, lazy: bool = True) -> List[Blogger]:
+    """Получение всех блогеров пользователя (по умолчанию с ленивой гидратацией)"""
+    async with _connect() as db:
         cursor = await db.execute(
             "SELECT * FROM bloggers WHERE seller_id = ? ORDER BY created_at DESC", 
             (seller_id,)
         )
         rows = await cursor.fetchall()
         
-        bloggers = []
-        for row in rows:
-            # Парсим категории из JSON
-            categories = []
-            if row['categories']:
-                try:
-                    category_values = json.loads(row['categories'])
-                    categories = [BlogCategory(cat) for cat in category_values]
-                except (json.JSONDecodeError, ValueError):
-                    pass
-            
-            # Парсим платформы из JSON
-            platforms = []
-            if row['platforms']:
-                try:
-                    platform_values = json.loads(row['platforms'])
-                    platforms = [Platform(p) for p in platform_values]
-                except (json.JSONDecodeError, ValueError):
-                    # Обратная совместимость со старым полем platform
-                    try:
-                        platform_value = row['platform'] if 'platform' in row.keys() else None
-                        platforms = [Platform(platform_value)] if platform_value else []
-                    except (KeyError, ValueError):
-                        pass
+        to_blogger = blogger_mapper(cursor.description, lazy)
+        return [to_blogger(row) for row in rows]
 
-            bloggers.append(Blogger(
-                id=row['id'],
-                seller_id=row['seller_id'],
-                name=row['name'],
-                url=row['url'],
-                platforms=platforms,
-                categories=categories,
-                price_stories=row['price_stories'],
-                price_reels=row['price_reels'] if 'price_reels' in row.keys() else None,
-                subscribers_count=row['subscribers_count'],
-                stories_reach_min=row['stories_reach_min'] if 'stories_reach_min' in row.keys() else None,
-                stories_reach_max=row['stories_reach_max'] if 'stories_reach_max' in row.keys() else None,
-                reels_reach_min=row['reels_reach_min'] if 'reels_reach_min' in row.keys() else None,
-                reels_reach_max=row['reels_reach_max'] if 'reels_reach_max' in row.keys() else None,
-                description=row['description'],
-                created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else datetime.now(),
-                updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else datetime.now()
-            ))
-        
-        return bloggers
+
+SELLER_COLUMNS = select_columns(User, 'u', prefix='u_')
+
+
+def _build_search_query(platforms: List[str] = None, categories: List[str] = None,
+                        target_age_min: int = None, target_age_max: int = None,
+                        target_gender: str = None, budget_min: int = None,
+                        budget_max: int = None, has_reviews: bool = None,
+                        cpm_max: int = None, order_by: str = None,
+                        text: str = None, collapse_duplicates: bool = True,
+                        columns: str = None) -> Tuple[str, list]:
+    """SQL поиска блогеров по критериям (без LIMIT) и его параметры.
+    
+    columns - список выбираемых колонок (b - блогер, u - продавец); по
+    умолчанию все колонки блогера и продавца для blogger_mapper/user_mapper.
+    text - слова для полнотекстового поиска по имени, ссылке и описанию;
+    результаты тогда сортируются по релевантности (bm25).
+    order_by: None - по рейтингу продавца, "cpm" - по лучшему CPM (дешевле первыми).
+    collapse_duplicates: из блогеров с одной канонической ссылкой (у разных
+    продавцов) остается первый в порядке сортировки.
+    """
+    match = fts_query(text) if text else None
+    fts_join = "JOIN bloggers_fts ON bloggers_fts.rowid = b.id" if match else ""
+    
+    # FROM и WHERE; колонки и сортировка добавляются в конце
+    query = f"""
+        FROM bloggers b
+        {fts_join}
+        JOIN users u ON b.seller_id = u.id
+        WHERE 1=1
+    """
+    params = []
+    
+    # Полнотекстовый поиск
+    if match:
+        query += " AND bloggers_fts MATCH ?"
+        params.append(match)
+    
+    # Фильтр по платформам
+    if platforms:
+        platform_conditions = []
+        for platform in platforms:
+            platform_conditions.append("b.platforms LIKE ?")
+            params.append(f'%"{platform}"%')
+        query += f" AND ({' OR '.join(platform_conditions)})"
+    
+    # Фильтр по категориям
+    if categories:
+        category_conditions = []
+        for category in categories:
+            category_conditions.append("b.categories LIKE ?")
+            params.append(f'%"{category}"%')
+        query += f" AND ({' OR '.join(category_conditions)})"
+    
+    # Фильтр по возрасту целевой аудитории
+    if target_age_min is not None and target_age_max is not None:
+        # Хотя бы одна возрастная группа блогера попадает в диапазон (как в
+        # SearchFilter.matches); диапазон вне всех групп не находит никого
+        age_conditions = [
+            f"b.{column} > 0" for low, high, column in AGE_BUCKETS
+            if target_age_min <= high and target_age_max >= low
+        ]
+        query += f" AND ({' OR '.join(age_conditions) or '0'})"
+    
+    # Фильтр по полу целевой аудитории
+    if target_gender and target_gender != "any":
+        if target_gender == "female":
+            query += " AND b.female_percent > b.male_percent"
+        elif target_gender == "male":
+            query += " AND b.male_percent > b.female_percent"
+    
+    # Фильтр по бюджету: хотя бы одно размещение с ценой в диапазоне
+    # (поиск по индексу idx_blogger_offers_type_price для каждого формата)
+    if budget_min is not None or budget_max is not None:
+        offer_types = [offer_type for offer_type, _ in OFFER_PRICE_COLUMNS]
+        budget_conditions = [f"offer_type IN ({', '.join('?' * len(offer_types))})"]
+        params.extend(offer_types)
+        if budget_min is not None:
+            budget_conditions.append("price >= ?")
+            params.append(budget_min)
+        if budget_max is not None:
+            budget_conditions.append("price <= ?")
+            params.append(budget_max)
+        query += f" AND b.id IN (SELECT blogger_id FROM blogger_offers WHERE {' AND '.join(budget_conditions)})"
+    
+    # Фильтр по наличию отзывов
+    if has_reviews is not None:
+        query += " AND b.has_reviews = ?"
+        params.append(has_reviews)
+    
+    # Фильтр по CPM (индекс idx_bloggers_cpm)
+    if cpm_max is not None:
+        query += " AND b.cpm <= ?"
+        params.append(cpm_max)
+    
+    # Сортировка: (выражение, направление)
+    if order_by == "cpm":
+        order = [("b.cpm IS NULL", "ASC"), ("b.cpm", "ASC"), ("u.rating", "DESC")]
+    elif match:
+        order = [(FTS_RANK, "ASC"), ("u.rating", "DESC")]
+    else:
+        # Сортировка по рейтингу продавца
+        order = [("u.rating", "DESC"), ("b.subscribers_count", "DESC")]
+    order_sql = ", ".join(f"{expression} {direction}" for expression, direction in order)
+    columns = columns or f"b.*, {SELLER_COLUMNS}"
+    
+    if not collapse_duplicates:
+        return f"SELECT {columns} {query} ORDER BY {order_sql}", params
+    
+    # Один блогер на каноническую ссылку. Блогеры без дубликатов проходят
+    # как есть; среди отмеченных has_duplicates (их мало, частичный индекс)
+    # остается первый в группе в порядке выдачи. Ключи сортировки считаются
+    # колонками sort_N: bm25 нельзя вызвать внутри оконной функции
+    sort_columns = ", ".join(f"{expression} AS sort_{i}" for i, (expression, _) in enumerate(order))
+    sort_order = ", ".join(f"sort_{i} {direction}" for i, (_, direction) in enumerate(order))
+    collapsed = f"""
+        SELECT {columns} {query}
+        AND (b.has_duplicates = 0 OR b.id IN (
+            SELECT listing_id FROM (
+                SELECT listing_id, ROW_NUMBER() OVER (PARTITION BY listing_key ORDER BY {sort_order}) AS listing_rank
+                FROM (SELECT b.id AS listing_id, b.canonical_url AS listing_key, {sort_columns}
+                      {query} AND b.has_duplicates = 1)
+            )
+            WHERE listing_rank = 1
+        ))
+        ORDER BY {order_sql}
+    """
+    return collapsed, params + params
 
 
 async def search_bloggers(platforms: List[str] = None, categories: List[str] = None,
                          target_age_min: int = None, target_age_max: int = None,
                          target_gender: str = None, budget_min: int = None,
                          budget_max: int = None, has_reviews: bool = None,
-                         limit: int = 10, offset: int = 0) -> List[Tuple[Blogger, User]]:
-    """Поиск блогеров по критериям"""
+                         cpm_max: int = None, order_by: str = None, text: str = None,
+                         collapse_duplicates: bool = True, limit: int = 10, offset: int = 0,
+                         lazy: bool = True) -> List[Tuple[Blogger, User]]:
+    """Поиск блогеров по критериям (по умолчанию с ленивой гидратацией)"""
     try:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            
-            # Базовый запрос
-            query = """
-                SELECT b.*, u.* FROM bloggers b
-                JOIN users u ON b.seller_id = u.id
-                WHERE 1=1
-            """
-            params = []
-            
-            # Фильтр по платформам
-            if platforms:
-                platform_conditions = []
-                for platform in platforms:
-                    platform_conditions.append("b.platforms LIKE ?")
-                    params.append(f'%"{platform}"%')
-                query += f" AND ({' OR '.join(platform_conditions)})"
-            
-            # Фильтр по категориям
-            if categories:
-                category_conditions = []
-                for category in categories:
-                    category_conditions.append("b.categories LIKE ?")
-                    params.append(f'%"{category}"%')
-                query += f" AND ({' OR '.join(category_conditions)})"
-            
-            # Фильтр по возрасту целевой аудитории
-            if target_age_min is not None and target_age_max is not None:
-                # Проверяем, что хотя бы одна возрастная категория попадает в диапазон
-                age_conditions = []
-                if target_age_min <= 17 and target_age_max >= 13:
-                    age_conditions.append("b.audience_13_17_percent > 0")
-                if target_age_min <= 24 and target_age_max >= 18:
-                    age_conditions.append("b.audience_18_24_percent > 0")
-                if target_age_min <= 35 and target_age_max >= 25:
-                    age_conditions.append("b.audience_25_35_percent > 0")
-                if target_age_max >= 35:
-                    age_conditions.append("b.audience_35_plus_percent > 0")
-                
-                if age_conditions:
-                    query += f" AND ({' OR '.join(age_conditions)})"
-            
-            # Фильтр по полу целевой аудитории
-            if target_gender and target_gender != "any":
-                if target_gender == "female":
-                    query += " AND b.female_percent > b.male_percent"
-                elif target_gender == "male":
-                    query += " AND b.male_percent > b.female_percent"
-            
-            # Фильтр по бюджету
-            if budget_min is not None or budget_max is not None:
-                budget_conditions = []
-                if budget_min is not None:
-                    budget_conditions.append("(b.price_stories >= ? OR b.price_post >= ? OR b.price_video >= ?)")
-                    params.extend([budget_min, budget_min, budget_min])
-                if budget_max is not None:
-                    budget_conditions.append("(b.price_stories <= ? OR b.price_post <= ? OR b.price_video <= ?)")
-                    params.extend([budget_max, budget_max, budget_max])
-                
-                if budget_conditions:
-                    query += f" AND ({' OR '.join(budget_conditions)})"
-            
-            # Фильтр по наличию отзывов
-            if has_reviews is not None:
-                query += " AND b.has_reviews = ?"
-                params.append(has_reviews)
-            
-            # Сортировка по рейтингу продавца
-            query += " ORDER BY u.rating DESC, b.subscribers_count DESC"
-            
-            # Лимит и смещение
-            query += " LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
-            
+        query, params = _build_search_query(
+            platforms, categories, target_age_min, target_age_max, target_gender, budget_min,
+            budget_max, has_reviews, cpm_max, order_by, text, collapse_duplicates
+        )
+        
+        # Лимит и смещение
+        query += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        
+        async with _connect() as db:
             cursor = await db.execute(query, params)
             rows = await cursor.fetchall()
             
-            results = []
-            for row in rows:
-                # Парсим платформы из JSON
-                platforms_data = []
-                if row['platforms']:
-                    try:
-                        platforms_json = json.loads(row['platforms'])
-                        platforms_data = [Platform(p) for p in platforms_json]
-                    except json.JSONDecodeError:
-                        logger.warning(f"Invalid platforms JSON for blogger {row['id']}: {row['platforms']}")
-                
-                # Парсим категории из JSON
-                categories_data = []
-                if row['categories']:
-                    try:
-                        categories_json = json.loads(row['categories'])
-                        categories_data = [BlogCategory(c) for c in categories_json]
-                    except json.JSONDecodeError:
-                        logger.warning(f"Invalid categories JSON for blogger {row['id']}: {row['categories']}")
-                
-                # Получаем роли продавца
-                seller_cursor = await db.execute("""
-                    SELECT role FROM user_roles WHERE user_id = ?
-                """, (row['seller_id'],))
-                
-                seller_role_rows = await seller_cursor.fetchall()
-                seller_roles = {UserRole(role_row['role']) for role_row in seller_role_rows}
-                
-                # Создаем объект блогера
-                blogger = Blogger(
-                    id=row['id'],
-                    seller_id=row['seller_id'],
-                    name=row['name'],
-                    url=row['url'],
-                    platforms=platforms_data,
-                    audience_13_17_percent=row['audience_13_17_percent'],
-                    audience_18_24_percent=row['audience_18_24_percent'],
-                    audience_25_35_percent=row['audience_25_35_percent'],
-                    audience_35_plus_percent=row['audience_35_plus_percent'],
-                    female_percent=row['female_percent'],
-                    male_percent=row['male_percent'],
-                    categories=categories_data,
-                    price_stories=row['price_stories'],
-                    price_post=row['price_post'],
-                    price_video=row['price_video'],
-                    has_reviews=bool(row['has_reviews']),
-                    is_registered_rkn=bool(row['is_registered_rkn']),
-                    official_payment_possible=bool(row['official_payment_possible']),
-                    subscribers_count=row['subscribers_count'],
-                    avg_views=row['avg_views'],
-                    avg_likes=row['avg_likes'],
-                    engagement_rate=row['engagement_rate'],
-                    stats_images=json.loads(row['stats_images']) if row['stats_images'] else [],
-                    description=row['description'],
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    updated_at=datetime.fromisoformat(row['updated_at'])
-                )
-                
-                # Создаем объект пользователя (продавца)
-                seller = User(
-                    id=row['seller_id'],
-                    telegram_id=row['telegram_id'],
-                    username=row['username'],
-                    first_name=row['first_name'],
-                    last_name=row['last_name'],
-                    roles=seller_roles,
-                    subscription_status=SubscriptionStatus(row['subscription_status']) if row['subscription_status'] else SubscriptionStatus.INACTIVE,
-                    subscription_end_date=datetime.fromisoformat(row['subscription_end_date']) if row['subscription_end_date'] else None,
-                    subscription_start_date=datetime.fromisoformat(row['subscription_start_date']) if row['subscription_start_date'] else None,
-                    rating=row['rating'],
-                    reviews_count=row['reviews_count'],
-                    is_vip=bool(row['is_vip']),
-                    penalty_amount=row['penalty_amount'],
-                    is_blocked=bool(row['is_blocked']),
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    updated_at=datetime.fromisoformat(row['updated_at'])
-                )
-                
-                results.append((blogger, seller))
-            
-            return results
+            to_blogger = blogger_mapper(cursor.description, lazy)
+            to_seller = user_mapper(cursor.description, lazy, prefix='u_')
+            return [(to_blogger(row), to_seller(row)) for row in rows]
             
     except Exception as e:
         logger.error(f"Ошибка при поиске блогеров: {e}")
         return []
 
 
+async def search_blogger_rows(columns: str, limit: int, **filters) -> List[tuple]:
+    """Первые limit результатов поиска в порядке search_bloggers - только колонки columns.
+    
+    Строки отдаются кортежами без сборки моделей (признаки для ранжирования).
+    """
+    query, params = _build_search_query(**filters, columns=columns)
+    async with _connect() as db:
+        cursor = await db.execute(f"{query} LIMIT ?", params + [limit])
+        return await cursor.fetchall()
+
+
+async def get_bloggers_with_sellers(blogger_ids: Sequence[int],
+                                    lazy: bool = True) -> List[Tuple[Blogger, User]]:
+    """Блогеры с продавцами в порядке blogger_ids (удаленные пропускаются)"""
+    async with _connect() as db:
+        cursor = await db.execute(f"""
+            SELECT b.*, {SELLER_COLUMNS} FROM bloggers b
+            JOIN users u ON b.seller_id = u.id
+            WHERE b.id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(blogger_ids)),))
+        rows = await cursor.fetchall()
+        to_blogger = blogger_mapper(cursor.description, lazy)
+        to_seller = user_mapper(cursor.description, lazy, prefix='u_')
+    
+    found = {pair[0].id: pair for pair in ((to_blogger(row), to_seller(row)) for row in rows)}
+    return [found[blogger_id] for blogger_id in blogger_ids if blogger_id in found]
+
+
+EXPORT_CHUNK_SIZE = 500
+ITER_BATCH_SIZE = 1000
+
+
+async def _fetch_batches(query: str, params, make_mapper: Callable[..., Callable],
+                         batch_size: int) -> AsyncIterator[list]:
+    """Результат запроса пачками по batch_size моделей.
+    
+    SQLite отдает строки по мере продвижения курсора, поэтому fetchmany держит
+    в памяти не больше одной пачки при любом размере таблицы.
+    make_mapper(cursor.description) возвращает функцию строка -> модель.
+    """
+    async with _connect() as db:
+        cursor = await db.execute(query, params)
+        to_model = make_mapper(cursor.description)
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [to_model(row) for row in rows]
+
+
+async def _iter_rows(query: str, params, make_mapper: Callable[..., Callable],
+                     batch_size: int) -> AsyncIterator:
+    """То же, что _fetch_batches, но по одной модели.
+    
+    Функции iter_* возвращают этот генератор без обертки: aclose() обертки
+    не закрыл бы вложенный генератор, и соединение осталось бы открытым.
+    """
+    async with _connect() as db:
+        cursor = await db.execute(query, params)
+        to_model = make_mapper(cursor.description)
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield to_model(row)
+
+
+def stream_search_bloggers(chunk_size: int = EXPORT_CHUNK_SIZE,
+                           **filters) -> AsyncIterator[List[Tuple[Blogger, User]]]:
+    """Все результаты поиска пачками по chunk_size (для выгрузки).
+    
+    Строки читаются курсором через fetchmany, поэтому в памяти не больше одной пачки.
+    filters - те же критерии, что и у search_bloggers.
+    """
+    def make_mapper(description):
+        to_blogger = blogger_mapper(description)
+        to_seller = user_mapper(description, prefix='u_')
+        return lambda row: (to_blogger(row), to_seller(row))
+
+    query, params = _build_search_query(**filters)
+    return _fetch_batches(query, params, make_mapper, chunk_size)
+
+
+def stream_user_bloggers(seller_id: int,
+                         chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Blogger]]:
+    """Все блогеры продавца пачками по chunk_size (для выгрузки)"""
+    query = "SELECT * FROM bloggers WHERE seller_id = ? ORDER BY created_at DESC"
+    return _fetch_batches(query, (seller_id,), blogger_mapper, chunk_size)
+
+
+def iter_bloggers(filters: dict = None, batch_size: int = ITER_BATCH_SIZE,
+                  lazy: bool = True, ids: Iterable[int] = None) -> AsyncIterator[Blogger]:
+    """Все блогеры по одному с постоянным расходом памяти (для фоновых задач).
+    
+    filters - критерии search_bloggers; без них обходится вся таблица по id.
+    ids - только блогеры с этими id (передаются одним JSON-параметром, без
+    ограничения на число переменных запроса).
+    По умолчанию отдает LazyBlogger: JSON-поля декодируются при обращении.
+    Соединение закрывается по окончании обхода; при досрочном выходе -
+    после aclose() генератора (например, через contextlib.aclosing).
+    """
+    if ids is not None:
+        query = "SELECT * FROM bloggers WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id"
+        params = (json.dumps(list(ids)),)
+    elif filters:
+        query, params = _build_search_query(**filters)
+    else:
+        query, params = "SELECT * FROM bloggers ORDER BY id", ()
+    return _iter_rows(query, params, lambda description: blogger_mapper(description, lazy), batch_size)
+
+
+def iter_users(role: UserRole = None, batch_size: int = ITER_BATCH_SIZE,
+               lazy: bool = True) -> AsyncIterator[User]:
+    """Все пользователи (или только с ролью role) по одному, по возрастанию id"""
+    query, params = USER_SELECT, []
+    if role is not None:
+        query += " WHERE EXISTS (SELECT 1 FROM user_roles r WHERE r.user_id = u.id AND r.role = ?)"
+        params.append(role.value)
+    query += " ORDER BY u.id"
+    return _iter_rows(query, params, lambda description: user_mapper(description, lazy), batch_size)
+
+
 async def update_blogger(blogger_id: int, seller_id: int, **kwargs) -> bool:
     """Обновление данных блогера"""
     # Список полей, которые можно обновлять
     allowed_fields = [
         'name', 'url', 'platforms', 'categories',
-        'price_stories', 'price_post', 'price_video',
-        'has_reviews', 'description', 'stats_images'
+        'price_stories', 'price_reels', 'price_post', 'price_video',
+        'stories_reach_min', 'stories_reach_max', 'reels_reach_min', 'reels_reach_max',
+        'subscribers_count', 'has_reviews', 'description', 'stats_images'
     ]
     
     # Фильтруем только разрешенные поля
@@ -929,6 +1588,8 @@ async def update_blogger(blogger_id: int, seller_id: int, **kwargs) -> bool:
 
     if 'stats_images' in updates:
         updates['stats_images'] = json.dumps(updates['stats_images'])
+    if 'url' in updates:
+        updates['canonical_url'] = canonical_url(updates['url'])
     
     if not updates:
         return False
@@ -939,27 +1600,185 @@ async def update_blogger(blogger_id: int, seller_id: int, **kwargs) -> bool:
     
     params = list(updates.values()) + [datetime.now().isoformat(), blogger_id, seller_id]
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         cursor = await db.execute(query, params)
         await db.commit()
-        return cursor.rowcount > 0
+    
+    if cursor.rowcount > 0:
+        _blogger_changed(blogger_id)
+        return True
+    return False
 
 
 async def delete_blogger(blogger_id: int, seller_id: int) -> bool:
     """Удаление блогера"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         cursor = await db.execute(
             "DELETE FROM bloggers WHERE id = ? AND seller_id = ?",
             (blogger_id, seller_id)
         )
         await db.commit()
-        return cursor.rowcount > 0
+    
+    if cursor.rowcount > 0:
+        _blogger_changed(blogger_id)
+        return True
+    return False
+
+
+# === СОХРАНЕННЫЕ ПОИСКИ ===
+
+MAX_SAVED_SEARCHES = 10
+
+
+async def create_search_filter(buyer_id: int, platforms: List[str] = None, categories: List[str] = None,
+                               target_age_min: int = None, target_age_max: int = None,
+                               target_gender: str = None, budget_min: int = None,
+                               budget_max: int = None, has_reviews: bool = None,
+                               cpm_max: int = None) -> Optional[SearchFilter]:
+    """Сохранение критериев поиска закупщика (аргументы как у search_bloggers).
+    
+    Возвращает None при ошибке или если достигнут лимит MAX_SAVED_SEARCHES.
+    """
+    try:
+        async with _connect() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM search_filters WHERE buyer_id = ?", (buyer_id,))
+            (count,) = await cursor.fetchone()
+            if count >= MAX_SAVED_SEARCHES:
+                return None
+            
+            cursor = await db.execute("""
+                INSERT INTO search_filters (
+                    buyer_id, platforms, categories, target_age_min, target_age_max,
+                    target_gender, budget_min, budget_max, has_reviews, cpm_max
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                buyer_id,
+                json.dumps(platforms or []),
+                json.dumps(categories or []),
+                target_age_min,
+                target_age_max,
+                target_gender,
+                budget_min,
+                budget_max,
+                has_reviews,
+                cpm_max,
+            ))
+            filter_id = cursor.lastrowid
+            await db.commit()
+            
+            cursor = await db.execute("SELECT * FROM search_filters WHERE id = ?", (filter_id,))
+            row = await cursor.fetchone()
+            return search_filter_mapper(cursor.description)(row)
+            
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении поиска: {e}")
+        return None
+
+
+async def get_buyer_search_filters(buyer_id: int) -> List[SearchFilter]:
+    """Сохраненные поиски закупщика"""
+    async with _connect() as db:
+        cursor = await db.execute(
+            "SELECT * FROM search_filters WHERE buyer_id = ? ORDER BY created_at DESC", (buyer_id,)
+        )
+        rows = await cursor.fetchall()
+        to_filter = search_filter_mapper(cursor.description)
+        return [to_filter(row) for row in rows]
+
+
+def iter_search_filters(batch_size: int = ITER_BATCH_SIZE) -> AsyncIterator[SearchFilter]:
+    """Все сохраненные поиски по одному (для построения индекса уведомлений)"""
+    return _iter_rows("SELECT * FROM search_filters ORDER BY id", (), search_filter_mapper, batch_size)
+
+
+async def delete_search_filter(filter_id: int, buyer_id: int) -> bool:
+    """Удаление сохраненного поиска (только своего)"""
+    try:
+        async with _connect() as db:
+            cursor = await db.execute(
+                "DELETE FROM search_filters WHERE id = ? AND buyer_id = ?", (filter_id, buyer_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"Ошибка при удалении сохраненного поиска: {e}")
+        return False
+
+
+# === ИСТОРИЯ ПОИСКА ===
+
+SEARCH_HISTORY_SELECT = """
+    SELECT h.id, h.buyer_id, h.filter_hash, q.filters, h.results_count, h.latency_ms, h.created_at
+    FROM search_history h
+    JOIN search_queries q ON q.filter_hash = h.filter_hash
+"""
+
+
+async def add_search_history_batch(entries: List[Tuple[int, str, str, int, int, int]]) -> int:
+    """Запись пачки выполненных поисков одной транзакцией.
+    
+    Элемент: (buyer_id, filter_hash, filters_json, results_count, latency_ms, created_at).
+    Возвращает количество записей.
+    """
+    if not entries:
+        return 0
+    
+    queries = {filter_hash: filters_json for _, filter_hash, filters_json, _, _, _ in entries}
+    async with _connect() as db:
+        try:
+            await db.executemany(
+                "INSERT OR IGNORE INTO search_queries (filter_hash, filters) VALUES (?, ?)",
+                queries.items()
+            )
+            await db.executemany("""
+                INSERT INTO search_history (buyer_id, filter_hash, results_count, latency_ms, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, [
+                (buyer_id, filter_hash, results_count, latency_ms, created_at)
+                for buyer_id, filter_hash, _, results_count, latency_ms, created_at in entries
+            ])
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    return len(entries)
+
+
+async def get_search_history(buyer_id: int, before: Optional[Tuple[int, int]] = None,
+                             limit: int = 5) -> List[SearchHistoryEntry]:
+    """История поиска закупщика от новых к старым.
+    
+    before - (created_at, id) последней показанной записи: keyset-пагинация
+    по индексу (buyer_id, created_at) без OFFSET.
+    """
+    query = SEARCH_HISTORY_SELECT + " WHERE h.buyer_id = ?"
+    params = [buyer_id]
+    if before is not None:
+        query += " AND (h.created_at, h.id) < (?, ?)"
+        params.extend(before)
+    query += " ORDER BY h.created_at DESC, h.id DESC LIMIT ?"
+    params.append(limit)
+    
+    async with _connect() as db:
+        cursor = await db.execute(query, params)
+        rows = await cursor.fetchall()
+        to_entry = search_history_mapper(cursor.description)
+        return [to_entry(row) for row in rows]
+
+
+async def get_search_history_entry(entry_id: int, buyer_id: int) -> Optional[SearchHistoryEntry]:
+    """Запись истории поиска закупщика (только своя)"""
+    async with _connect() as db:
+        cursor = await db.execute(SEARCH_HISTORY_SELECT + " WHERE h.id = ? AND h.buyer_id = ?",
+                                  (entry_id, buyer_id))
+        row = await cursor.fetchone()
+        return search_history_mapper(cursor.description)(row) if row else None
 
 
 # Функции управления подпиской
 async def get_user_subscription(user_id: int) -> Optional[Subscription]:
     """Получение активной подписки пользователя"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute("""
             SELECT * FROM subscriptions 
@@ -986,7 +1805,7 @@ async def get_user_subscription(user_id: int) -> Optional[Subscription]:
 
 async def toggle_auto_renewal(user_id: int, enable: bool) -> bool:
     """Включение/отключение автопродления подписки"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         # Сначала пробуем обновить существующую подписку
         cursor = await db.execute("""
             UPDATE subscriptions 
@@ -1035,7 +1854,7 @@ async def toggle_auto_renewal(user_id: int, enable: bool) -> bool:
 
 async def cancel_subscription(user_id: int, cancel_immediately: bool = False) -> bool:
     """Отмена подписки"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         now = datetime.now()
         
         # Сначала пробуем обновить существующую подписку
@@ -1103,7 +1922,7 @@ async def cancel_subscription(user_id: int, cancel_immediately: bool = False) ->
 
 async def get_user_payment_history(user_id: int, limit: int = 10) -> List[Subscription]:
     """Получение истории платежей пользователя"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute("""
             SELECT * FROM subscriptions 
@@ -1131,11 +1950,26 @@ async def get_user_payment_history(user_id: int, limit: int = 10) -> List[Subscr
         return history
 
 
+async def create_contact(buyer_id: int, seller_id: int, blogger_id: int) -> Optional[int]:
+    """Запись запроса контактов блогера закупщиком. Возвращает id контакта"""
+    async with _connect() as db:
+        try:
+            cursor = await db.execute(
+                "INSERT INTO contacts (buyer_id, seller_id, blogger_id) VALUES (?, ?, ?)",
+                (buyer_id, seller_id, blogger_id)
+            )
+            await db.commit()
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error creating contact: {e}")
+            return None
+
+
 # Функции для работы с жалобами и штрафами
 async def create_complaint(blogger_id: int, blogger_name: str, user_id: int, 
                           username: str, reason: str) -> bool:
     """Создать жалобу на блогера"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         try:
             await db.execute("""
                 INSERT INTO complaints (blogger_id, blogger_name, user_id, username, reason)
@@ -1150,7 +1984,7 @@ async def create_complaint(blogger_id: int, blogger_name: str, user_id: int,
 
 async def apply_penalty_to_seller(seller_id: int, amount: int = 100) -> bool:
     """Применить штраф к продавцу"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         try:
             # Увеличиваем сумму штрафов
             await db.execute("""
@@ -1165,6 +1999,7 @@ async def apply_penalty_to_seller(seller_id: int, amount: int = 100) -> bool:
             """, (amount, amount, seller_id))
             
             await db.commit()
+            _user_changed(seller_id)
             return True
         except Exception as e:
             logger.error(f"Error applying penalty: {e}")
@@ -1173,7 +2008,7 @@ async def apply_penalty_to_seller(seller_id: int, amount: int = 100) -> bool:
 
 async def pay_penalty(user_id: int, amount: int) -> bool:
     """Оплатить штраф"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         try:
             await db.execute("""
                 UPDATE users 
@@ -1190,6 +2025,7 @@ async def pay_penalty(user_id: int, amount: int) -> bool:
             """, (amount, amount, amount, user_id))
             
             await db.commit()
+            _user_changed(user_id)
             return True
         except Exception as e:
             logger.error(f"Error paying penalty: {e}")
@@ -1198,7 +2034,7 @@ async def pay_penalty(user_id: int, amount: int) -> bool:
 
 async def set_vip_status(user_id: int, is_vip: bool) -> bool:
     """Установить VIP статус пользователя"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with _connect() as db:
         try:
             await db.execute("""
                 UPDATE users 
@@ -1207,59 +2043,166 @@ async def set_vip_status(user_id: int, is_vip: bool) -> bool:
             """, (is_vip, user_id))
             
             await db.commit()
+            _user_changed(user_id)
             return True
         except Exception as e:
             logger.error(f"Error setting VIP status: {e}")
             return False
 
 
+LEADERBOARD_WHERE = """
+    WHERE u.is_blocked = 0
+      AND EXISTS (SELECT 1 FROM user_roles r WHERE r.user_id = u.id AND r.role = 'seller')
+"""
+
+
 async def get_top_sellers(limit: int = 10) -> List[User]:
-    """Получить топ продавцов по рейтингу"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("""
-            SELECT * FROM users 
-            WHERE role = 'seller' AND is_blocked = 0
-            ORDER BY is_vip DESC, rating DESC, reviews_count DESC
+    """Получить топ продавцов по рейтингу (полная сортировка в SQL).
+    
+    Для частых запросов используйте utils.leaderboard.seller_leaderboard.
+    """
+    async with _connect() as db:
+        cursor = await db.execute(f"""
+            {USER_SELECT}
+            {LEADERBOARD_WHERE}
+            ORDER BY u.is_vip DESC, u.rating DESC, u.reviews_count DESC, u.id
             LIMIT ?
         """, (limit,))
         
         rows = await cursor.fetchall()
-        sellers = []
-        for row in rows:
-            sellers.append(User(
-                id=row['id'],
-                telegram_id=row['telegram_id'],
-                username=row['username'],
-                first_name=row['first_name'],
-                last_name=row['last_name'],
-                role=UserRole(row['role']),
-                subscription_status=SubscriptionStatus(row['subscription_status']) if row['subscription_status'] else SubscriptionStatus.INACTIVE,
-                subscription_end_date=datetime.fromisoformat(row['subscription_end_date']) if row['subscription_end_date'] else None,
-                rating=row['rating'],
-                reviews_count=row['reviews_count'],
-                is_vip=bool(row['is_vip']) if 'is_vip' in row.keys() else False,
-                penalty_amount=row['penalty_amount'] if 'penalty_amount' in row.keys() else 0,
-                is_blocked=bool(row['is_blocked']) if 'is_blocked' in row.keys() else False,
-                created_at=datetime.fromisoformat(row['created_at']),
-                updated_at=datetime.fromisoformat(row['updated_at'])
-            ))
-        
-        return sellers
+        to_user = user_mapper(cursor.description)
+        return [to_user(row) for row in rows]
+
+
+async def get_leaderboard_sellers(user_ids: Iterable[int] = None) -> List[User]:
+    """Продавцы, участвующие в рейтинге (все или только из user_ids), без сортировки"""
+    query = f"{USER_SELECT} {LEADERBOARD_WHERE}"
+    params = []
+    if user_ids is not None:
+        params = list(user_ids)
+        if not params:
+            return []
+        query += f" AND u.id IN ({', '.join('?' * len(params))})"
+    
+    async with _connect() as db:
+        cursor = await db.execute(query, params)
+        rows = await cursor.fetchall()
+        to_user = user_mapper(cursor.description, lazy=True)
+        return [to_user(row) for row in rows]
+
+
+# === РЕЙТИНГ ПРОДАВЦОВ ===
+# Оценки контактов применяются к users инкрементально: rating_sum и
+# reviews_count - бегущие сумма и количество оценок продавца по контактам
+# (contacts.rating_given - единственный источник оценок, таблица reviews
+# ботом не заполняется), rating - байесовски сглаженная оценка
+# (RATING_PRIOR_WEIGHT виртуальных оценок RATING_PRIOR_MEAN), поэтому одна
+# оценка «5» не поднимает продавца выше продавца с сотней хороших оценок.
+# Других счетчиков оценок нет: экран статистики и поиск читают users.
+
+RATING_PRIOR_MEAN = 4.0
+RATING_PRIOR_WEIGHT = 5
+
+RATING_APPLY = f"""
+    UPDATE users SET
+        rating_sum = rating_sum + :score,
+        reviews_count = reviews_count + 1,
+        rating = ({RATING_PRIOR_WEIGHT} * {RATING_PRIOR_MEAN} + rating_sum + :score)
+                 / ({RATING_PRIOR_WEIGHT} + reviews_count + 1),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = :user_id
+"""
+
+# Все оценки пользователей - оценки контактов
+RATINGS_SOURCE = """
+    SELECT seller_id AS user_id, rating_given AS score FROM contacts WHERE rating_given IS NOT NULL
+"""
+
+RATING_RECOMPUTE = f"""
+    SELECT u.id, COALESCE(SUM(r.score), 0), COUNT(r.score), u.rating_sum, u.reviews_count, u.rating
+    FROM users u
+    LEFT JOIN ({RATINGS_SOURCE}) r ON r.user_id = u.id
+    GROUP BY u.id
+"""
+
+
+def bayesian_rating(rating_sum: int, count: int) -> float:
+    """Сглаженный рейтинг по сумме и количеству оценок"""
+    return (RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN + rating_sum) / (RATING_PRIOR_WEIGHT + count)
 
 
-async def update_user_rating(user_id: int, new_rating: float) -> bool:
-    """Обновить рейтинг пользователя"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+async def init_ratings(db):
+    """Миграция: колонка rating_sum и однократный пересчет рейтингов"""
+    cursor = await db.execute("PRAGMA table_info(users)")
+    columns = [row[1] for row in await cursor.fetchall()]
+    if 'rating_sum' not in columns:
+        await db.execute("ALTER TABLE users ADD COLUMN rating_sum INTEGER DEFAULT 0")
+        logger.info("Added rating_sum column to users table")
+        updated = await _recompute_ratings(db, fix=True)
+        logger.info(f"Рейтинги пересчитаны по оценкам контактов: {len(updated)} пользователей")
+
+
+async def _apply_rating(db, user_id: int, score: int):
+    """O(1) обновление рейтинга в текущей транзакции"""
+    await db.execute(RATING_APPLY, {'score': score, 'user_id': user_id})
+
+
+async def rate_contact(contact_id: int, buyer_id: int, rating: int, deal_completed: bool = None) -> bool:
+    """Оценка продавца по контакту (один раз) и обновление рейтинга одной транзакцией"""
+    if not 1 <= rating <= 5:
+        return False
+    
+    async with _connect() as db:
         try:
-            await db.execute("""
-                UPDATE users 
-                SET rating = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (new_rating, user_id))
+            # Проверка и отметка оценки одним запросом: из двух одновременных
+            # нажатий строку вернет только первое
+            cursor = await db.execute("""
+                UPDATE contacts SET rating_given = ?, deal_completed = ?
+                WHERE id = ? AND buyer_id = ? AND rating_given IS NULL
+                RETURNING seller_id
+            """, (rating, deal_completed, contact_id, buyer_id))
+            row = await cursor.fetchone()
+            await cursor.close()
+            if not row:
+                await db.rollback()
+                return False
             
+            await _apply_rating(db, row[0], rating)
             await db.commit()
+            _user_changed(row[0])
             return True
         except Exception as e:
-            logger.error(f"Error updating user rating: {e}")
-            return False 
\ No newline at end of file
+            await db.rollback()
+            logger.error(f"Ошибка при оценке контакта: {e}")
+            return False
+
+
+async def _recompute_ratings(db, fix: bool) -> List[int]:
+    """Пересчет рейтингов; возвращает id пользователей с расхождениями"""
+    cursor = await db.execute(RATING_RECOMPUTE)
+    mismatched = []
+    for user_id, rating_sum, count, stored_sum, stored_count, stored_rating in await cursor.fetchall():
+        rating = bayesian_rating(rating_sum, count)
+        if (rating_sum, count) != (stored_sum, stored_count) or stored_rating is None \
+                or abs(rating - stored_rating) > 1e-9:
+            mismatched.append((rating_sum, count, rating, user_id))
+    
+    if fix and mismatched:
+        await db.executemany(
+            "UPDATE users SET rating_sum = ?, reviews_count = ?, rating = ? WHERE id = ?", mismatched
+        )
+    return [user_id for _, _, _, user_id in mismatched]
+
+
+async def recompute_ratings(fix: bool = True) -> int:
+    """Полный пересчет рейтингов по всем оценкам (проверка инкрементальных обновлений).
+    
+    Возвращает количество пользователей, у которых сохраненные значения
+    расходились с пересчитанными; при fix=True они исправляются.
+    """
+    async with _connect() as db:
+        mismatched = await _recompute_ratings(db, fix)
+        await db.commit()
+    if fix:
+        _user_changed(*mismatched)
+    return len(mismatched)
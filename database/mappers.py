@@ -0,0 +1,179 @@
+"""Преобразование строк БД в модели.
+
+Позиции колонок определяются один раз для каждого cursor.description, после
+чего для этого набора колонок компилируется функция сборки модели из
+кортежа (без aiosqlite.Row и без проверок 'x' in row.keys() на каждую строку).
+
+Пример:
+    cursor = await db.execute("SELECT * FROM bloggers WHERE seller_id = ?", (seller_id,))
+    to_blogger = blogger_mapper(cursor.description, lazy=True)
+    bloggers = [to_blogger(row) for row in await cursor.fetchall()]
+
+Колонки другой таблицы в JOIN выбираются с префиксом (см. select_columns)
+и собираются маппером с тем же prefix.
+"""
+import json
+from dataclasses import fields, MISSING
+from typing import Callable, Dict, Sequence, Tuple
+
+from .models import (
+    User, Blogger, LazyUser, LazyBlogger, SearchFilter, SearchHistoryEntry, UserStats,
+    parse_platforms, parse_categories, parse_json_list, parse_datetime,
+    parse_timestamp, parse_subscription_status, parse_roles, parse_optional_bool,
+    parse_unix_time,
+)
+
+# Преобразования значений колонок для полного (не ленивого) режима
+USER_CONVERTERS = {
+    'roles': parse_roles,
+    'subscription_status': parse_subscription_status,
+    'subscription_end_date': parse_datetime,
+    'subscription_start_date': parse_datetime,
+    'is_vip': bool,
+    'is_blocked': bool,
+    'created_at': parse_timestamp,
+    'updated_at': parse_timestamp,
+}
+
+BLOGGER_CONVERTERS = {
+    'platforms': parse_platforms,
+    'categories': parse_categories,
+    'stats_images': parse_json_list,
+    'has_reviews': bool,
+    'is_registered_rkn': bool,
+    'official_payment_possible': bool,
+    'created_at': parse_timestamp,
+    'updated_at': parse_timestamp,
+}
+
+SEARCH_FILTER_CONVERTERS = {
+    'platforms': parse_platforms,
+    'categories': parse_categories,
+    'has_reviews': parse_optional_bool,
+    'is_registered_rkn': parse_optional_bool,
+    'official_payment_required': parse_optional_bool,
+    'created_at': parse_timestamp,
+}
+
+SEARCH_HISTORY_CONVERTERS = {
+    'filters': json.loads,
+    'created_at': parse_unix_time,
+}
+
+USER_STATS_CONVERTERS = {
+    'last_review_at': parse_datetime,
+}
+
+# Колонки старой схемы, из которых берется значение, если основная пуста
+FALLBACK_COLUMNS = {
+    'platforms': 'platform',
+}
+
+# Подзапрос ролей пользователя одной строкой (для parse_roles)
+ROLES_SUBQUERY = "(SELECT GROUP_CONCAT(role) FROM user_roles WHERE user_id = {alias}.id)"
+
+_cache: Dict[Tuple, Callable] = {}
+
+
+def select_columns(model, alias: str, prefix: str = '') -> str:
+    """Список колонок модели для SELECT с префиксом (для JOIN).
+
+    Для User роли подставляются подзапросом, отдельный запрос на строку не нужен.
+    """
+    columns = []
+    for f in fields(model):
+        if f.name == 'roles':
+            columns.append(f"{ROLES_SUBQUERY.format(alias=alias)} AS {prefix}roles")
+        else:
+            columns.append(f"{alias}.{f.name} AS {prefix}{f.name}")
+    return ", ".join(columns)
+
+
+def compile_mapper(model, converters: dict, names: Sequence[str], prefix: str = '') -> Callable[[tuple], object]:
+    """Компиляция функции row -> model для заданного порядка колонок.
+
+    Если у модели есть LAZY_FIELDS (LazyBlogger, LazyUser), эти поля
+    не декодируются: сырое значение кладется в слот _raw_<поле>.
+    Поля без колонки в выборке получают значение по умолчанию.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    lazy_fields = getattr(model, 'LAZY_FIELDS', ())
+    namespace = {'model': model, 'new': object.__new__}
+    args = []
+    assignments = []
+
+    for f in fields(model):
+        name = f.name
+        position = index.get(prefix + name)
+        fallback = index.get(prefix + FALLBACK_COLUMNS.get(name, ''))
+
+        if position is None and fallback is not None:
+            value = f"r[{fallback}]"
+        elif position is not None and fallback is not None:
+            value = f"(r[{position}] or r[{fallback}])"
+        elif position is not None:
+            value = f"r[{position}]"
+        else:
+            value = None
+
+        if name in lazy_fields:
+            assignments.append(f"o._raw_{name} = {value}")
+            continue
+
+        if value is not None and name in converters:
+            namespace[f"c_{name}"] = converters[name]
+            value = f"c_{name}({value})"
+
+        if lazy_fields:
+            if value is None:
+                if f.default_factory is not MISSING:
+                    namespace[f"f_{name}"] = f.default_factory
+                    value = f"f_{name}()"
+                else:
+                    namespace[f"d_{name}"] = f.default
+                    value = f"d_{name}"
+            assignments.append(f"o.{name} = {value}")
+        elif value is not None:
+            args.append(f"{name}={value}")
+
+    if lazy_fields:
+        body = "    o = new(model)\n" + "".join(f"    {line}\n" for line in assignments) + "    return o\n"
+    else:
+        body = f"    return model({', '.join(args)})\n"
+
+    exec(f"def map_row(r):\n{body}", namespace)
+    return namespace['map_row']
+
+
+def _cached_mapper(model, converters: dict, description, prefix: str) -> Callable[[tuple], object]:
+    names = tuple(column[0] for column in description)
+    key = (model, prefix, names)
+    mapper = _cache.get(key)
+    if mapper is None:
+        mapper = _cache[key] = compile_mapper(model, converters, names, prefix)
+    return mapper
+
+
+def user_mapper(description, lazy: bool = False, prefix: str = '') -> Callable[[tuple], User]:
+    """Маппер строк в User/LazyUser для cursor.description"""
+    return _cached_mapper(LazyUser if lazy else User, USER_CONVERTERS, description, prefix)
+
+
+def blogger_mapper(description, lazy: bool = False, prefix: str = '') -> Callable[[tuple], Blogger]:
+    """Маппер строк в Blogger/LazyBlogger для cursor.description"""
+    return _cached_mapper(LazyBlogger if lazy else Blogger, BLOGGER_CONVERTERS, description, prefix)
+
+
+def search_filter_mapper(description) -> Callable[[tuple], SearchFilter]:
+    """Маппер строк search_filters в SearchFilter"""
+    return _cached_mapper(SearchFilter, SEARCH_FILTER_CONVERTERS, description, '')
+
+
+def search_history_mapper(description) -> Callable[[tuple], SearchHistoryEntry]:
+    """Маппер строк search_history (с колонкой filters из search_queries) в SearchHistoryEntry"""
+    return _cached_mapper(SearchHistoryEntry, SEARCH_HISTORY_CONVERTERS, description, '')
+
+
+def user_stats_mapper(description) -> Callable[[tuple], UserStats]:
+    """Маппер строк user_stats в UserStats"""
+    return _cached_mapper(UserStats, USER_STATS_CONVERTERS, description, '')
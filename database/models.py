@@ -1,5 +1,6 @@
+import json
 from dataclasses import dataclass, field
-from typing import Optional, List, Set
+from typing import Optional, List, Set, Callable, Any
 from datetime import datetime
 from enum import Enum
 
@@ -66,7 +67,7 @@ class BlogCategory(Enum):
         return names.get(self.value, self.value)
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     """Модель пользователя с поддержкой множественных ролей"""
     id: int
@@ -115,7 +116,25 @@ class User:
         return bool(self.roles)  # Любая роль может редактировать блогеров
 
 
-@dataclass
+# Возрастные группы аудитории: (от, до, поле блогера). По ним строятся условия search_bloggers
+AGE_BUCKETS = (
+    (13, 17, 'audience_13_17_percent'),
+    (18, 24, 'audience_18_24_percent'),
+    (25, 35, 'audience_25_35_percent'),
+    (35, 200, 'audience_35_plus_percent'),
+)
+
+
+# Форматы размещения: (тип в blogger_offers, колонка цены блогера). По ним работает фильтр бюджета
+OFFER_PRICE_COLUMNS = (
+    ('stories', 'price_stories'),
+    ('reels', 'price_reels'),
+    ('post', 'price_post'),
+    ('video', 'price_video'),
+)
+
+
+@dataclass(slots=True)
 class Blogger:
     """Модель блогера"""
     id: int
@@ -140,9 +159,19 @@ class Blogger:
     # Цены
     price_stories: Optional[int] = None  # Цена за 4 истории
     price_reels: Optional[int] = None  # Цена за рилс
+    price_post: Optional[int] = None  # Устаревшие колонки, остаются в старых БД
+    price_video: Optional[int] = None
+    
+    # Дополнительная информация
+    has_reviews: bool = False
+    is_registered_rkn: bool = False
+    official_payment_possible: bool = False
     
     # Статистика (будет разной для разных платформ)
     subscribers_count: Optional[int] = None
+    avg_views: Optional[int] = None
+    avg_likes: Optional[int] = None
+    engagement_rate: Optional[float] = None
     
     # Охваты сторис (вилка)
     stories_reach_min: Optional[int] = None  # Минимальный охват сторис
@@ -151,6 +180,11 @@ class Blogger:
     # Охваты рилс (вилка)
     reels_reach_min: Optional[int] = None  # Минимальный охват рилс
     reels_reach_max: Optional[int] = None  # Максимальный охват рилс
+    
+    # CPM, ₽ за 1000 просмотров (генерируемые колонки БД, только для чтения)
+    cpm_stories: Optional[float] = None
+    cpm_reels: Optional[float] = None
+    cpm: Optional[float] = None  # Лучший из двух форматов
 
     # Ссылки на изображения со статистикой
     stats_images: List[str] = field(default_factory=list)
@@ -159,6 +193,15 @@ class Blogger:
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
     
+    def get_audience_age_ranges(self) -> List[tuple]:
+        """Возрастные группы (от, до), в которых у блогера есть аудитория"""
+        return [(low, high) for low, high, attr in AGE_BUCKETS if (getattr(self, attr) or 0) > 0]
+    
+    def get_budget_prices(self) -> List[int]:
+        """Цены, по которым работает фильтр бюджета в поиске (см. OFFER_PRICE_COLUMNS)"""
+        prices = (getattr(self, column) for _, column in OFFER_PRICE_COLUMNS)
+        return [price for price in prices if price is not None]
+    
     def validate_reach_ranges(self) -> bool:
         """Проверка корректности диапазонов охватов"""
         # Проверка диапазона сторис
@@ -193,11 +236,180 @@ class Blogger:
         else:
             return "Не указано"
     
+    def get_cpm_summary(self) -> str:
+        """CPM по форматам для карточки блогера"""
+        parts = []
+        if self.cpm_stories is not None:
+            parts.append(f"сторис {self.cpm_stories:,.0f}₽")
+        if self.cpm_reels is not None:
+            parts.append(f"рилс {self.cpm_reels:,.0f}₽")
+        return ", ".join(parts) if parts else "Не указано"
+    
+    def get_age_categories_summary(self) -> str:
+        """Возрастные группы аудитории с долями для карточки блогера"""
+        parts = [
+            f"{low}+ ({getattr(self, attr)}%)" if high >= 200 else f"{low}-{high} ({getattr(self, attr)}%)"
+            for low, high, attr in AGE_BUCKETS if (getattr(self, attr) or 0) > 0
+        ]
+        return ", ".join(parts) if parts else "Не указано"
+    
     def get_platforms_summary(self) -> str:
         """Получить сводку по платформам"""
         return ", ".join([platform.value for platform in self.platforms]) if self.platforms else "Не указано"
 
 
+# === ДЕКОДИРОВАНИЕ ЗНАЧЕНИЙ ИЗ БД ===
+
+def parse_platforms(raw: Optional[str]) -> List[Platform]:
+    """JSON массив платформ -> список Platform (поддерживает старое поле с одной платформой)"""
+    if not raw:
+        return []
+    try:
+        values = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        values = [raw]
+    if isinstance(values, str):
+        values = [values]
+    platforms = []
+    for value in values:
+        try:
+            platforms.append(Platform(value))
+        except ValueError:
+            pass
+    return platforms
+
+
+def parse_categories(raw: Optional[str]) -> List[BlogCategory]:
+    """JSON массив категорий -> список BlogCategory"""
+    if not raw:
+        return []
+    try:
+        values = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    categories = []
+    for value in values if isinstance(values, list) else []:
+        try:
+            categories.append(BlogCategory(value))
+        except ValueError:
+            pass
+    return categories
+
+
+def parse_json_list(raw: Optional[str]) -> list:
+    """JSON массив строк (учитывает старые записи с двойным JSON-кодированием)"""
+    if not raw:
+        return []
+    try:
+        value = json.loads(raw)
+        if isinstance(value, str):
+            value = json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return value if isinstance(value, list) else []
+
+
+def parse_datetime(raw: Optional[str]) -> Optional[datetime]:
+    """Дата из БД или None"""
+    return datetime.fromisoformat(raw) if raw else None
+
+
+def parse_timestamp(raw: Optional[str]) -> datetime:
+    """created_at/updated_at: при отсутствии значения - текущее время"""
+    return datetime.fromisoformat(raw) if raw else datetime.now()
+
+
+def parse_unix_time(raw: Optional[int]) -> datetime:
+    """Время в секундах unix (компактные таблицы, например search_history)"""
+    return datetime.fromtimestamp(raw) if raw is not None else datetime.now()
+
+
+def parse_subscription_status(raw: Optional[str]) -> SubscriptionStatus:
+    """Статус подписки из БД (по умолчанию неактивна)"""
+    return SubscriptionStatus(raw) if raw else SubscriptionStatus.INACTIVE
+
+
+def parse_optional_bool(raw) -> Optional[bool]:
+    """BOOLEAN колонка, где NULL означает «не важно»"""
+    return None if raw is None else bool(raw)
+
+
+def parse_roles(raw: Optional[str]) -> Set[UserRole]:
+    """Роли из GROUP_CONCAT(role) -> множество UserRole"""
+    return {UserRole(role) for role in raw.split(',')} if raw else set()
+
+
+# === ЛЕНИВАЯ ГИДРАТАЦИЯ ===
+
+class _LazyField:
+    """Поле, которое декодируется из сырого значения БД при первом обращении.
+    
+    Декодированное значение сохраняется в слот базовой модели, поэтому
+    повторное обращение стоит как обычное чтение атрибута.
+    """
+    __slots__ = ('decode', 'name', 'raw_name', 'slot')
+
+    def __init__(self, decode: Callable[[Any], Any]):
+        self.decode = decode
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.raw_name = f"_raw_{name}"
+        # Слот с тем же именем объявлен в базовой (slotted) модели
+        self.slot = next(klass.__dict__[name] for klass in owner.__mro__[1:] if name in klass.__dict__)
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            return self.slot.__get__(obj, objtype)
+        except AttributeError:
+            value = self.decode(getattr(obj, self.raw_name))
+            self.slot.__set__(obj, value)
+            setattr(obj, self.raw_name, None)
+            return value
+
+    def __set__(self, obj, value):
+        self.slot.__set__(obj, value)
+
+
+class LazyUser(User):
+    """Пользователь, у которого статус подписки и даты декодируются при первом обращении.
+    
+    Создается мапперами из database/mappers.py: вместо ленивого поля X
+    заполняется слот _raw_X сырым значением из БД.
+    """
+    __slots__ = ('_raw_subscription_status', '_raw_subscription_end_date', '_raw_subscription_start_date',
+                 '_raw_created_at', '_raw_updated_at')
+
+    subscription_status = _LazyField(parse_subscription_status)
+    subscription_end_date = _LazyField(parse_datetime)
+    subscription_start_date = _LazyField(parse_datetime)
+    created_at = _LazyField(parse_timestamp)
+    updated_at = _LazyField(parse_timestamp)
+
+    LAZY_FIELDS = ('subscription_status', 'subscription_end_date', 'subscription_start_date',
+                   'created_at', 'updated_at')
+
+
+class LazyBlogger(Blogger):
+    """Блогер, у которого JSON-поля и даты декодируются при первом обращении.
+    
+    Используется для списков (результаты поиска, "Мои блогеры"), где чаще всего
+    нужны только id и имя.
+    """
+    __slots__ = ('_raw_platforms', '_raw_categories', '_raw_stats_images',
+                 '_raw_created_at', '_raw_updated_at')
+
+    platforms = _LazyField(parse_platforms)
+    categories = _LazyField(parse_categories)
+    stats_images = _LazyField(parse_json_list)
+    created_at = _LazyField(parse_timestamp)
+    updated_at = _LazyField(parse_timestamp)
+
+    LAZY_FIELDS = ('platforms', 'categories', 'stats_images', 'created_at', 'updated_at')
+
+
 @dataclass
 class SearchFilter:
     """Модель фильтра поиска для закупщиков"""
@@ -216,6 +428,7 @@ class SearchFilter:
     # Бюджет (кратный 1000)
     budget_min: Optional[int] = None  # Минимальный бюджет
     budget_max: Optional[int] = None  # Максимальный бюджет
+    cpm_max: Optional[int] = None  # Максимальный CPM, ₽ за 1000 просмотров
     
     # Дополнительные критерии
     has_reviews: Optional[bool] = None
@@ -223,6 +436,102 @@ class SearchFilter:
     official_payment_required: Optional[bool] = None
     
     created_at: datetime = field(default_factory=datetime.now)
+    
+    def matches(self, blogger: "Blogger") -> bool:
+        """Подходит ли блогер под фильтр (те же условия, что и SQL в search_bloggers)"""
+        if self.platforms and not any(platform in blogger.platforms for platform in self.platforms):
+            return False
+        if self.categories and not any(category in blogger.categories for category in self.categories):
+            return False
+        
+        if self.target_age_min is not None and self.target_age_max is not None:
+            if not any(
+                self.target_age_min <= high and self.target_age_max >= low
+                for low, high in blogger.get_audience_age_ranges()
+            ):
+                return False
+        
+        if self.target_gender == "female" and not (
+                blogger.female_percent is not None and blogger.male_percent is not None
+                and blogger.female_percent > blogger.male_percent):
+            return False
+        if self.target_gender == "male" and not (
+                blogger.female_percent is not None and blogger.male_percent is not None
+                and blogger.male_percent > blogger.female_percent):
+            return False
+        
+        if self.budget_min is not None or self.budget_max is not None:
+            low = self.budget_min if self.budget_min is not None else float('-inf')
+            high = self.budget_max if self.budget_max is not None else float('inf')
+            if not any(low <= price <= high for price in blogger.get_budget_prices()):
+                return False
+        
+        if self.cpm_max is not None and (blogger.cpm is None or blogger.cpm > self.cpm_max):
+            return False
+        
+        if self.has_reviews is not None and bool(blogger.has_reviews) != self.has_reviews:
+            return False
+        return True
+    
+    def get_summary(self) -> str:
+        """Краткое описание критериев для списка сохраненных поисков"""
+        parts = []
+        if self.platforms:
+            parts.append(", ".join(platform.value for platform in self.platforms))
+        if self.categories:
+            parts.append(", ".join(category.get_russian_name() for category in self.categories))
+        if self.target_age_min is not None and self.target_age_max is not None:
+            parts.append(f"{self.target_age_min}-{self.target_age_max} лет")
+        if self.target_gender in ("female", "male"):
+            parts.append("женщины" if self.target_gender == "female" else "мужчины")
+        if self.budget_min is not None or self.budget_max is not None:
+            parts.append(f"{self.budget_min or 0:,}-{self.budget_max:,}₽" if self.budget_max is not None
+                         else f"от {self.budget_min:,}₽")
+        if self.cpm_max is not None:
+            parts.append(f"CPM до {self.cpm_max:,}₽")
+        if self.has_reviews:
+            parts.append("с отзывами")
+        return " • ".join(parts) if parts else "Любые блогеры"
+
+
+@dataclass
+class SearchHistoryEntry:
+    """Выполненный поиск закупщика (критерии хранятся один раз на filter_hash)"""
+    id: int
+    buyer_id: int
+    filter_hash: str
+    filters: dict = field(default_factory=dict)  # Аргументы search_bloggers
+    results_count: int = 0
+    latency_ms: int = 0
+    created_at: datetime = field(default_factory=datetime.now)
+    
+    def get_search_filter(self) -> SearchFilter:
+        """Критерии записи в виде SearchFilter"""
+        criteria = {key: value for key, value in self.filters.items() if key not in ('platforms', 'categories')}
+        return SearchFilter(
+            id=0,
+            buyer_id=self.buyer_id,
+            platforms=[Platform(value) for value in self.filters.get('platforms') or []],
+            categories=[BlogCategory(value) for value in self.filters.get('categories') or []],
+            **criteria
+        )
+    
+    def get_cursor(self) -> str:
+        """Позиция записи для постраничного просмотра (created_at_id)"""
+        return f"{int(self.created_at.timestamp())}_{self.id}"
+
+
+@dataclass
+class UserStats:
+    """Счетчики пользователя (таблица user_stats, обновляется триггерами)"""
+    user_id: int
+    bloggers_count: int = 0
+    searches_count: int = 0
+    contacts_requested: int = 0  # Закупщик запросил контакты
+    contacts_received: int = 0  # Запросы контактов блогеров продавца
+    complaints_filed: int = 0
+    complaints_received: int = 0  # Жалобы на блогеров продавца
+    last_review_at: Optional[datetime] = None  # Последняя оценка контакта
 
 
 @dataclass
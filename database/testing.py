@@ -0,0 +1,46 @@
+"""Отдельная БД в памяти для тестов и бенчмарков.
+
+    from database.testing import create_test_database
+
+    dsn = await create_test_database()   # текущая БД процесса - новая, с полной схемой
+    user = await create_user(1, "seller")
+
+Первый вызов в процессе выполняет init_db на БД-шаблоне в памяти. Каждый
+следующий создает новую общую БД в памяти и копирует в нее шаблон через
+sqlite3 backup API - это миллисекунды вместо повторного прогона миграций.
+Имена БД включают pid, поэтому параллельные процессы (воркеры тестов)
+не видят данных друг друга и не трогают bot_database.db.
+
+В режиме shared-cache SQLite блокирует таблицы, а не файл, и при
+конфликте сразу возвращает "database table is locked" без ожидания -
+тесты с одновременной записью лучше запускать на файловой БД.
+"""
+import itertools
+import os
+import sqlite3
+from typing import Optional
+
+from . import database
+from .database import MEMORY_DSN_PREFIX, configure_database, init_db
+
+_template: Optional[sqlite3.Connection] = None
+_counter = itertools.count(1)
+
+
+async def create_test_database(name: str = None) -> str:
+    """Новая БД в памяти с примененными миграциями; становится текущей. Возвращает DSN"""
+    global _template
+    if _template is None:
+        configure_database(f"{MEMORY_DSN_PREFIX}template-{os.getpid()}")
+        await init_db()
+        # Отдельное соединение держит шаблон после переключения на другую БД
+        _template = sqlite3.connect(database.DATABASE_PATH, uri=True, check_same_thread=False)
+
+    dsn = f"{MEMORY_DSN_PREFIX}{name or f'test-{os.getpid()}-{next(_counter)}'}"
+    configure_database(dsn)
+    target = sqlite3.connect(database.DATABASE_PATH, uri=True)
+    try:
+        _template.backup(target)
+    finally:
+        target.close()
+    return dsn
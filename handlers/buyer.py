@@ -1,18 +1,33 @@
+import html
 import logging
+import os
+import time
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import StateFilter
+from aiogram.filters import StateFilter, Command, CommandObject
 
-from database.database import get_user, search_bloggers, get_blogger, create_complaint
-from database.models import UserRole, SubscriptionStatus
+from database.database import (
+    get_user, create_complaint, search_bloggers, fts_query,
+    create_search_filter, get_buyer_search_filters, delete_search_filter, MAX_SAVED_SEARCHES,
+    get_search_history, get_search_history_entry, get_user_stats, create_contact, rate_contact
+)
+from database.models import UserRole, SubscriptionStatus, Platform, BlogCategory
 from bot.keyboards import (
     get_category_keyboard, get_yes_no_keyboard, 
     get_search_results_keyboard, get_blogger_selection_keyboard,
-    get_main_menu_buyer
+    get_main_menu_buyer, get_saved_searches_keyboard, get_search_history_keyboard,
+    get_contact_rating_keyboard
 )
 from bot.states import BuyerStates, ComplaintStates
 from utils.google_sheets import log_complaint_to_sheets
+from utils.blogger_export import export_search_results
+from utils.blogger_cache import blogger_cache
+from utils.card_cache import blogger_card_cache, BUYER_CARD
+from utils.saved_searches import saved_search_index
+from utils.search_history import search_history_writer
+from utils.leaderboard import seller_leaderboard
+from utils.ranking import search_bloggers_ranked
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -40,18 +55,125 @@ async def universal_show_search_history(message: Message, state: FSMContext):
     if not user.has_role(UserRole.BUYER):
         await message.answer("❌ Эта функция доступна только закупщикам.\n\nИспользуйте ⚙️ Настройки → Сменить роль для добавления роли закупщика.")
         return
-    await message.answer(
-        "📋 <b>История поиска</b>\n\n"
-        "📊 Функция находится в разработке.\n\n"
-        "Скоро здесь будет отображаться:\n"
-        "• История ваших поисков\n"
-        "• Сохраненные результаты\n"
-        "• Избранные блогеры\n\n"
-        "🔍 Пока вы можете использовать поиск блогеров.",
+    
+    text, keyboard = await render_search_history(user.id)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+HISTORY_PAGE_SIZE = 5
+
+
+async def render_search_history(buyer_id: int, before=None):
+    """Текст и клавиатура страницы истории поиска (before - позиция последней показанной записи)"""
+    # Поиски, еще не записанные из буфера, должны сразу попасть в историю
+    await search_history_writer.flush()
+    entries = await get_search_history(buyer_id, before=before, limit=HISTORY_PAGE_SIZE + 1)
+    has_more = len(entries) > HISTORY_PAGE_SIZE
+    entries = entries[:HISTORY_PAGE_SIZE]
+    
+    text = "📋 <b>История поиска</b>\n\n"
+    if not entries:
+        text += "Вы еще не выполняли поиск.\n\nИспользуйте 🔍 Поиск блогеров, чтобы найти подходящих блогеров."
+    for index, entry in enumerate(entries, start=1):
+        text += f"{index}. {entry.get_search_filter().get_summary()}\n"
+        text += f"    🔎 Найдено: {entry.results_count} • {entry.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
+    
+    next_cursor = entries[-1].get_cursor() if has_more else None
+    return text, get_search_history_keyboard(entries, next_cursor, is_first_page=before is None)
+
+
+@router.callback_query(F.data.startswith("history_page"))
+async def handle_search_history_page(callback: CallbackQuery):
+    """Листание истории поиска"""
+    user = await get_user(callback.from_user.id)
+    if not user or not user.has_role(UserRole.BUYER):
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    before = None
+    if callback.data != "history_page":
+        created_at, entry_id = callback.data.split("_")[2:4]
+        before = (int(created_at), int(entry_id))
+    
+    text, keyboard = await render_search_history(user.id, before)
+    await callback.answer()
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(F.data.startswith("repeat_search_"))
+async def handle_repeat_search(callback: CallbackQuery, state: FSMContext):
+    """Повтор поиска из истории без повторного ввода критериев"""
+    entry_id = int(callback.data.split("_")[2])
+    user = await get_user(callback.from_user.id)
+    if not user or not user.has_role(UserRole.BUYER):
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    if user.subscription_status not in [
+        SubscriptionStatus.ACTIVE,
+        SubscriptionStatus.AUTO_RENEWAL_OFF,
+        SubscriptionStatus.CANCELLED
+    ]:
+        await callback.answer("💳 Для поиска блогеров необходима активная подписка", show_alert=True)
+        return
+    
+    entry = await get_search_history_entry(entry_id, user.id)
+    if not entry:
+        await callback.answer("❌ Запись истории не найдена")
+        return
+    
+    search = entry.get_search_filter()
+    await state.clear()
+    await state.update_data(
+        platforms=search.platforms,
+        categories=search.categories,
+        target_age_min=search.target_age_min,
+        target_age_max=search.target_age_max,
+        target_gender=search.target_gender,
+        budget_min=search.budget_min,
+        budget_max=search.budget_max,
+        cpm_max=search.cpm_max,
+        has_reviews=search.has_reviews,
+    )
+    await callback.answer("🔁 Повторяем поиск...")
+    await show_search_results(callback.message, state, user.id)
+
+
+@router.callback_query(F.data == "show_saved_searches")
+async def handle_show_saved_searches(callback: CallbackQuery):
+    """Список сохраненных поисков из экрана истории"""
+    user = await get_user(callback.from_user.id)
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    await callback.answer()
+    searches = await get_buyer_search_filters(user.id)
+    if not searches:
+        await callback.message.edit_text(
+            "💾 <b>Сохраненные поиски</b>\n\n"
+            "У вас нет сохраненных поисков.\n\n"
+            "Выполните 🔍 Поиск блогеров и нажмите 💾 Сохранить поиск - "
+            "мы сообщим, когда появятся новые подходящие блогеры.",
+            parse_mode="HTML"
+        )
+        return
+    
+    await callback.message.edit_text(
+        format_saved_searches(searches),
+        reply_markup=get_saved_searches_keyboard(searches),
         parse_mode="HTML"
     )
 
 
+def format_saved_searches(searches) -> str:
+    """Текст списка сохраненных поисков"""
+    text = "📋 <b>Сохраненные поиски</b>\n\n"
+    text += "\n".join(f"{index}. {search.get_summary()}" for index, search in enumerate(searches, start=1))
+    text += "\n\n🔔 Уведомления о новых подходящих блогерах включены."
+    return text
+
+
 @router.message(F.text == "📊 Статистика", StateFilter("*"))
 async def universal_show_statistics(message: Message, state: FSMContext):
     await state.clear()
@@ -78,20 +200,109 @@ async def universal_show_statistics(message: Message, state: FSMContext):
         f"👤 <b>Роль:</b> закупщик\n"
         f"💳 <b>Подписка:</b> {subscription_status}\n"
         f"⭐ <b>Рейтинг:</b> {user.rating:.1f}\n"
-        f"📝 <b>Отзывов:</b> {user.reviews_count}\n"
+        f"📝 <b>Оценок:</b> {user.reviews_count}\n"
         f"📅 <b>В боте с:</b> {user.created_at.strftime('%d.%m.%Y')}\n"
     )
     if user.subscription_end_date:
         stats_text += f"\n🗓️ <b>Подписка до:</b> {user.subscription_end_date.strftime('%d.%m.%Y')}"
+    
+    # Все счетчики - одна строка user_stats, без агрегации по истории
+    await search_history_writer.flush()
+    stats = await get_user_stats(user.id)
     stats_text += (
         f"\n\n🔍 <b>Статистика поиска:</b>\n"
-        f"• Поисков выполнено: В разработке\n"
-        f"• Контактов получено: В разработке\n"
-        f"• Избранных блогеров: В разработке"
+        f"• Поисков выполнено: {stats.searches_count}\n"
+        f"• Контактов запрошено: {stats.contacts_requested}\n"
+        f"• Жалоб подано: {stats.complaints_filed}"
     )
+    if user.has_role(UserRole.SELLER):
+        stats_text += (
+            f"\n\n📝 <b>Статистика продажника:</b>\n"
+            f"• Блогеров добавлено: {stats.bloggers_count}\n"
+            f"• Запросов контактов: {stats.contacts_received}\n"
+            f"• Жалоб на блогеров: {stats.complaints_received}"
+        )
+    # Число оценок и рейтинг - из users (выше), здесь только дата последней
+    if user.reviews_count and stats.last_review_at:
+        stats_text += f"\n\n⭐ <b>Последняя оценка:</b> {stats.last_review_at.strftime('%d.%m.%Y')}"
     await message.answer(stats_text, parse_mode="HTML")
 
 
+@router.message(Command("top"))
+async def show_top_sellers(message: Message):
+    """Топ продавцов по рейтингу (из рейтинга в памяти)"""
+    sellers = await seller_leaderboard.top(10)
+    if not sellers:
+        await message.answer("🏆 <b>Топ продавцов</b>\n\nПока нет продавцов с рейтингом.", parse_mode="HTML")
+        return
+    
+    text = "🏆 <b>Топ продавцов</b>\n\n"
+    for place, seller in enumerate(sellers, start=1):
+        name = f"@{seller.username}" if seller.username else (seller.first_name or f"Продавец #{seller.id}")
+        vip = " 👑" if seller.is_vip else ""
+        text += f"{place}. {html.escape(name)}{vip} - {seller.rating:.1f}⭐ ({seller.reviews_count} оценок)\n"
+    
+    user = await get_user(message.from_user.id)
+    if user and user.has_role(UserRole.SELLER):
+        place = await seller_leaderboard.position(user.id)
+        if place:
+            text += f"\n📍 Ваше место: {place} из {len(seller_leaderboard)}"
+    
+    await message.answer(text, parse_mode="HTML")
+
+
+@router.message(Command("find"), StateFilter("*"))
+async def find_bloggers_by_text(message: Message, command: CommandObject, state: FSMContext):
+    """Поиск по имени, нику или описанию блогера: /find текст.
+    
+    При просмотре результатов поиска ищет среди блогеров, подходящих под те же критерии.
+    """
+    user = await get_user(message.from_user.id)
+    if not user or not user.has_role(UserRole.BUYER):
+        await message.answer("❌ Эта функция доступна только закупщикам.")
+        return
+    
+    if user.subscription_status not in [
+        SubscriptionStatus.ACTIVE,
+        SubscriptionStatus.AUTO_RENEWAL_OFF,
+        SubscriptionStatus.CANCELLED
+    ]:
+        await message.answer("💳 Для поиска блогеров необходима активная подписка")
+        return
+    
+    if not command.args or not fts_query(command.args):
+        await message.answer(
+            "🔎 <b>Поиск по имени и описанию</b>\n\n"
+            "Напишите слова после команды, например:\n"
+            "<code>/find анна фитнес</code>\n\n"
+            "Подходят начала слов и ник из ссылки.",
+            parse_mode="HTML"
+        )
+        return
+    
+    if await state.get_state() == BuyerStates.viewing_results.state:
+        filters = get_search_filters(await state.get_data())
+        scope = " среди результатов поиска"
+    else:
+        await state.clear()
+        filters = {}
+        scope = ""
+    
+    results = await search_bloggers(**filters, text=command.args, limit=10)
+    if not results:
+        await message.answer(f"🔎 По запросу «{html.escape(command.args)}»{scope} ничего не найдено.",
+                             parse_mode="HTML")
+        return
+    
+    await message.answer(
+        f"🔎 <b>Найдено по запросу «{html.escape(command.args)}»</b>{scope}\n\n"
+        f"Выберите блогера для просмотра:",
+        reply_markup=get_search_results_keyboard(results, show_actions=False),
+        parse_mode="HTML"
+    )
+    await state.set_state(BuyerStates.viewing_results)
+
+
 @router.message(F.text == "🔍 Поиск блогеров", StateFilter("*"))
 async def universal_search_bloggers(message: Message, state: FSMContext):
     await state.clear()
@@ -422,6 +633,35 @@ async def handle_budget_max(message: Message, state: FSMContext):
     
     await state.update_data(budget_max=budget_max)
     
+    await message.answer(
+        f"💸 <b>Максимальный CPM</b>\n\n"
+        f"Уже указано: Бюджет: {budget_min}₽ - {budget_max}₽\n\n"
+        f"Введите максимальную цену за 1000 просмотров (₽).\n"
+        f"CPM считается по цене сторис и рилс и середине вилки охвата.\n\n"
+        f"Введите 0, если CPM не важен:",
+        parse_mode="HTML"
+    )
+    await state.set_state(BuyerStates.waiting_for_cpm_max)
+
+
+@router.message(BuyerStates.waiting_for_cpm_max)
+async def handle_cpm_max(message: Message, state: FSMContext):
+    """Обработка ввода максимального CPM"""
+    try:
+        cpm_max = int(message.text.strip())
+        if cpm_max < 0:
+            raise ValueError("Negative CPM")
+    except ValueError:
+        await message.answer(
+            "❌ <b>Неверный формат</b>\n\n"
+            "Введите целое неотрицательное число (0 - не важно).\n"
+            "Попробуйте еще раз:",
+            parse_mode="HTML"
+        )
+        return
+    
+    await state.update_data(cpm_max=cpm_max or None)
+    
     await message.answer(
         f"📋 <b>Дополнительные критерии</b>\n\n"
         f"У блогера должны быть отзывы от других заказчиков?",
@@ -437,30 +677,26 @@ async def handle_additional_criteria(callback: CallbackQuery, state: FSMContext)
     has_reviews = callback.data == "yes_no_yes"
     await state.update_data(has_reviews=has_reviews)
     
-    await callback.answer()
+    user = await get_user(callback.from_user.id)
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
     
-    # Выполняем поиск
-    data = await state.get_data()
+    await callback.answer()
+    await show_search_results(callback.message, state, user.id)
+
+
+async def show_search_results(message: Message, state: FSMContext, buyer_id: int):
+    """Поиск по критериям из FSM, запись в историю и показ результатов"""
+    filters = get_search_filters(await state.get_data())
     
     try:
-        # Преобразуем данные для поиска
-        platforms = [p.value for p in data.get('platforms', [])]
-        categories = [c.value for c in data.get('categories', [])]
-        
-        results = await search_bloggers(
-            platforms=platforms,
-            categories=categories,
-            target_age_min=data.get('target_age_min'),
-            target_age_max=data.get('target_age_max'),
-            target_gender=data.get('target_gender'),
-            budget_min=data.get('budget_min'),
-            budget_max=data.get('budget_max'),
-            has_reviews=data.get('has_reviews'),
-            limit=10
-        )
+        started = time.perf_counter()
+        results = await search_bloggers_ranked(**filters, limit=10)
+        search_history_writer.add(buyer_id, filters, len(results), time.perf_counter() - started)
         
         if not results:
-            await callback.message.edit_text(
+            await message.edit_text(
                 "🔍 <b>Результаты поиска</b>\n\n"
                 "😔 По вашему запросу ничего не найдено.\n\n"
                 "Попробуйте:\n"
@@ -472,7 +708,7 @@ async def handle_additional_criteria(callback: CallbackQuery, state: FSMContext)
             await state.clear()
             return
         
-        await callback.message.edit_text(
+        await message.edit_text(
             f"🔍 <b>Результаты поиска</b>\n\n"
             f"Найдено блогеров: {len(results)}\n\n"
             f"Выберите блогера для просмотра:",
@@ -483,7 +719,7 @@ async def handle_additional_criteria(callback: CallbackQuery, state: FSMContext)
         
     except Exception as e:
         logger.error(f"Ошибка при поиске блогеров: {e}")
-        await callback.message.edit_text(
+        await message.edit_text(
             "❌ <b>Ошибка при поиске</b>\n\n"
             "Произошла ошибка при выполнении поиска.\n"
             "Попробуйте еще раз или обратитесь в поддержку.",
@@ -492,19 +728,129 @@ async def handle_additional_criteria(callback: CallbackQuery, state: FSMContext)
         await state.clear()
 
 
+def get_search_filters(data: dict) -> dict:
+    """Критерии поиска из данных FSM в формате search_bloggers"""
+    return {
+        'platforms': [p.value for p in data.get('platforms', [])],
+        'categories': [c.value for c in data.get('categories', [])],
+        'target_age_min': data.get('target_age_min'),
+        'target_age_max': data.get('target_age_max'),
+        'target_gender': data.get('target_gender'),
+        'budget_min': data.get('budget_min'),
+        'budget_max': data.get('budget_max'),
+        'cpm_max': data.get('cpm_max'),
+        'has_reviews': data.get('has_reviews'),
+    }
+
+
 # === ОБРАБОТЧИКИ ПРОСМОТРА РЕЗУЛЬТАТОВ ===
 
+@router.callback_query(F.data == "sort_results_cpm", BuyerStates.viewing_results)
+async def handle_sort_results_cpm(callback: CallbackQuery, state: FSMContext):
+    """Результаты того же поиска по возрастанию CPM (сортировка по индексу в БД)"""
+    filters = get_search_filters(await state.get_data())
+    results = await search_bloggers(**filters, order_by="cpm", limit=10)
+    await callback.answer()
+    await callback.message.edit_text(
+        f"🔍 <b>Результаты поиска</b> (по CPM)\n\n"
+        f"Найдено блогеров: {len(results)}\n\n"
+        f"Выберите блогера для просмотра:",
+        reply_markup=get_search_results_keyboard(results, sorted_by_cpm=True),
+        parse_mode="HTML"
+    )
+
+
+@router.callback_query(F.data == "save_search", BuyerStates.viewing_results)
+async def handle_save_search(callback: CallbackQuery, state: FSMContext):
+    """Сохранение критериев поиска для уведомлений о новых блогерах"""
+    user = await get_user(callback.from_user.id)
+    if not user or not user.has_role(UserRole.BUYER):
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    data = await state.get_data()
+    search = await create_search_filter(user.id, **get_search_filters(data))
+    if not search:
+        await callback.answer(f"❌ Не удалось сохранить. Максимум {MAX_SAVED_SEARCHES} сохраненных поисков", show_alert=True)
+        return
+    
+    await saved_search_index.ensure_loaded()
+    saved_search_index.add(search)
+    await callback.answer("💾 Поиск сохранен! Сообщим о новых подходящих блогерах", show_alert=True)
+
+
+@router.callback_query(F.data.startswith("unsave_search_"))
+async def handle_unsave_search(callback: CallbackQuery):
+    """Удаление сохраненного поиска"""
+    filter_id = int(callback.data.split("_")[2])
+    user = await get_user(callback.from_user.id)
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    if not await delete_search_filter(filter_id, user.id):
+        await callback.answer("❌ Поиск не найден")
+        return
+    
+    saved_search_index.remove(filter_id)
+    await callback.answer("🗑️ Поиск удален")
+    
+    searches = await get_buyer_search_filters(user.id)
+    if searches:
+        await callback.message.edit_text(
+            format_saved_searches(searches),
+            reply_markup=get_saved_searches_keyboard(searches),
+            parse_mode="HTML"
+        )
+    else:
+        await callback.message.edit_text("📋 <b>Сохраненных поисков больше нет</b>", parse_mode="HTML")
+
+
+@router.callback_query(F.data == "export_search", BuyerStates.viewing_results)
+async def handle_export_search(callback: CallbackQuery, state: FSMContext):
+    """Выгрузка всех результатов поиска в CSV"""
+    await callback.answer("⏳ Готовим файл...")
+    data = await state.get_data()
+    
+    path = None
+    try:
+        path, count = await export_search_results(get_search_filters(data))
+        await callback.message.answer_document(
+            FSInputFile(path, filename="search_results.csv.gz"),
+            caption=f"📥 Результаты поиска: {count} блогеров"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки результатов поиска: {e}")
+        await callback.message.answer("❌ Не удалось подготовить файл. Попробуйте позже.")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
 @router.callback_query(F.data.startswith("blogger_"), BuyerStates.viewing_results)
 async def handle_blogger_selection(callback: CallbackQuery, state: FSMContext):
     """Обработка выбора блогера из результатов поиска"""
     blogger_id = int(callback.data.split("_")[1])
     
-    blogger = await get_blogger(blogger_id)
-    if not blogger:
-        await callback.answer("❌ Блогер не найден")
-        return
+    # Готовая карточка из кеша не требует запроса в БД
+    info_text = blogger_card_cache.get(blogger_id, BUYER_CARD)
+    if info_text is None:
+        blogger = await blogger_cache.get(blogger_id)
+        if not blogger:
+            await callback.answer("❌ Блогер не найден")
+            return
+        info_text = blogger_card_cache.render(blogger, BUYER_CARD, format_buyer_blogger_card)
     
-    # Формируем подробную информацию о блогере
+    await callback.answer()
+    await callback.message.edit_text(
+        info_text,
+        reply_markup=get_blogger_selection_keyboard(blogger_id),
+        parse_mode="HTML"
+    )
+
+
+def format_buyer_blogger_card(blogger) -> str:
+    """Подробная информация о блогере для закупщика"""
     info_text = f"📝 <b>Информация о блогере</b>\n\n"
     info_text += f"👤 <b>Имя:</b> {blogger.name}\n"
     info_text += f"🔗 <b>Ссылка:</b> {blogger.url}\n"
@@ -521,7 +867,8 @@ async def handle_blogger_selection(callback: CallbackQuery, state: FSMContext):
     
     info_text += f"\n👥 <b>Демография:</b>\n"
     info_text += f"• Возраст: {blogger.get_age_categories_summary()}\n"
-    info_text += f"• Пол: Женщины {blogger.female_percent}%, Мужчины {blogger.male_percent}%\n"
+    if blogger.female_percent is not None or blogger.male_percent is not None:
+        info_text += f"• Пол: Женщины {blogger.female_percent or 0}%, Мужчины {blogger.male_percent or 0}%\n"
     
     info_text += f"\n🏷️ <b>Категории:</b> {', '.join([cat.get_russian_name() for cat in blogger.categories])}\n"
     
@@ -532,6 +879,8 @@ async def handle_blogger_selection(callback: CallbackQuery, state: FSMContext):
         info_text += f"• Пост: {blogger.price_post:,}₽\n"
     if blogger.price_video:
         info_text += f"• Видео: {blogger.price_video:,}₽\n"
+    if blogger.cpm is not None:
+        info_text += f"• CPM: {blogger.get_cpm_summary()}\n"
     
     info_text += f"\n📋 <b>Дополнительно:</b>\n"
     info_text += f"• Отзывы: {'✅' if blogger.has_reviews else '❌'}\n"
@@ -541,12 +890,7 @@ async def handle_blogger_selection(callback: CallbackQuery, state: FSMContext):
     if blogger.description:
         info_text += f"\n📝 <b>Описание:</b>\n{blogger.description}"
     
-    await callback.answer()
-    await callback.message.edit_text(
-        info_text,
-        reply_markup=get_blogger_selection_keyboard(blogger),
-        parse_mode="HTML"
-    )
+    return info_text
 
 
 @router.callback_query(F.data.startswith("contact_"))
@@ -559,23 +903,42 @@ async def handle_contact_request(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Доступ запрещен")
         return
     
-    blogger = await get_blogger(blogger_id)
+    blogger = await blogger_cache.get(blogger_id)
     if not blogger:
         await callback.answer("❌ Блогер не найден")
         return
     
-    # Здесь должна быть логика получения контактов продавца
-    # Пока что просто показываем сообщение
+    contact_id = await create_contact(user.id, blogger.seller_id, blogger.id)
     await callback.answer("✅ Запрос отправлен")
     await callback.message.edit_text(
         f"📞 <b>Запрос контактов</b>\n\n"
         f"Ваш запрос на получение контактов блогера <b>{blogger.name}</b> отправлен.\n\n"
         f"Продавец свяжется с вами в ближайшее время.\n\n"
-        f"💡 <b>Совет:</b> Будьте вежливы и четко опишите ваш проект.",
+        f"💡 <b>Совет:</b> Будьте вежливы и четко опишите ваш проект.\n\n"
+        f"После общения оцените продавца:",
+        reply_markup=get_contact_rating_keyboard(contact_id) if contact_id else None,
         parse_mode="HTML"
     )
 
 
+@router.callback_query(F.data.startswith("rate_contact_"))
+async def handle_rate_contact(callback: CallbackQuery):
+    """Оценка продавца по запросу контактов"""
+    contact_id, score = map(int, callback.data.split("_")[2:4])
+    
+    user = await get_user(callback.from_user.id)
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    if not await rate_contact(contact_id, user.id, score):
+        await callback.answer("❌ Этот контакт уже оценен")
+        return
+    
+    await callback.answer(f"Спасибо за оценку: {score}⭐")
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+
 @router.callback_query(F.data.startswith("complain_"))
 async def handle_complaint_request(callback: CallbackQuery, state: FSMContext):
     """Обработка запроса на жалобу"""
@@ -586,7 +949,7 @@ async def handle_complaint_request(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Только закупщики могут подавать жалобы")
         return
     
-    blogger = await get_blogger(blogger_id)
+    blogger = await blogger_cache.get(blogger_id)
     if not blogger:
         await callback.answer("❌ Блогер не найден")
         return
@@ -687,49 +1050,3 @@ def get_gender_selection_keyboard():
         [InlineKeyboardButton(text="👨 Мужчины", callback_data="gender_male")],
         [InlineKeyboardButton(text="👥 Любой", callback_data="gender_any")]
     ])
-
-
-# Вспомогательная функция для получения пользователя по ID
-async def get_user_by_id(user_id: int):
-    """Получить пользователя по внутреннему ID"""
-    # Эту функцию нужно добавить в database.py
-    import aiosqlite
-    from database.database import DATABASE_PATH
-    from database.models import User, UserRole, SubscriptionStatus
-    from datetime import datetime
-    
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT * FROM users WHERE id = ?", (user_id,)
-        )
-        row = await cursor.fetchone()
-        
-        if row:
-            # Получаем роли пользователя
-            cursor = await db.execute("""
-                SELECT role FROM user_roles WHERE user_id = ?
-            """, (row['id'],))
-            
-            role_rows = await cursor.fetchall()
-            roles = {UserRole(role_row['role']) for role_row in role_rows}
-            
-            return User(
-                id=row['id'],
-                telegram_id=row['telegram_id'],
-                username=row['username'],
-                first_name=row['first_name'],
-                last_name=row['last_name'],
-                roles=roles,
-                subscription_status=SubscriptionStatus(row['subscription_status']) if row['subscription_status'] else SubscriptionStatus.INACTIVE,
-                subscription_end_date=datetime.fromisoformat(row['subscription_end_date']) if row['subscription_end_date'] else None,
-                subscription_start_date=datetime.fromisoformat(row['subscription_start_date']) if row['subscription_start_date'] else None,
-                rating=row['rating'],
-                reviews_count=row['reviews_count'],
-                is_vip=bool(row['is_vip']),
-                penalty_amount=row['penalty_amount'],
-                is_blocked=bool(row['is_blocked']),
-                created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else datetime.now(),
-                updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else datetime.now()
-            )
-        return None 
\ No newline at end of file
@@ -1,16 +1,23 @@
+import html
 import logging
+import os
+import tempfile
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, BufferedInputFile, FSInputFile
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import StateFilter
+from aiogram.filters import StateFilter, Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from database.database import (
     get_user, create_blogger, get_user_bloggers, 
-    get_blogger, delete_blogger, update_blogger
+    get_blogger, delete_blogger, update_blogger, find_bloggers_by_url
 )
 from database.models import UserRole, SubscriptionStatus, Platform, BlogCategory
 from utils.google_sheets import log_blogger_action_to_sheets
+from utils.blogger_import import import_bloggers_file, SUPPORTED_EXTENSIONS, TEMPLATE_HEADER
+from utils.blogger_export import export_seller_bloggers
+from utils.card_cache import blogger_card_cache, SELLER_CARD
+from utils.saved_searches import notify_saved_searches
 from bot.keyboards import (
     get_platform_keyboard, get_category_keyboard, 
     get_yes_no_keyboard, get_blogger_list_keyboard,
@@ -26,13 +33,30 @@ from bot.keyboards import (
     get_blogger_management_keyboard,
     get_blogger_management_keyboard_with_stats
 )
+from bot.middlewares import AlbumMiddleware
 from bot.states import SellerStates
-from typing import Union
+from typing import List, Optional, Union
 
 router = Router()
+# Альбом скриншотов статистики обрабатывается одним вызовом handle_stats_photo
+router.message.middleware(AlbumMiddleware())
 logger = logging.getLogger(__name__)
 
 
+async def update_own_blogger(telegram_id: int, blogger_id: int, **fields) -> bool:
+    """Обновление блогера текущего продавца и проверка сохраненных поисков закупщиков"""
+    user = await get_user(telegram_id)
+    if not user:
+        return False
+    
+    success = await update_blogger(blogger_id, user.id, **fields)
+    if success:
+        blogger = await get_blogger(blogger_id)
+        if blogger:
+            await notify_saved_searches(blogger)
+    return success
+
+
 # === ОБРАБОТЧИКИ ОСНОВНОГО МЕНЮ ПРОДАЖНИКА ===
 
 @router.message(F.text == "📝 Добавить блогера", StateFilter("*"))
@@ -294,6 +318,24 @@ async def handle_blogger_url(message: Message, state: FSMContext):
         )
         return
     
+    # Дубликаты по канонической ссылке (www, m., метки utm и т.п. не важны)
+    user = await get_user(message.from_user.id)
+    duplicates = await find_bloggers_by_url(url)
+    own = [blogger for blogger in duplicates if user and blogger.seller_id == user.id]
+    if own:
+        await message.answer(
+            f"❌ <b>Этот блогер уже есть в вашем списке</b>\n\n"
+            f"«{html.escape(own[0].name)}» добавлен по ссылке {html.escape(own[0].url)}\n\n"
+            f"Отредактируйте существующую запись или введите другую ссылку:",
+            parse_mode="HTML"
+        )
+        return
+    if duplicates:
+        await message.answer(
+            f"ℹ️ Этот блогер уже размещен другими продавцами ({len(duplicates)}). "
+            f"В поиске закупщики увидят одно предложение - с лучшим рейтингом продавца и подходящей ценой."
+        )
+    
     await state.update_data(blogger_url=url)
     
     await message.answer(
@@ -584,16 +626,17 @@ async def handle_price_reels(message: Message, state: FSMContext):
 
 
 @router.message(SellerStates.waiting_for_stats_photos, F.photo)
-async def handle_stats_photo(message: Message, state: FSMContext):
-    """Обработка загрузки фото статистики"""
+async def handle_stats_photo(message: Message, state: FSMContext, album: Optional[List[Message]] = None):
+    """Обработка загрузки фото статистики (одиночного фото или целого альбома)"""
     data = await state.get_data()
-    stats_photos = data.get('stats_photos', [])
     
-    # Получаем file_id самого большого размера фото
-    photo = message.photo[-1]
-    stats_photos.append(photo.file_id)
+    # Получаем file_id самого большого размера каждого фото
+    new_photos = [item.photo[-1].file_id for item in album or [message] if item.photo]
+    stats_photos = data.get('stats_photos', []) + new_photos
+    added = len(new_photos)
     
     await state.update_data(stats_photos=stats_photos)
+    added_text = "✅ Фото добавлено" if added == 1 else f"✅ Добавлено фото: {added}"
     
     # Проверяем, редактируем ли мы существующего блогера
     if 'editing_blogger_id' in data:
@@ -602,7 +645,7 @@ async def handle_stats_photo(message: Message, state: FSMContext):
         # Отправляем одно сообщение с обновленной информацией
         await message.answer(
             f"📊 <b>Статистика профиля</b>\n\n"
-            f"✅ Фото добавлено (всего: {len(stats_photos)})\n\n"
+            f"{added_text} (всего: {len(stats_photos)})\n\n"
             f"Отправьте еще фото или нажмите 'Готово':",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="✅ Готово", callback_data="edit_stats_photos_done")],
@@ -614,7 +657,7 @@ async def handle_stats_photo(message: Message, state: FSMContext):
         # Это добавление нового блогера
         await message.answer(
             f"📊 <b>Статистика профиля</b>\n\n"
-            f"✅ Фото добавлено (всего: {len(stats_photos)})\n\n"
+            f"{added_text} (всего: {len(stats_photos)})\n\n"
             f"Отправьте еще фото или нажмите 'Готово':",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="✅ Готово", callback_data="stats_photos_done")],
@@ -873,6 +916,8 @@ async def handle_blogger_description(message: Message, state: FSMContext):
             description=description
         )
         
+        await notify_saved_searches(blogger)
+        
         # Формируем полную информацию о добавленном блогере
         success_text = f"✅ <b>Блогер успешно добавлен!</b>\n\n"
         success_text += format_full_blogger_info(blogger)
@@ -925,6 +970,146 @@ async def handle_blogger_description(message: Message, state: FSMContext):
         await state.clear()
 
 
+# === ПАКЕТНЫЙ ИМПОРТ БЛОГЕРОВ ===
+
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024  # Лимит Bot API на скачивание файлов
+MAX_INLINE_REPORT_LENGTH = 3000
+
+
+@router.message(Command("import"), StateFilter("*"))
+async def start_blogger_import(message: Message, state: FSMContext):
+    """Импорт списка блогеров из CSV/XLSX файла"""
+    await state.clear()
+    user = await get_user(message.from_user.id)
+    
+    if not user:
+        await message.answer("❌ Пользователь не найден в базе данных.\n\nИспользуйте /start для регистрации.")
+        return
+    
+    if not user.has_role(UserRole.SELLER):
+        await message.answer("❌ Эта функция доступна только продажникам.")
+        return
+    
+    if user.subscription_status not in [SubscriptionStatus.ACTIVE, SubscriptionStatus.AUTO_RENEWAL_OFF, SubscriptionStatus.CANCELLED]:
+        await message.answer(
+            "💳 <b>Требуется подписка</b>\n\n"
+            "Для добавления блогеров необходима активная подписка.\n"
+            "Оформите подписку в разделе 💳 Подписка",
+            parse_mode="HTML"
+        )
+        return
+    
+    await message.answer(
+        "📥 <b>Импорт блогеров из файла</b>\n\n"
+        "Отправьте файл <b>.csv</b> или <b>.xlsx</b>. Первая строка - заголовок:\n"
+        f"<code>{TEMPLATE_HEADER}</code>\n\n"
+        "• Обязательные колонки: name, url, platforms\n"
+        "• platforms: instagram, youtube, telegram, tiktok, vk (через запятую)\n"
+        "• categories: до 3 категорий через запятую (sport или Спорт)\n"
+        "• Числа - без пробелов и валюты\n\n"
+        "Строки с ошибками будут пропущены, остальные добавятся одним пакетом.",
+        parse_mode="HTML"
+    )
+    await state.set_state(SellerStates.waiting_for_import_file)
+
+
+@router.message(SellerStates.waiting_for_import_file, F.document)
+async def handle_import_file(message: Message, state: FSMContext):
+    """Загрузка и обработка файла импорта"""
+    document = message.document
+    extension = os.path.splitext(document.file_name or '')[1].lower()
+    
+    if extension not in SUPPORTED_EXTENSIONS:
+        await message.answer("❌ Поддерживаются только файлы .csv и .xlsx. Отправьте другой файл:")
+        return
+    
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await message.answer("❌ Файл слишком большой (максимум 20 МБ). Разделите его на части:")
+        return
+    
+    user = await get_user(message.from_user.id)
+    if not user or not user.has_role(UserRole.SELLER):
+        await state.clear()
+        await message.answer("❌ Эта функция доступна только продажникам.")
+        return
+    
+    await message.answer("⏳ Импортируем блогеров...")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"import{extension}")
+        try:
+            await message.bot.download(document, destination=path)
+            report = await import_bloggers_file(path, user.id)
+        except ValueError as e:
+            await message.answer(f"❌ <b>Неверный формат файла:</b> {e}\n\nИсправьте файл и отправьте снова:", parse_mode="HTML")
+            return
+        except ImportError:
+            logger.error("Для импорта XLSX не установлен openpyxl")
+            await message.answer("❌ Импорт XLSX сейчас недоступен. Сохраните файл в формате CSV и отправьте снова:")
+            return
+        except Exception as e:
+            logger.error(f"Ошибка импорта блогеров пользователя {message.from_user.id}: {e}")
+            await message.answer("❌ Ошибка при импорте. Ни один блогер не был добавлен, попробуйте позже.")
+            await state.clear()
+            return
+    
+    await state.clear()
+    
+    summary = (
+        "✅ <b>Импорт завершен</b>\n\n"
+        f"Строк в файле: {report.total_rows}\n"
+        f"Добавлено блогеров: {report.imported}\n"
+        f"Строк с ошибками: {report.errors_count}"
+    )
+    if report.placed_by_others:
+        summary += f"\nУже размещены другими продавцами: {report.placed_by_others}"
+    if not report.errors_count:
+        await message.answer(summary, parse_mode="HTML")
+        return
+    
+    errors_text = report.format_errors()
+    if len(errors_text) <= MAX_INLINE_REPORT_LENGTH:
+        await message.answer(f"{summary}\n\n<pre>{html.escape(errors_text)}</pre>", parse_mode="HTML")
+    else:
+        await message.answer(summary, parse_mode="HTML")
+        await message.answer_document(
+            BufferedInputFile(errors_text.encode('utf-8'), filename="import_errors.txt"),
+            caption="📄 Отчет об ошибках по строкам"
+        )
+
+
+@router.message(SellerStates.waiting_for_import_file, ~F.text)
+async def handle_import_not_document(message: Message):
+    """В состоянии импорта ожидается файл (текст не перехватываем - работают кнопки меню)"""
+    await message.answer("📎 Отправьте файл .csv или .xlsx как документ или используйте /import заново.")
+
+
+# === ВЫГРУЗКА БЛОГЕРОВ ===
+
+@router.callback_query(F.data == "export_my_bloggers")
+async def handle_export_my_bloggers(callback: CallbackQuery):
+    """Выгрузка всех блогеров продавца в CSV"""
+    user = await get_user(callback.from_user.id)
+    if not user or not user.has_role(UserRole.SELLER):
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    await callback.answer("⏳ Готовим файл...")
+    path = None
+    try:
+        path, count = await export_seller_bloggers(user.id)
+        await callback.message.answer_document(
+            FSInputFile(path, filename="my_bloggers.csv.gz"),
+            caption=f"📥 Ваши блогеры: {count}"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки блогеров пользователя {callback.from_user.id}: {e}")
+        await callback.message.answer("❌ Не удалось подготовить файл. Попробуйте позже.")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
 # === УПРАВЛЕНИЕ БЛОГЕРАМИ ===
 
 @router.message(F.text == "👥 Мои блогеры", StateFilter("*"))
@@ -1050,8 +1235,7 @@ async def handle_confirm_delete(callback: CallbackQuery):
         await callback.answer("❌ Это не ваш блогер")
         return
     
-    from database.database import delete_blogger
-    success = await delete_blogger(blogger_id)
+    success = await delete_blogger(blogger_id, user.id)
     
     if success:
         # Логируем удаление в Google Sheets
@@ -1096,7 +1280,11 @@ async def handle_confirm_delete(callback: CallbackQuery):
 
 
 def format_full_blogger_info(blogger) -> str:
-    """Формирование информации о блогере согласно новому ТЗ"""
+    """Формирование информации о блогере согласно новому ТЗ (с кешем готовых карточек)"""
+    return blogger_card_cache.render(blogger, SELLER_CARD, render_full_blogger_info)
+
+
+def render_full_blogger_info(blogger) -> str:
     info_text = f"👤 <b>Имя:</b> {blogger.name}\n"
     
     # Определяем текст для ссылки в зависимости от количества URL (если несколько разделены запятой)
@@ -1542,7 +1730,7 @@ async def finish_edit_stats_photos(callback: CallbackQuery, state: FSMContext):
     
     if not stats_photos:
         # Если нет фото, сразу обновляем блогера
-        success = await update_blogger(blogger_id, stats_images=[])
+        success = await update_own_blogger(callback.from_user.id, blogger_id, stats_images=[])
         
         if success:
             await callback.message.edit_text(
@@ -1973,8 +2161,7 @@ async def handle_new_value(message: Message, state: FSMContext):
         update_data["description"] = message.text
     
     # Обновляем блогера
-    from database.database import update_blogger
-    success = await update_blogger(blogger_id, **update_data)
+    success = await update_own_blogger(message.from_user.id, blogger_id, **update_data)
     
     if success:
         await message.answer(
@@ -2048,8 +2235,8 @@ async def handle_edit_stories_reach_max(message: Message, state: FSMContext):
             return
         
         # Обновляем блогера
-        from database.database import update_blogger
-        success = await update_blogger(blogger_id, stories_reach_min=min_reach, stories_reach_max=max_reach)
+        success = await update_own_blogger(message.from_user.id, blogger_id,
+                                           stories_reach_min=min_reach, stories_reach_max=max_reach)
         
         if success:
             await message.answer(
@@ -2125,8 +2312,8 @@ async def handle_edit_reels_reach_max(message: Message, state: FSMContext):
             return
         
         # Обновляем блогера
-        from database.database import update_blogger
-        success = await update_blogger(blogger_id, reels_reach_min=min_reach, reels_reach_max=max_reach)
+        success = await update_own_blogger(message.from_user.id, blogger_id,
+                                           reels_reach_min=min_reach, reels_reach_max=max_reach)
         
         if success:
             await message.answer(
@@ -2217,7 +2404,7 @@ async def confirm_edit_stats_photos(callback: CallbackQuery, state: FSMContext):
         return
     
     # Обновляем блогера
-    success = await update_blogger(blogger_id, stats_images=stats_photos)
+    success = await update_own_blogger(callback.from_user.id, blogger_id, stats_images=stats_photos)
     
     if success:
         await callback.message.edit_text(
@@ -10,7 +10,6 @@ from database.database import (get_user, update_subscription_status, get_user_su
 from database.models import SubscriptionStatus
 from bot.keyboards import (get_subscription_keyboard, get_payment_confirmation_keyboard,
                           get_subscription_management_keyboard, get_subscription_cancel_confirmation_keyboard)
-from utils.payments import create_subscription_payment
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -136,7 +135,8 @@ async def initiate_payment(callback: CallbackQuery, subscription_type: str):
         await callback.answer("✅ У вас уже есть активная подписка")
         return
     
-    # Создаем платеж через Robokassa
+    # Создаем платеж через Robokassa (модуль платежей загружается при первой оплате)
+    from utils.payments import create_subscription_payment
     payment_data = create_subscription_payment(user.telegram_id, subscription_type)
     
     # Названия подписок
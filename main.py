@@ -1,3 +1,8 @@
+import time
+
+# Отсчет времени старта - до импорта aiogram и обработчиков
+STARTUP_STARTED_AT = time.perf_counter()
+
 import asyncio
 import logging
 import os
@@ -8,22 +13,14 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from database.database import init_db
+from bot.middlewares import CallbackCoalescingMiddleware, ChatSerializerMiddleware, ThrottlingMiddleware
+from database.database import configure_database, init_db
 from handlers import common, seller, buyer, subscription
+from utils.saved_searches import notification_batcher
+from utils.search_history import search_history_writer
 
 # Загрузка переменных окружения
 env_loaded = load_dotenv()
-print(f"🔧 .env файл загружен: {env_loaded}")
-
-# Проверяем наличие .env файла
-env_file_path = os.path.join(os.getcwd(), '.env')
-env_exists = os.path.exists(env_file_path)
-print(f"🔧 .env файл существует: {env_exists}")
-if env_exists:
-    print(f"🔧 Путь к .env: {env_file_path}")
-else:
-    print(f"🔧 Текущая директория: {os.getcwd()}")
-    print(f"🔧 Файлы в директории: {os.listdir('.')}")
 
 # Настройка логирования
 logging.basicConfig(
@@ -31,170 +28,162 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+logger.info(f"🔧 .env файл загружен: {env_loaded}")
+
+
+def load_bot_token() -> str:
+    """Получение и проверка токена бота из переменных окружения"""
+    token = os.getenv('BOT_TOKEN')
+
+    if not token:
+        logger.error("❌ BOT_TOKEN не найден в переменных окружения!")
+        raise ValueError("BOT_TOKEN не найден в переменных окружения")
 
-# Проверяем все переменные окружения
-print("=== ДИАГНОСТИКА ПЕРЕМЕННЫХ ОКРУЖЕНИЯ ===")
-print(f"Все переменные: {list(os.environ.keys())}")
-logger.info("=== ДИАГНОСТИКА ПЕРЕМЕННЫХ ОКРУЖЕНИЯ ===")
-logger.info(f"Все переменные: {list(os.environ.keys())}")
-
-# Ищем переменные, связанные с ботом
-bot_vars = {k: v for k, v in os.environ.items() if 'BOT' in k.upper() or 'TOKEN' in k.upper()}
-print(f"Переменные с BOT/TOKEN: {bot_vars}")
-logger.info(f"Переменные с BOT/TOKEN: {bot_vars}")
-
-# Токен бота - пробуем разные способы
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-print(f"os.getenv('BOT_TOKEN'): {'Найден' if BOT_TOKEN else 'НЕ НАЙДЕН'}")
-logger.info(f"os.getenv('BOT_TOKEN'): {'Найден' if BOT_TOKEN else 'НЕ НАЙДЕН'}")
-
-# Пробуем environ напрямую
-BOT_TOKEN_DIRECT = os.environ.get('BOT_TOKEN')
-print(f"os.environ.get('BOT_TOKEN'): {'Найден' if BOT_TOKEN_DIRECT else 'НЕ НАЙДЕН'}")
-logger.info(f"os.environ.get('BOT_TOKEN'): {'Найден' if BOT_TOKEN_DIRECT else 'НЕ НАЙДЕН'}")
-
-# Если не нашли, используем тестовый
-if not BOT_TOKEN and not BOT_TOKEN_DIRECT:
-    print("❌ BOT_TOKEN не найден ни одним способом!")
-    print("Доступные переменные окружения:")
-    for key in sorted(os.environ.keys()):
-        print(f"  {key}")
-    logger.error("❌ BOT_TOKEN не найден ни одним способом!")
-    logger.info("Доступные переменные окружения:")
-    for key in sorted(os.environ.keys()):
-        logger.info(f"  {key}")
-    raise ValueError("BOT_TOKEN не найден в переменных окружения")
-
-# Используем найденный токен
-BOT_TOKEN = BOT_TOKEN or BOT_TOKEN_DIRECT
-
-# Диагностика токена
-logger.info(f"Токен получен, длина: {len(BOT_TOKEN) if BOT_TOKEN else 0}")
-if BOT_TOKEN:
-    # Проверяем на пробелы и невидимые символы
-    logger.info(f"Первые 10 символов: '{BOT_TOKEN[:10]}'")
-    logger.info(f"Последние 10 символов: '{BOT_TOKEN[-10:]}'")
-    logger.info(f"Содержит пробелы в начале/конце: {BOT_TOKEN != BOT_TOKEN.strip()}")
-    
     # Очищаем токен от возможных пробелов и невидимых символов
-    BOT_TOKEN = BOT_TOKEN.strip().replace('\n', '').replace('\r', '').replace('\t', '')
-    logger.info(f"После очистки, длина: {len(BOT_TOKEN)}")
-    
+    cleaned = token.strip().replace('\n', '').replace('\r', '').replace('\t', '')
+    if cleaned != token:
+        logger.warning(f"Токен содержал пробельные символы, длина после очистки: {len(cleaned)}")
+
     # Проверим формат токена
-    if ':' not in BOT_TOKEN:
+    if ':' not in cleaned:
         logger.error("❌ Токен не содержит ':' - неверный формат!")
-    else:
-        parts = BOT_TOKEN.split(':')
-        logger.info(f"Токен разделен на части: {len(parts[0])} символов до ':' и {len(parts[1])} после")
-        if not parts[0].isdigit():
-            logger.error(f"❌ Первая часть токена не является числом: '{parts[0]}'")
-    
-    # Проверим каждый символ на невидимые
-    invisible_chars = []
-    for i, char in enumerate(BOT_TOKEN):
-        if not char.isprintable() and char not in [':']:
-            invisible_chars.append(f"позиция {i}: код {ord(char)}")
-    
+    elif not cleaned.split(':', 1)[0].isdigit():
+        logger.error("❌ Первая часть токена не является числом")
+
+    invisible_chars = [f"позиция {i}: код {ord(char)}" for i, char in enumerate(cleaned) if not char.isprintable()]
     if invisible_chars:
         logger.error(f"❌ Найдены невидимые символы: {invisible_chars}")
-    else:
-        logger.info("✅ Невидимых символов не найдено")
+
+    return cleaned
+
+
+BOT_TOKEN = load_bot_token()
+
+# Счетчики middleware выводятся в лог при остановке
+throttling = ThrottlingMiddleware()
+callback_coalescing = CallbackCoalescingMiddleware()
+chat_serializer = ChatSerializerMiddleware()
+
+
+async def warm_up_google_sheets():
+    """Фоновая авторизация в Google Sheets, чтобы первая запись не ждала ее"""
+    from utils.google_sheets import sheets_manager, CREDENTIALS_PATH
+
+    if not os.path.exists(CREDENTIALS_PATH):
+        logger.info("Google Sheets не настроен, прогрев пропущен")
+        return
+
+    await sheets_manager.initialize()
+
+
+async def on_startup():
+    """Вызывается диспетчером непосредственно перед первым запросом getUpdates"""
+    elapsed_ms = (time.perf_counter() - STARTUP_STARTED_AT) * 1000
+    logger.info(f"⏱️ Время запуска до первого polling: {elapsed_ms:.0f} мс")
+
+
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер с middleware и роутерами (не требует сети и БД)"""
+    dp = Dispatcher()
+
+    # Middleware на уровне update встают перед FSMContextMiddleware: состояние
+    # FSM читается только после того, как обновление дождалось очереди чата
+    dp.update.outer_middleware.unregister(dp.fsm)
+    # Повторные нажатия кнопки не выполняются, пока работает или ждет первое
+    dp.update.outer_middleware(callback_coalescing)
+    # Ограничение частоты запросов пользователя, общее для сообщений и нажатий;
+    # схлопнутые повторы и части альбома после первой токены не тратят
+    dp.update.outer_middleware(throttling)
+    # Обновления одного чата - по очереди, всего не больше max_concurrency обработчиков
+    dp.update.outer_middleware(chat_serializer)
+    dp.update.outer_middleware(dp.fsm)
+
+    # Регистрация обработчиков
+    dp.include_router(common.router)
+    dp.include_router(seller.router)
+    dp.include_router(buyer.router)
+    dp.include_router(subscription.router)
+    dp.startup.register(on_startup)
+
+    return dp
 
 
 async def main():
     """Главная функция запуска бота"""
-    
+    # БД из DATABASE_URL (.env уже загружен) или bot_database.db
+    configure_database()
+
+    bot = Bot(
+        token=BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+    dp = create_dispatcher()
+
     try:
-        # Инициализация базы данных
-        logger.info("🗄️ Инициализация базы данных...")
-        await init_db()
-        logger.info("✅ База данных инициализирована")
-        
-        # Инициализация бота и диспетчера
-        logger.info("🤖 Создание экземпляра бота...")
-        logger.info(f"Используемый токен (первые 10 символов): {BOT_TOKEN[:10]}")
-        
-        bot = Bot(
-            token=BOT_TOKEN,
-            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        # Миграции БД, проверка токена и очистка webhook не зависят друг от друга
+        logger.info("🗄️ Инициализация базы данных и подключение к Telegram API...")
+        _, bot_info, _ = await asyncio.gather(
+            init_db(),
+            bot.get_me(),
+            bot.delete_webhook(drop_pending_updates=True),
         )
-        logger.info("✅ Бот создан")
-        
-        # Проверяем подключение к Telegram API
-        logger.info("🔄 Проверка подключения к Telegram API...")
-        bot_info = await bot.get_me()
         logger.info(f"✅ Бот подключен: @{bot_info.username} ({bot_info.first_name})")
-        
-        dp = Dispatcher()
-        logger.info("✅ Диспетчер создан")
-        
+
     except Exception as e:
         logger.error(f"❌ Ошибка при инициализации: {type(e).__name__}: {e}")
+        await bot.session.close()
         raise
-    
+
+    # Авторизация в Google Sheets не блокирует запуск polling
+    sheets_task = asyncio.create_task(warm_up_google_sheets())
+
+    # Фоновая отправка уведомлений по сохраненным поискам
+    notification_batcher.start(bot)
+    search_history_writer.start()
+
     # Флаг для корректного завершения
     shutdown_event = asyncio.Event()
-    
+
     def signal_handler(signum, frame):
         logger.info(f"Получен сигнал {signum}, завершаем работу...")
         shutdown_event.set()
-    
+
     # Регистрируем обработчики сигналов
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
-    
-    try:
-        # Очищаем webhook перед запуском polling
-        logger.info("🔄 Очищаем webhook...")
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("✅ Webhook очищен")
-        
-        # Регистрация обработчиков
-        logger.info("📝 Регистрация обработчиков...")
-        dp.include_router(common.router)
-        logger.info("✅ common.router зарегистрирован")
-        
-        dp.include_router(seller.router)
-        logger.info("✅ seller.router зарегистрирован")
-        
-        dp.include_router(buyer.router)
-        logger.info("✅ buyer.router зарегистрирован")
-        
-        dp.include_router(subscription.router)
-        logger.info("✅ subscription.router зарегистрирован")
-        
-        logger.info("🎉 Все обработчики зарегистрированы, бот готов к запуску")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка при регистрации обработчиков: {type(e).__name__}: {e}")
-        raise
-    
+
     try:
         # Запуск бота с увеличенным timeout
         logger.info("Запускаем polling...")
-        
+
         # Создаем задачу для polling
         polling_task = asyncio.create_task(
             dp.start_polling(bot, timeout=60, drop_pending_updates=True)
         )
-        
+
         # Ждем либо завершения polling, либо сигнала остановки
         done, pending = await asyncio.wait(
             [polling_task, asyncio.create_task(shutdown_event.wait())],
             return_when=asyncio.FIRST_COMPLETED
         )
-        
+
         # Отменяем оставшиеся задачи
         for task in pending:
             task.cancel()
-            
+
     except Exception as e:
         logger.error(f"Ошибка при запуске polling: {e}")
         raise
     finally:
+        sheets_task.cancel()
+        await notification_batcher.stop()
+        await search_history_writer.stop()
+        logger.info(f"Схлопнуто повторных нажатий: {callback_coalescing.stats()}")
+        logger.info(f"Ограничение частоты запросов: {throttling.stats()}")
+        logger.info(f"Очереди обновлений по чатам: {chat_serializer.stats()}")
         logger.info("Закрываем сессию бота...")
         await bot.session.close()
 
 
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Кеш блогеров по id в памяти.
+
+Карточка блогера, запрос контактов и жалоба каждый раз читали блогера
+из БД через отдельное соединение. BloggerCache хранит последние
+прочитанные объекты Blogger (LRU) и запоминает отсутствующие id на
+короткое время. Одновременные промахи по одному id ждут один общий
+запрос (single-flight).
+
+Изменение, создание и удаление блогера сбрасывают запись через
+on_blogger_changed. Если блогер изменился, пока его загрузка была в
+полете, ее результат в кеш не попадает.
+
+Объекты Blogger из кеша общие для всех обработчиков - их нельзя изменять.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from database.database import get_blogger, on_blogger_changed
+from database.models import Blogger
+
+logger = logging.getLogger(__name__)
+
+
+class BloggerCache:
+    """LRU-кеш блогеров с общей загрузкой и кешем отсутствующих id"""
+
+    def __init__(self, max_size: int = 5000, missing_ttl: float = 60.0):
+        self.max_size = max_size
+        self.missing_ttl = missing_ttl
+        # id -> (блогер или None, момент, до которого верно отсутствие)
+        self._entries: "OrderedDict[int, Tuple[Optional[Blogger], float]]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, blogger_id: int) -> Optional[Blogger]:
+        """Блогер по id (из кеша или одним запросом на все одновременные промахи)"""
+        entry = self._entries.get(blogger_id)
+        if entry is not None:
+            blogger, missing_until = entry
+            if blogger is not None or missing_until > time.monotonic():
+                self._entries.move_to_end(blogger_id)
+                self.hits += 1
+                return blogger
+            del self._entries[blogger_id]
+
+        self.misses += 1
+        task = self._loading.get(blogger_id)
+        if task is None:
+            task = asyncio.create_task(self._load(blogger_id))
+            self._loading[blogger_id] = task
+        # Отмена одного ожидающего не должна отменять общую загрузку
+        return await asyncio.shield(task)
+
+    async def _load(self, blogger_id: int) -> Optional[Blogger]:
+        try:
+            blogger = await get_blogger(blogger_id)
+        finally:
+            is_current = self._loading.get(blogger_id) is asyncio.current_task()
+            if is_current:
+                del self._loading[blogger_id]
+
+        # После invalidate загрузка могла прочитать устаревшие данные
+        if is_current:
+            self._store(blogger_id, blogger)
+        return blogger
+
+    def _store(self, blogger_id: int, blogger: Optional[Blogger]):
+        missing_until = time.monotonic() + self.missing_ttl if blogger is None else 0.0
+        self._entries[blogger_id] = (blogger, missing_until)
+        self._entries.move_to_end(blogger_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, blogger_id: int):
+        """Сбросить запись блогера и отвязать загрузку, начатую до изменения"""
+        self._entries.pop(blogger_id, None)
+        self._loading.pop(blogger_id, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._loading.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._entries), 'loading': len(self._loading),
+                'hits': self.hits, 'misses': self.misses}
+
+
+# Глобальный кеш блогеров
+blogger_cache = BloggerCache()
+on_blogger_changed(blogger_cache.invalidate)
@@ -0,0 +1,120 @@
+"""Выгрузка блогеров в CSV, сжатый gzip.
+
+Строки приходят пачками из stream_search_bloggers / stream_user_bloggers
+и сразу дописываются во временный файл, поэтому память не зависит от
+размера выборки. Запись и сжатие пачки выполняются в отдельном потоке,
+чтобы не блокировать обработку других апдейтов.
+"""
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import tempfile
+from contextlib import aclosing
+from typing import List, Tuple
+
+from database.models import Blogger, User
+
+logger = logging.getLogger(__name__)
+
+BLOGGER_HEADER = [
+    "id", "name", "url", "platforms", "categories", "subscribers_count",
+    "stories_reach_min", "stories_reach_max", "price_stories",
+    "reels_reach_min", "reels_reach_max", "price_reels",
+    "audience_13_17_percent", "audience_18_24_percent", "audience_25_35_percent", "audience_35_plus_percent",
+    "female_percent", "male_percent", "description", "created_at",
+]
+
+SELLER_HEADER = ["seller_username", "seller_rating", "seller_is_vip"]
+
+
+def _blogger_cells(blogger: Blogger) -> list:
+    return [
+        blogger.id,
+        blogger.name,
+        blogger.url,
+        ", ".join(platform.value for platform in blogger.platforms),
+        ", ".join(category.value for category in blogger.categories),
+        blogger.subscribers_count,
+        blogger.stories_reach_min,
+        blogger.stories_reach_max,
+        blogger.price_stories,
+        blogger.reels_reach_min,
+        blogger.reels_reach_max,
+        blogger.price_reels,
+        blogger.audience_13_17_percent,
+        blogger.audience_18_24_percent,
+        blogger.audience_25_35_percent,
+        blogger.audience_35_plus_percent,
+        blogger.female_percent,
+        blogger.male_percent,
+        blogger.description,
+        blogger.created_at.strftime("%Y-%m-%d %H:%M"),
+    ]
+
+
+def _search_cells(result: Tuple[Blogger, User]) -> list:
+    blogger, seller = result
+    return _blogger_cells(blogger) + [
+        f"@{seller.username}" if seller.username else "",
+        f"{seller.rating:.1f}",
+        "да" if seller.is_vip else "нет",
+    ]
+
+
+def _new_export_file(prefix: str) -> str:
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".csv.gz")
+    os.close(fd)
+    return path
+
+
+async def _write_chunks(path: str, header: List[str], chunks, to_cells) -> int:
+    """Запись пачек строк в gzip CSV. Возвращает количество строк.
+
+    Генератор chunks закрывается и при ошибке записи: иначе его курсор и
+    соединение с БД оставались бы открытыми до сборки мусора.
+    """
+    count = 0
+    # utf-8-sig и ';' - чтобы Excel открыл файл с кириллицей без настройки импорта
+    async with aclosing(chunks):
+        with gzip.open(path, "wt", encoding="utf-8-sig", newline="") as file:
+            writer = csv.writer(file, delimiter=";")
+            writer.writerow(header)
+            async for chunk in chunks:
+                rows = [to_cells(item) for item in chunk]
+                await asyncio.to_thread(writer.writerows, rows)
+                count += len(rows)
+    return count
+
+
+async def export_search_results(filters: dict) -> Tuple[str, int]:
+    """Выгрузка всех результатов поиска. Возвращает путь к файлу и число строк.
+
+    Файл удаляет вызывающий код после отправки.
+    """
+    from database.database import stream_search_bloggers
+
+    path = _new_export_file("search_")
+    try:
+        count = await _write_chunks(path, BLOGGER_HEADER + SELLER_HEADER,
+                                    stream_search_bloggers(**filters), _search_cells)
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(f"Выгрузка результатов поиска: {count} строк")
+    return path, count
+
+
+async def export_seller_bloggers(seller_id: int) -> Tuple[str, int]:
+    """Выгрузка всех блогеров продавца. Возвращает путь к файлу и число строк"""
+    from database.database import stream_user_bloggers
+
+    path = _new_export_file("bloggers_")
+    try:
+        count = await _write_chunks(path, BLOGGER_HEADER, stream_user_bloggers(seller_id), _blogger_cells)
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(f"Выгрузка блогеров продавца {seller_id}: {count} строк")
+    return path, count
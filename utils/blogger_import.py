@@ -0,0 +1,293 @@
+"""Пакетный импорт блогеров из CSV/XLSX.
+
+Файл читается построчно (CSV - модулем csv, XLSX - openpyxl в режиме
+read_only), поэтому память не растет с размером файла. Разбор идет в
+отдельном потоке пачками по PARSE_CHUNK_SIZE строк и не блокирует event
+loop. Корректные строки передаются в create_bloggers_batch, ошибочные
+попадают в отчет с номером строки и причиной.
+
+Дубликаты проверяются по канонической ссылке, как при ручном добавлении:
+блогер, который уже есть у продавца или встречался выше в файле, не
+добавляется и попадает в ошибки; размещенные другими продавцами
+добавляются и считаются в отчете. Добавленные блогеры проверяются по
+сохраненным поискам закупщиков.
+"""
+import asyncio
+import csv
+import itertools
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from database.models import Blogger, Platform, BlogCategory
+from utils.url_normalizer import canonical_url
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx')
+MAX_ERRORS_IN_REPORT = 1000  # Дальше ошибки только считаются
+PARSE_CHUNK_SIZE = 500  # Строк файла на один проход в потоке разбора
+
+# Заголовок в файле -> поле Blogger (регистр и пробелы по краям не важны)
+COLUMN_ALIASES = {
+    'name': 'name', 'имя': 'name',
+    'url': 'url', 'ссылка': 'url',
+    'platforms': 'platforms', 'платформы': 'platforms', 'соцсети': 'platforms',
+    'categories': 'categories', 'категории': 'categories',
+    'subscribers_count': 'subscribers_count', 'подписчики': 'subscribers_count',
+    'stories_reach_min': 'stories_reach_min', 'охват сторис от': 'stories_reach_min',
+    'stories_reach_max': 'stories_reach_max', 'охват сторис до': 'stories_reach_max',
+    'price_stories': 'price_stories', 'цена сторис': 'price_stories',
+    'reels_reach_min': 'reels_reach_min', 'охват рилс от': 'reels_reach_min',
+    'reels_reach_max': 'reels_reach_max', 'охват рилс до': 'reels_reach_max',
+    'price_reels': 'price_reels', 'цена рилс': 'price_reels',
+    'description': 'description', 'описание': 'description',
+}
+
+INT_FIELDS = (
+    'subscribers_count', 'stories_reach_min', 'stories_reach_max', 'price_stories',
+    'reels_reach_min', 'reels_reach_max', 'price_reels',
+)
+
+TEMPLATE_HEADER = "name;url;platforms;categories;subscribers_count;stories_reach_min;stories_reach_max;" \
+                  "price_stories;reels_reach_min;reels_reach_max;price_reels;description"
+
+# Домены, которым должна соответствовать ссылка для каждой платформы
+PLATFORM_DOMAINS = {
+    Platform.INSTAGRAM: ('instagram.com/',),
+    Platform.YOUTUBE: ('youtube.com/', 'youtu.be/'),
+    Platform.TIKTOK: ('tiktok.com/',),
+    Platform.TELEGRAM: ('t.me/', 'telegram.me/'),
+    Platform.VK: ('vk.com/',),
+}
+
+_CATEGORY_BY_NAME = {
+    **{category.value: category for category in BlogCategory},
+    **{category.get_russian_name().lower(): category for category in BlogCategory},
+}
+
+
+@dataclass
+class ImportReport:
+    """Результат импорта: сколько добавлено и ошибки по строкам"""
+    imported: int = 0
+    total_rows: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    errors_count: int = 0
+    placed_by_others: int = 0  # Добавлены, но уже размещены другими продавцами
+
+    def add_error(self, line: int, reason: str):
+        self.errors_count += 1
+        if len(self.errors) < MAX_ERRORS_IN_REPORT:
+            self.errors.append((line, reason))
+
+    def format_errors(self) -> str:
+        """Отчет об ошибках построчно"""
+        lines = [f"Строка {line}: {reason}" for line, reason in self.errors]
+        if self.errors_count > len(self.errors):
+            lines.append(f"... и еще {self.errors_count - len(self.errors)} ошибок")
+        return "\n".join(lines)
+
+
+def _split_list(value: str) -> List[str]:
+    for separator in (';', '|'):
+        value = value.replace(separator, ',')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_platforms_cell(value: str) -> List[Platform]:
+    platforms = []
+    for item in _split_list(value):
+        try:
+            platform = Platform(item.lower())
+        except ValueError:
+            raise ValueError(f"неизвестная платформа «{item}»")
+        if platform not in platforms:
+            platforms.append(platform)
+    return platforms
+
+
+def parse_categories_cell(value: str) -> List[BlogCategory]:
+    categories = []
+    for item in _split_list(value):
+        category = _CATEGORY_BY_NAME.get(item.lower())
+        if category is None:
+            raise ValueError(f"неизвестная категория «{item}»")
+        if category not in categories:
+            categories.append(category)
+    return categories
+
+
+def _parse_int(field_name: str, value: str) -> Optional[int]:
+    value = value.replace(' ', '').replace(' ', '')
+    if not value:
+        return None
+    try:
+        number = int(float(value))
+    except ValueError:
+        raise ValueError(f"{field_name}: «{value}» не число")
+    if number < 0:
+        raise ValueError(f"{field_name}: значение не может быть отрицательным")
+    return number
+
+
+def parse_row(row: Dict[str, str], seller_id: int) -> Blogger:
+    """Проверка строки файла и сборка Blogger. При ошибке - ValueError с причиной"""
+    name = row.get('name', '')
+    url = row.get('url', '')
+    if not name:
+        raise ValueError("не указано имя")
+    if not url.startswith(('http://', 'https://')):
+        raise ValueError("ссылка должна начинаться с http:// или https://")
+
+    platforms = parse_platforms_cell(row.get('platforms', ''))
+    if not platforms:
+        raise ValueError("не указаны платформы")
+    url_lower = url.lower()
+    if not any(domain in url_lower for platform in platforms for domain in PLATFORM_DOMAINS[platform]):
+        raise ValueError("ссылка не соответствует указанным платформам")
+
+    categories = parse_categories_cell(row.get('categories', ''))
+    if len(categories) > 3:
+        raise ValueError("можно указать не более 3 категорий")
+
+    blogger = Blogger(
+        id=0,
+        seller_id=seller_id,
+        name=name,
+        url=url,
+        platforms=platforms,
+        categories=categories,
+        description=row.get('description') or None,
+        **{field_name: _parse_int(field_name, row.get(field_name, '')) for field_name in INT_FIELDS}
+    )
+    if not blogger.validate_reach_ranges():
+        raise ValueError("минимальный охват больше максимального")
+    return blogger
+
+
+def _normalize_header(header) -> List[Optional[str]]:
+    return [COLUMN_ALIASES.get(str(cell).strip().lower()) if cell is not None else None for cell in header]
+
+
+def _iter_csv(path: str) -> Iterator[Tuple[int, list]]:
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        sample = file.read(4096)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        for line, cells in enumerate(csv.reader(file, dialect), start=1):
+            yield line, cells
+
+
+def _iter_xlsx(path: str) -> Iterator[Tuple[int, list]]:
+    # openpyxl нужен только для импорта - не загружаем его при старте бота
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        for line, cells in enumerate(sheet.iter_rows(values_only=True), start=1):
+            yield line, cells
+    finally:
+        workbook.close()
+
+
+def _cell_to_str(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def iter_file_rows(path: str) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Строки файла в виде {поле: значение} с номером строки (заголовок - строка 1)"""
+    extension = os.path.splitext(path)[1].lower()
+    rows = _iter_xlsx(path) if extension == '.xlsx' else _iter_csv(path)
+
+    columns = None
+    for line, cells in rows:
+        if columns is None:
+            columns = _normalize_header(cells)
+            missing = {'name', 'url', 'platforms'} - set(columns)
+            if missing:
+                raise ValueError(f"в заголовке нет колонок: {', '.join(sorted(missing))}")
+            continue
+        values = {column: _cell_to_str(cell) for column, cell in zip(columns, cells) if column}
+        if any(values.values()):
+            yield line, values
+
+
+def iter_valid_bloggers(path: str, seller_id: int, report: ImportReport) -> Iterator[Tuple[int, Blogger]]:
+    """Корректные блогеры из файла с номером строки; ошибки записываются в report"""
+    for line, row in iter_file_rows(path):
+        report.total_rows += 1
+        try:
+            yield line, parse_row(row, seller_id)
+        except ValueError as e:
+            report.add_error(line, str(e))
+
+
+async def _parse_in_thread(path: str, seller_id: int,
+                           report: ImportReport) -> AsyncIterator[List[Tuple[int, Blogger]]]:
+    """Разбор файла в отдельном потоке пачками: csv и openpyxl не держат event loop"""
+    rows = iter_valid_bloggers(path, seller_id, report)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(list, itertools.islice(rows, PARSE_CHUNK_SIZE))
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        rows.close()
+
+
+async def _new_bloggers(path: str, seller_id: int, own_keys: Set[str],
+                        report: ImportReport) -> AsyncIterator[Blogger]:
+    """Блогеры из файла без дубликатов своих блогеров (own_keys) и повторов внутри файла"""
+    first_line: Dict[str, int] = {}
+    async for chunk in _parse_in_thread(path, seller_id, report):
+        for line, blogger in chunk:
+            key = canonical_url(blogger.url)
+            if key in own_keys:
+                report.add_error(line, "этот блогер уже есть в вашем списке")
+                continue
+            if key is not None:
+                if key in first_line:
+                    report.add_error(line, f"повторяет блогера из строки {first_line[key]}")
+                    continue
+                first_line[key] = line
+            yield blogger
+
+
+async def import_bloggers_file(path: str, seller_id: int) -> ImportReport:
+    """Импорт блогеров из файла одним пакетом.
+
+    Ошибка в заголовке или формате файла пробрасывается как ValueError.
+    После импорта добавленные блогеры, как и созданные вручную, проверяются
+    по сохраненным поискам закупщиков.
+    """
+    from database.database import (
+        count_placed_by_others, create_bloggers_batch, get_seller_canonical_urls, iter_bloggers,
+    )
+    from utils.saved_searches import notify_saved_searches
+
+    report = ImportReport()
+    # Ссылки своих блогеров читаются до транзакции импорта: второе соединение
+    # во время пакетной записи получило бы "database is locked"
+    own_keys = await get_seller_canonical_urls(seller_id)
+    imported_ids = await create_bloggers_batch(_new_bloggers(path, seller_id, own_keys, report))
+    report.imported = len(imported_ids)
+    if imported_ids:
+        report.placed_by_others = await count_placed_by_others(imported_ids)
+    logger.info(f"Импорт блогеров продавца {seller_id}: добавлено {report.imported}, "
+                f"ошибок {report.errors_count} из {report.total_rows}")
+
+    if imported_ids:
+        async for blogger in iter_bloggers(ids=imported_ids):
+            await notify_saved_searches(blogger)
+    return report
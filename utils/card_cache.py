@@ -0,0 +1,77 @@
+"""Кеш готового текста карточек блогеров.
+
+Карточку популярного блогера открывают многие закупщики, и каждый раз
+текст собирался заново из десятка f-строк после запроса в БД. Кеш хранит
+HTML карточки по ключу (blogger_id, вид карточки) вместе с updated_at
+блогера, по которому она построена: если у переданного блогера updated_at
+другой, карточка строится заново. Изменение и удаление блогера
+сбрасывают его карточки (подписка on_blogger_changed), поэтому по одному
+blogger_id кеш можно читать без похода в БД.
+
+Размер ограничен: при переполнении вытесняются давно не открытые карточки.
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from database.database import on_blogger_changed
+
+logger = logging.getLogger(__name__)
+
+# Виды карточек
+SELLER_CARD = 'seller'
+BUYER_CARD = 'buyer'
+
+
+class BloggerCardCache:
+    """LRU-кеш текста карточек блогеров"""
+
+    def __init__(self, max_size: int = 2000):
+        self.max_size = max_size
+        self._cards: "OrderedDict[Tuple[int, str], Tuple[Any, str]]" = OrderedDict()
+        self._kinds: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, blogger_id: int, kind: str, updated_at: Any = None) -> Optional[str]:
+        """Текст карточки или None. С updated_at - только если карточка построена по этой версии"""
+        entry = self._cards.get((blogger_id, kind))
+        if entry is None or (updated_at is not None and entry[0] != updated_at):
+            self.misses += 1
+            return None
+        self._cards.move_to_end((blogger_id, kind))
+        self.hits += 1
+        return entry[1]
+
+    def put(self, blogger_id: int, kind: str, updated_at: Any, text: str):
+        self._cards[(blogger_id, kind)] = (updated_at, text)
+        self._cards.move_to_end((blogger_id, kind))
+        self._kinds.add(kind)
+        while len(self._cards) > self.max_size:
+            self._cards.popitem(last=False)
+
+    def render(self, blogger, kind: str, builder: Callable[[Any], str]) -> str:
+        """Карточка блогера из кеша, при промахе - builder(blogger) с сохранением в кеш"""
+        if blogger.id is None:
+            return builder(blogger)
+        text = self.get(blogger.id, kind, blogger.updated_at)
+        if text is None:
+            text = builder(blogger)
+            self.put(blogger.id, kind, blogger.updated_at, text)
+        return text
+
+    def invalidate(self, blogger_id: int):
+        """Сбросить все карточки блогера (после изменения или удаления)"""
+        for kind in self._kinds:
+            self._cards.pop((blogger_id, kind), None)
+
+    def clear(self):
+        self._cards.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._cards), 'hits': self.hits, 'misses': self.misses}
+
+
+# Глобальный кеш карточек
+blogger_card_cache = BloggerCardCache()
+on_blogger_changed(blogger_card_cache.invalidate)
@@ -0,0 +1,36 @@
+"""Поиск дубликатов блогеров по канонической ссылке.
+
+Пересчитывает canonical_url всех блогеров по текущим правилам
+utils/url_normalizer.py (например, после их изменения), обновляет флаги
+has_duplicates и выводит группы блогеров с одинаковой ссылкой.
+
+Запуск из корня проекта:
+    python -m utils.dedupe_bloggers            # пересчитать и показать 20 крупнейших групп
+    python -m utils.dedupe_bloggers --top 100
+"""
+import asyncio
+import logging
+import sys
+
+from database.database import get_duplicate_clusters, refresh_canonical_urls
+
+logger = logging.getLogger(__name__)
+
+
+async def main(top: int) -> int:
+    updated = await refresh_canonical_urls()
+    logger.info(f"Канонические ссылки обновлены у {updated} блогеров")
+
+    clusters = await get_duplicate_clusters()
+    duplicates = sum(len(ids) - 1 for _, ids in clusters)
+    logger.info(f"Групп дубликатов: {len(clusters)}, лишних записей: {duplicates}")
+    for key, ids in clusters[:top]:
+        logger.info(f"{key}: {len(ids)} блогеров (id {', '.join(map(str, ids))})")
+    return len(clusters)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = sys.argv[1:]
+    top = int(args[args.index("--top") + 1]) if "--top" in args else 20
+    asyncio.run(main(top))
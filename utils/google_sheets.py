@@ -1,10 +1,12 @@
-import gspread
+import asyncio
 import logging
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-from google.auth.exceptions import GoogleAuthError
 import json
 
+# gspread и google-auth импортируются лениво в GoogleSheetsManager.initialize():
+# они тяжелые и не нужны, пока бот не пишет в таблицу
+
 logger = logging.getLogger(__name__)
 
 # ID вашей Google-таблицы
@@ -16,37 +18,59 @@ class GoogleSheetsManager:
         self.client = None
         self.spreadsheet = None
         self.worksheet = None
+        self._init_lock = None
         
     async def initialize(self):
         """Инициализация подключения к Google Sheets"""
-        try:
-            # Авторизация через сервисный аккаунт
-            self.client = gspread.service_account(filename=CREDENTIALS_PATH)
-            
-            # Открытие таблицы по ID
-            self.spreadsheet = self.client.open_by_key(SPREADSHEET_ID)
+        # Одновременные вызовы (прогрев при старте и первая запись) ждут одну авторизацию
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+        
+        async with self._init_lock:
+            if self.worksheet:
+                return True
             
-            # Получение первого листа (или создание если нет)
             try:
-                self.worksheet = self.spreadsheet.sheet1
-            except gspread.exceptions.WorksheetNotFound:
-                self.worksheet = self.spreadsheet.add_worksheet(title="Данные блогеров", rows="1000", cols="10")
-            
-            # Проверяем заголовки, добавляем если нужно
-            await self._ensure_headers()
+                from google.auth.exceptions import GoogleAuthError
+            except ImportError as e:
+                logger.error(f"Google Sheets dependencies are not installed: {e}")
+                return False
             
-            logger.info("Google Sheets connection established successfully")
-            return True
-            
-        except FileNotFoundError:
-            logger.error(f"Credentials file not found: {CREDENTIALS_PATH}")
-            return False
-        except GoogleAuthError as e:
-            logger.error(f"Google Auth error: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Error initializing Google Sheets: {e}")
-            return False
+            try:
+                # Авторизация и открытие таблицы блокируют поток - выполняем их вне event loop
+                await asyncio.to_thread(self._connect)
+                
+                # Проверяем заголовки, добавляем если нужно
+                await self._ensure_headers()
+                
+                logger.info("Google Sheets connection established successfully")
+                return True
+                
+            except FileNotFoundError:
+                logger.error(f"Credentials file not found: {CREDENTIALS_PATH}")
+                return False
+            except GoogleAuthError as e:
+                logger.error(f"Google Auth error: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Error initializing Google Sheets: {e}")
+                return False
+    
+    def _connect(self):
+        """Синхронная авторизация через сервисный аккаунт и открытие листа"""
+        import gspread
+        
+        # Авторизация через сервисный аккаунт
+        self.client = gspread.service_account(filename=CREDENTIALS_PATH)
+        
+        # Открытие таблицы по ID
+        self.spreadsheet = self.client.open_by_key(SPREADSHEET_ID)
+        
+        # Получение первого листа (или создание если нет)
+        try:
+            self.worksheet = self.spreadsheet.sheet1
+        except gspread.exceptions.WorksheetNotFound:
+            self.worksheet = self.spreadsheet.add_worksheet(title="Данные блогеров", rows="1000", cols="10")
     
     async def _ensure_headers(self):
         """Убедиться, что заголовки столбцов установлены"""
@@ -0,0 +1,110 @@
+"""Рейтинг продавцов в памяти.
+
+Продавцы хранятся в списке, отсортированном по (VIP, рейтинг, число
+отзывов), поэтому топ - это срез списка без запроса к БД. Функции
+database.py сообщают об изменении рейтинга, VIP, штрафов и ролей через
+on_user_changed; такие пользователи перечитываются одним запросом при
+следующем обращении и переставляются бинарным поиском.
+
+check_consistency сравнивает порядок с полной сортировкой в SQL.
+"""
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+from database.database import get_leaderboard_sellers, get_top_sellers, on_user_changed
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def sort_key(user: User) -> Tuple[bool, float, int, int]:
+    """Порядок как в get_top_sellers: VIP, рейтинг, отзывы по убыванию, затем id"""
+    return (not user.is_vip, -user.rating, -user.reviews_count, user.id)
+
+
+class SellerLeaderboard:
+    """Отсортированный список продавцов с инкрементальным обновлением"""
+
+    def __init__(self):
+        self._keys: List[Tuple[bool, float, int, int]] = []
+        self._users: Dict[int, User] = {}
+        self._pending: Set[int] = set()
+        self.loaded = False
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def mark_changed(self, user_id: int):
+        """Пользователь изменился - перечитать при следующем обращении"""
+        self._pending.add(user_id)
+
+    async def refresh(self):
+        """Первичная загрузка или применение накопленных изменений"""
+        if self.loaded and not self._pending:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.loaded:
+                # Изменения до загрузки уже учтены в полной выборке
+                self._pending = set()
+                self._rebuild(await get_leaderboard_sellers())
+                self.loaded = True
+                logger.info(f"Рейтинг продавцов загружен: {len(self)} продавцов")
+                return
+
+            changed, self._pending = self._pending, set()
+            if not changed:
+                return
+            fresh = {user.id: user for user in await get_leaderboard_sellers(changed)}
+            for user_id in changed:
+                self._remove(user_id)
+                if user_id in fresh:
+                    self._insert(fresh[user_id])
+
+    async def top(self, limit: int = 10) -> List[User]:
+        await self.refresh()
+        return [self._users[key[3]] for key in self._keys[:limit]]
+
+    async def position(self, user_id: int) -> Optional[int]:
+        """Место продавца в рейтинге (с 1) или None"""
+        await self.refresh()
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        return bisect_left(self._keys, sort_key(user)) + 1
+
+    async def check_consistency(self, fix: bool = True) -> bool:
+        """Сравнение с полным пересчетом; при расхождении (и fix) список перестраивается"""
+        await self.refresh()
+        expected = await get_top_sellers(limit=-1)  # LIMIT -1 - без ограничения
+        actual = [self._users[key[3]] for key in self._keys]
+        consistent = [sort_key(user) for user in expected] == [sort_key(user) for user in actual]
+        if not consistent:
+            logger.warning(f"Рейтинг продавцов расходится с БД ({len(actual)} в памяти, {len(expected)} в БД)")
+            if fix:
+                self._rebuild(expected)
+        return consistent
+
+    def _rebuild(self, users: List[User]):
+        self._users = {user.id: user for user in users}
+        self._keys = sorted(sort_key(user) for user in users)
+
+    def _insert(self, user: User):
+        self._users[user.id] = user
+        insort(self._keys, sort_key(user))
+
+    def _remove(self, user_id: int):
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return
+        index = bisect_left(self._keys, sort_key(user))
+        if index < len(self._keys) and self._keys[index][3] == user_id:
+            del self._keys[index]
+
+
+seller_leaderboard = SellerLeaderboard()
+on_user_changed(seller_leaderboard.mark_changed)
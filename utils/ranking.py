@@ -0,0 +1,159 @@
+"""Ранжирование результатов поиска по релевантности запросу закупщика.
+
+Кандидаты - первые CANDIDATES_PER_RESULT * limit результатов
+search_bloggers в его порядке (рейтинг продавца, подписчики). Из БД для них
+читаются только колонки признаков (CANDIDATE_COLUMNS) кортежами, без сборки
+моделей; полные модели загружаются только для limit лучших.
+Признаки собираются в матрицу NumPy (кандидаты x признаки), итоговая оценка -
+взвешенная сумма признаков в [0, 1]:
+- age - доля аудитории в возрастных группах, пересекающих целевой диапазон;
+- gender - доля аудитории целевого пола;
+- efficiency - охват на рубль (сторис и рилс, лучший из двух), в логарифме,
+  нормированный на максимум среди кандидатов;
+- categories - доля запрошенных категорий, которые есть у блогера;
+- rating - рейтинг продавца; vip - VIP статус продавца.
+Лучшие k выбираются частичной сортировкой (argpartition).
+
+NumPy загружается при первом поиске, а не при старте бота.
+"""
+import json
+from dataclasses import dataclass, astuple
+from operator import attrgetter
+from typing import List, Sequence, Tuple
+
+from database.models import AGE_BUCKETS, BlogCategory, Blogger, User
+
+FEATURES = ('age', 'gender', 'efficiency', 'categories', 'rating', 'vip')
+
+# Сколько кандидатов читать из БД на одно место в выдаче
+CANDIDATES_PER_RESULT = 200
+
+
+@dataclass(frozen=True)
+class RankingWeights:
+    """Веса признаков (порядок полей совпадает с FEATURES)"""
+    age: float = 0.30
+    gender: float = 0.15
+    efficiency: float = 0.20
+    categories: float = 0.15
+    rating: float = 0.15
+    vip: float = 0.05
+
+
+DEFAULT_WEIGHTS = RankingWeights()
+
+
+# Строка кандидата: (id блогера, сырые значения (None -> NaN), категории в JSON)
+_AGE_COLUMNS = [name for _, _, name in AGE_BUCKETS]
+_RAW_COLUMNS = _AGE_COLUMNS + [
+    'female_percent', 'male_percent',
+    'price_stories', 'stories_reach_min', 'stories_reach_max',
+    'price_reels', 'reels_reach_min', 'reels_reach_max',
+]
+_SELLER_COLUMNS = ['rating', 'is_vip']
+_COLUMN = {name: index for index, name in enumerate(_RAW_COLUMNS + _SELLER_COLUMNS)}
+CANDIDATE_COLUMNS = ", ".join(
+    ['b.id'] + [f'b.{name}' for name in _RAW_COLUMNS] + [f'u.{name}' for name in _SELLER_COLUMNS] + ['b.categories']
+)
+_get_raw = attrgetter(*_RAW_COLUMNS)
+_get_seller = attrgetter(*_SELLER_COLUMNS)
+
+
+def candidate_row(blogger: Blogger, seller: User) -> tuple:
+    """Строка кандидата из моделей - та же, что search_blogger_rows(CANDIDATE_COLUMNS)"""
+    categories = json.dumps([category.value for category in blogger.categories]) if blogger.categories else None
+    return (blogger.id,) + _get_raw(blogger) + _get_seller(seller) + (categories,)
+
+
+def _reach_per_ruble(np, raw, price: str, reach_min: str, reach_max: str):
+    """Средний охват на рубль; 0, если нет цены или охвата"""
+    low, high = raw[:, _COLUMN[reach_min]], raw[:, _COLUMN[reach_max]]
+    reach = (np.where(np.isnan(low), high, low) + np.where(np.isnan(high), low, high)) / 2
+    prices = raw[:, _COLUMN[price]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        efficiency = reach / prices
+    return np.where((prices > 0) & ~np.isnan(efficiency), efficiency, 0.0)
+
+
+def feature_matrix(candidates: Sequence[tuple], target_age_min: int = None,
+                   target_age_max: int = None, target_gender: str = None,
+                   categories: List[str] = None):
+    """Матрица признаков (len(candidates) x len(FEATURES)) по строкам кандидатов, значения в [0, 1]"""
+    import numpy as np
+
+    count = len(candidates)
+    features = np.zeros((count, len(FEATURES)))
+    if not count:
+        return features
+
+    # Один проход по строкам, дальше - только операции над столбцами (None -> NaN)
+    raw = np.array([candidate[1:-1] for candidate in candidates], dtype=float)
+
+    if target_age_min is not None and target_age_max is not None:
+        columns = [_COLUMN[name] for low, high, name in AGE_BUCKETS
+                   if target_age_min <= high and target_age_max >= low]
+        if columns:
+            features[:, 0] = np.nansum(raw[:, columns], axis=1) / 100
+
+    if target_gender in ("female", "male"):
+        features[:, 1] = np.nan_to_num(raw[:, _COLUMN[f"{target_gender}_percent"]]) / 100
+
+    efficiency = np.log1p(np.maximum(
+        _reach_per_ruble(np, raw, 'price_stories', 'stories_reach_min', 'stories_reach_max'),
+        _reach_per_ruble(np, raw, 'price_reels', 'reels_reach_min', 'reels_reach_max'),
+    ))
+    if efficiency.max() > 0:
+        features[:, 2] = efficiency / efficiency.max()
+
+    if categories:
+        # Поиск подстроки '"sport"' в JSON - как фильтр категорий в search_bloggers
+        wanted = [f'"{BlogCategory(category).value}"' for category in set(categories)]
+        features[:, 3] = np.fromiter(
+            (len([category for category in wanted if category in stored])
+             for stored in (candidate[-1] or '' for candidate in candidates)),
+            dtype=float, count=count
+        ) / len(wanted)
+
+    features[:, 4] = (np.nan_to_num(raw[:, _COLUMN['rating']], nan=1.0) - 1) / 4
+    features[:, 5] = np.nan_to_num(raw[:, _COLUMN['is_vip']])
+
+    return np.clip(features, 0, 1, out=features)
+
+
+def top_k(scores, k: int):
+    """Индексы k лучших оценок по убыванию (частичная сортировка)"""
+    import numpy as np
+
+    if k <= 0 or not len(scores):
+        return np.empty(0, dtype=int)
+    if k < len(scores):
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    # При равной оценке сохраняется исходный порядок (рейтинг продавца, подписчики)
+    return best[np.lexsort((best, -scores[best]))]
+
+
+def rank_candidates(candidates: Sequence[tuple], limit: int = 10,
+                    weights: RankingWeights = DEFAULT_WEIGHTS, categories: List[str] = None,
+                    target_age_min: int = None, target_age_max: int = None,
+                    target_gender: str = None, **_) -> List[tuple]:
+    """Лучшие limit строк кандидатов (см. CANDIDATE_COLUMNS) по взвешенной оценке релевантности.
+
+    Принимает те же критерии, что и search_bloggers (лишние игнорируются).
+    """
+    import numpy as np
+
+    features = feature_matrix(candidates, target_age_min, target_age_max, target_gender, categories)
+    scores = features @ np.array(astuple(weights), dtype=float)
+    return [candidates[index] for index in top_k(scores, limit)]
+
+
+async def search_bloggers_ranked(limit: int = 10, weights: RankingWeights = DEFAULT_WEIGHTS,
+                                 **filters) -> List[Tuple[Blogger, User]]:
+    """Поиск по критериям search_bloggers с ранжированием первых кандидатов"""
+    from database.database import get_bloggers_with_sellers, search_blogger_rows
+
+    candidates = await search_blogger_rows(CANDIDATE_COLUMNS, limit * CANDIDATES_PER_RESULT, **filters)
+    best = rank_candidates(candidates, limit, weights, **filters)
+    return await get_bloggers_with_sellers([candidate[0] for candidate in best])
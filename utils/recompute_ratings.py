@@ -0,0 +1,33 @@
+"""Полный пересчет рейтингов продавцов по оценкам контактов.
+
+Инкрементальные обновления (rate_contact) сверяются с
+пересчетом с нуля; расхождения исправляются.
+
+Запуск из корня проекта:
+    python -m utils.recompute_ratings           # пересчитать и исправить
+    python -m utils.recompute_ratings --check   # только проверить
+"""
+import asyncio
+import logging
+import sys
+
+from database.database import recompute_ratings
+
+logger = logging.getLogger(__name__)
+
+
+async def main(fix: bool) -> int:
+    mismatched = await recompute_ratings(fix=fix)
+    if not mismatched:
+        logger.info("Рейтинги совпадают с пересчитанными")
+    elif fix:
+        logger.warning(f"Исправлены рейтинги {mismatched} пользователей")
+    else:
+        logger.warning(f"Рейтинги расходятся у {mismatched} пользователей")
+    return mismatched
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    check_only = "--check" in sys.argv[1:]
+    sys.exit(1 if asyncio.run(main(fix=not check_only)) and check_only else 0)
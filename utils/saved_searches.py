@@ -0,0 +1,321 @@
+"""Сохраненные поиски закупщиков и уведомления о новых подходящих блогерах.
+
+При создании или изменении блогера нужно найти сохраненные поиски, под
+которые он подходит. Перебирать все фильтры дорого, поэтому используется
+обратный индекс:
+- платформы и категории - множества id фильтров по каждому значению;
+- бюджет и возраст - интервальные деревья по диапазонам фильтров;
+- фильтры без ограничения по признаку хранятся в отдельном множестве.
+Кандидаты - пересечение множеств по всем признакам; каждый кандидат
+окончательно проверяется SearchFilter.matches.
+
+Уведомления копятся в NotificationBatcher и отправляются пачкой не чаще
+заданного лимита сообщений в секунду.
+"""
+import asyncio
+import html
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from database.models import Blogger, SearchFilter
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+
+
+class IntervalTree:
+    """Статическое центрированное интервальное дерево: какие [lo, hi] пересекают запрос"""
+    __slots__ = ('center', 'by_lo', 'by_hi', 'left', 'right')
+
+    def __init__(self, intervals: List[Tuple[float, float, int]]):
+        points = sorted(point for lo, hi, _ in intervals for point in (lo, hi) if abs(point) != INF)
+        self.center = points[len(points) // 2] if points else 0
+        here, left, right = [], [], []
+        for interval in intervals:
+            lo, hi, _ = interval
+            if hi < self.center:
+                left.append(interval)
+            elif lo > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        self.by_lo = sorted(here, key=lambda interval: interval[0])
+        self.by_hi = sorted(here, key=lambda interval: interval[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def overlapping(self, lo: float, hi: float, result: Set[int]) -> Set[int]:
+        """Добавляет в result id интервалов, пересекающих [lo, hi]"""
+        node = self
+        while node is not None:
+            if hi < node.center:
+                for interval_lo, _, item in node.by_lo:
+                    if interval_lo > hi:
+                        break
+                    result.add(item)
+                node = node.left
+            elif lo > node.center:
+                for _, interval_hi, item in node.by_hi:
+                    if interval_hi < lo:
+                        break
+                    result.add(item)
+                node = node.right
+            else:
+                result.update(item for _, _, item in node.by_lo)
+                if node.left is not None:
+                    node.left.overlapping(lo, hi, result)
+                node = node.right
+        return result
+
+
+class _RangeIndex:
+    """Диапазоны фильтров по одному признаку + фильтры без ограничения"""
+
+    def __init__(self):
+        self.intervals: Dict[int, Tuple[float, float]] = {}
+        self.unconstrained: Set[int] = set()
+        self._tree: Optional[IntervalTree] = None
+        self._dirty = False
+
+    def add(self, filter_id: int, interval: Optional[Tuple[float, float]]):
+        # Перевернутый диапазон (min > max) в дерево не кладем - такой фильтр
+        # всегда попадает в кандидаты и проверяется SearchFilter.matches
+        if interval is None or interval[0] > interval[1]:
+            self.unconstrained.add(filter_id)
+        else:
+            self.intervals[filter_id] = interval
+            self._dirty = True
+
+    def remove(self, filter_id: int):
+        self.unconstrained.discard(filter_id)
+        if self.intervals.pop(filter_id, None) is not None:
+            self._dirty = True
+
+    def candidates(self, ranges: Iterable[Tuple[float, float]]) -> Set[int]:
+        """Фильтры, диапазон которых пересекает хотя бы один из ranges"""
+        if self._dirty:
+            # Дерево перестраивается лениво: сохраненные поиски меняются редко
+            items = [(lo, hi, filter_id) for filter_id, (lo, hi) in self.intervals.items()]
+            self._tree = IntervalTree(items) if items else None
+            self._dirty = False
+        result = set(self.unconstrained)
+        if self._tree is not None:
+            for lo, hi in ranges:
+                self._tree.overlapping(lo, hi, result)
+        return result
+
+
+class _ValueIndex:
+    """Множества фильтров по значениям (платформы, категории) + без ограничения"""
+
+    def __init__(self):
+        self.by_value: Dict[object, Set[int]] = {}
+        self.unconstrained: Set[int] = set()
+
+    def add(self, filter_id: int, values: list):
+        if not values:
+            self.unconstrained.add(filter_id)
+        for value in values:
+            self.by_value.setdefault(value, set()).add(filter_id)
+
+    def remove(self, filter_id: int, values: list):
+        self.unconstrained.discard(filter_id)
+        for value in values:
+            ids = self.by_value.get(value)
+            if ids is not None:
+                ids.discard(filter_id)
+                if not ids:
+                    del self.by_value[value]
+
+    def candidates(self, values: list) -> Set[int]:
+        result = set(self.unconstrained)
+        for value in values:
+            result |= self.by_value.get(value, set())
+        return result
+
+
+class SavedSearchIndex:
+    """Обратный индекс сохраненных поисков: блогер -> подходящие фильтры"""
+
+    def __init__(self):
+        self.filters: Dict[int, SearchFilter] = {}
+        self.platforms = _ValueIndex()
+        self.categories = _ValueIndex()
+        self.budget = _RangeIndex()
+        self.age = _RangeIndex()
+        self.loaded = False
+        self._load_lock = None
+
+    async def ensure_loaded(self):
+        """Загрузка всех сохраненных поисков из БД при первом обращении"""
+        if self.loaded:
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self.loaded:
+                return
+            from database.database import iter_search_filters
+            async for search in iter_search_filters():
+                self.add(search)
+            self.loaded = True
+            logger.info(f"Индекс сохраненных поисков загружен: {len(self.filters)} фильтров")
+
+    def add(self, search: SearchFilter):
+        if search.id in self.filters:
+            self.remove(search.id)
+        self.filters[search.id] = search
+        self.platforms.add(search.id, search.platforms)
+        self.categories.add(search.id, search.categories)
+
+        if search.budget_min is None and search.budget_max is None:
+            self.budget.add(search.id, None)
+        else:
+            low = search.budget_min if search.budget_min is not None else -INF
+            high = search.budget_max if search.budget_max is not None else INF
+            self.budget.add(search.id, (low, high))
+
+        if search.target_age_min is not None and search.target_age_max is not None:
+            self.age.add(search.id, (search.target_age_min, search.target_age_max))
+        else:
+            self.age.add(search.id, None)
+
+    def remove(self, filter_id: int):
+        search = self.filters.pop(filter_id, None)
+        if search is None:
+            return
+        self.platforms.remove(filter_id, search.platforms)
+        self.categories.remove(filter_id, search.categories)
+        self.budget.remove(filter_id)
+        self.age.remove(filter_id)
+
+    def candidates(self, blogger: Blogger) -> Set[int]:
+        """Фильтры, которые могут подойти блогеру (без проверки пола и доп. критериев)"""
+        result = self.platforms.candidates(blogger.platforms)
+        if result:
+            result &= self.categories.candidates(blogger.categories)
+        if result:
+            # Фильтр бюджета: хотя бы одна цена блогера попадает в диапазон фильтра
+            result &= self.budget.candidates([(price, price) for price in blogger.get_budget_prices()])
+        if result:
+            result &= self.age.candidates(blogger.get_audience_age_ranges())
+        return result
+
+    def match(self, blogger: Blogger) -> List[SearchFilter]:
+        """Сохраненные поиски, под которые подходит блогер"""
+        return [
+            self.filters[filter_id]
+            for filter_id in self.candidates(blogger)
+            if self.filters[filter_id].matches(blogger)
+        ]
+
+
+class NotificationBatcher:
+    """Пакетная отправка уведомлений о новых блогерах с ограничением частоты.
+
+    Совпадения копятся flush_interval секунд, затем каждому закупщику уходит
+    одно сообщение со списком блогеров. Между сообщениями выдерживается пауза,
+    чтобы не превышать max_per_second (лимит Telegram ~30 сообщений в секунду).
+    """
+
+    def __init__(self, flush_interval: float = 5.0, max_per_second: int = 20,
+                 max_bloggers_per_message: int = 10, remember_sent: int = 10000):
+        self.flush_interval = flush_interval
+        self.max_per_second = max_per_second
+        self.max_bloggers_per_message = max_bloggers_per_message
+        self.remember_sent = remember_sent
+        self._pending: Dict[int, Dict[int, Blogger]] = {}
+        # Уже отправленные пары (закупщик, блогер) - чтобы правки блогера не дублировали уведомления
+        self._sent: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с отправкой накопленных уведомлений"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._bot is not None:
+            await self.flush()
+
+    def add(self, buyer_id: int, blogger: Blogger):
+        key = (buyer_id, blogger.id)
+        if key in self._sent:
+            return
+        self._pending.setdefault(buyer_id, {})[blogger.id] = blogger
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомлений о сохраненных поисках: {e}")
+
+    async def flush(self):
+        if not self._pending or self._bot is None:
+            return
+        from database.database import get_user_by_id
+
+        pending, self._pending = self._pending, {}
+        delay = 1 / self.max_per_second
+        for buyer_id, bloggers in pending.items():
+            # Ошибка одного сообщения не должна терять уведомления остальных закупщиков
+            try:
+                buyer = await get_user_by_id(buyer_id)
+                if not buyer or buyer.is_blocked:
+                    continue
+                await self._send(buyer.telegram_id, list(bloggers.values()))
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления закупщику {buyer_id}: {e}")
+                continue
+            for blogger_id in bloggers:
+                self._remember((buyer_id, blogger_id))
+            await asyncio.sleep(delay)
+
+    async def _send(self, chat_id: int, bloggers: List[Blogger]):
+        shown = bloggers[:self.max_bloggers_per_message]
+        text = "🔔 <b>Новые блогеры по вашему сохраненному поиску</b>\n\n"
+        text += "\n".join(
+            f"• <a href=\"{html.escape(blogger.url, quote=True)}\">{html.escape(blogger.name)}</a>"
+            for blogger in shown
+        )
+        if len(bloggers) > len(shown):
+            text += f"\n... и еще {len(bloggers) - len(shown)}"
+        text += "\n\nОткройте 🔍 Поиск блогеров, чтобы посмотреть подробности."
+        try:
+            await self._bot.send_message(chat_id, text, parse_mode="HTML", disable_web_page_preview=True)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self._bot.send_message(chat_id, text, parse_mode="HTML", disable_web_page_preview=True)
+        except TelegramForbiddenError:
+            logger.info(f"Пользователь {chat_id} заблокировал бота, уведомление пропущено")
+
+    def _remember(self, key: Tuple[int, int]):
+        self._sent[key] = None
+        if len(self._sent) > self.remember_sent:
+            self._sent.popitem(last=False)
+
+
+saved_search_index = SavedSearchIndex()
+notification_batcher = NotificationBatcher()
+
+
+async def notify_saved_searches(blogger: Blogger):
+    """Поставить в очередь уведомления закупщикам, чьи сохраненные поиски подходят блогеру"""
+    try:
+        await saved_search_index.ensure_loaded()
+        for search in saved_search_index.match(blogger):
+            if search.buyer_id != blogger.seller_id:
+                notification_batcher.add(search.buyer_id, blogger)
+    except Exception as e:
+        logger.error(f"Ошибка проверки сохраненных поисков для блогера {blogger.id}: {e}")
@@ -0,0 +1,86 @@
+"""История поиска закупщиков.
+
+Каждый выполненный поиск (хеш критериев, число результатов, время
+выполнения) записывается в search_history. Чтобы не открывать отдельное
+соединение и транзакцию на каждый поиск, записи копятся в буфере
+SearchHistoryWriter и сбрасываются в БД пачкой - по таймеру или при
+заполнении буфера.
+
+Критерии приводятся к каноническому виду (списки отсортированы, ключи
+упорядочены), поэтому одинаковые поиски получают один filter_hash и
+хранятся в search_queries один раз.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_filters(filters: dict) -> Tuple[str, str]:
+    """Канонический JSON критериев поиска и его хеш"""
+    canonical = {
+        key: sorted(value) if isinstance(value, list) else value
+        for key, value in filters.items()
+        if value is not None and value != []
+    }
+    filters_json = json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(filters_json.encode()).hexdigest()[:16], filters_json
+
+
+class SearchHistoryWriter:
+    """Буферизованная запись истории поиска"""
+
+    def __init__(self, flush_interval: float = 10.0, max_buffer: int = 200):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[Tuple[int, str, str, int, int, int]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с записью накопленного буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def add(self, buyer_id: int, filters: dict, results_count: int, latency: float):
+        """Добавить выполненный поиск в буфер (latency - в секундах)"""
+        filter_hash, filters_json = canonical_filters(filters)
+        self._buffer.append((buyer_id, filter_hash, filters_json, results_count,
+                             round(latency * 1000), int(time.time())))
+        if len(self._buffer) >= self.max_buffer and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Запись буфера в БД. При ошибке записи пачка отбрасывается (история не критична)"""
+        if not self._buffer:
+            return
+        from database.database import add_search_history_batch
+
+        entries, self._buffer = self._buffer, []
+        try:
+            await add_search_history_batch(entries)
+        except Exception as e:
+            logger.error(f"Ошибка записи истории поиска ({len(entries)} записей): {e}")
+
+
+search_history_writer = SearchHistoryWriter()
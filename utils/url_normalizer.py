@@ -0,0 +1,115 @@
+"""Канонический вид ссылки на блогера для поиска дубликатов.
+
+Одного блогера продавцы указывают по-разному: с www и без, через
+мобильный домен, со слешем в конце, с метками utm_*/igshid, ссылкой на
+сторис вместо профиля. canonical_url сводит такие ссылки к виду
+"платформа:ник" (instagram:anna_fit, youtube:@anna, telegram:annafit),
+а для прочих сайтов - к "домен/путь" без меток отслеживания.
+
+Ники сравниваются без учета регистра, кроме идентификаторов каналов
+YouTube и приглашений Telegram, где регистр значим.
+"""
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Домен (без www./m.) -> платформа
+PLATFORM_HOSTS = {
+    'instagram.com': 'instagram',
+    'instagr.am': 'instagram',
+    'youtube.com': 'youtube',
+    'tiktok.com': 'tiktok',
+    't.me': 'telegram',
+    'telegram.me': 'telegram',
+    'vk.com': 'vk',
+    'vk.ru': 'vk',
+}
+
+_HOST_PREFIXES = ('www.', 'm.', 'mobile.')
+
+# Параметры ссылок, которые не меняют страницу
+TRACKING_PARAMS = {'igshid', 'igsh', 'si', 'fbclid', 'gclid', 'yclid', 'ref', 'feature', 'share'}
+
+# Служебные разделы Instagram: ник идет следующим сегментом (stories/<ник>/...)
+_INSTAGRAM_PREFIXES = {'stories'}
+_INSTAGRAM_RESERVED = {'p', 'reel', 'reels', 'tv', 'explore', 'accounts'}
+
+
+def _split(url: str) -> Tuple[str, list, str]:
+    """Домен без www./m., непустые сегменты пути, строка запроса"""
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    return host, [segment for segment in parts.path.split('/') if segment], parts.query
+
+
+def _profile_handle(platform: str, segments: list) -> Optional[str]:
+    """Ник профиля из сегментов пути или None, если ссылка не на профиль"""
+    if not segments:
+        return None
+    first = segments[0]
+
+    if platform == 'instagram':
+        if first.lower() in _INSTAGRAM_PREFIXES and len(segments) > 1:
+            return segments[1].lower()
+        return None if first.lower() in _INSTAGRAM_RESERVED else first.lower()
+
+    if platform == 'youtube':
+        if first.startswith('@'):
+            return first.lower()
+        if first in ('channel', 'c', 'user') and len(segments) > 1:
+            # Идентификатор канала (UC...) чувствителен к регистру
+            return f"{first}/{segments[1] if first == 'channel' else segments[1].lower()}"
+        return None
+
+    if platform == 'tiktok':
+        return first.lstrip('@').lower() if first.startswith('@') else None
+
+    if platform == 'telegram':
+        if first == 's' and len(segments) > 1:
+            first = segments[1]
+        # Приглашения (+abc, joinchat/abc) чувствительны к регистру
+        if first.startswith('+') or first == 'joinchat':
+            return '/'.join(segments[:2])
+        return first.lower()
+
+    if platform == 'vk':
+        return first.lower()
+
+    return None
+
+
+def _strip_tracking(query: str) -> str:
+    params = [
+        (key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')
+    ]
+    return urlencode(sorted(params))
+
+
+def canonical_url(url: str) -> Optional[str]:
+    """Канонический ключ ссылки или None, если ссылку не разобрать"""
+    if not url:
+        return None
+    try:
+        host, segments, query = _split(url)
+    except ValueError:
+        return None
+    if not host:
+        return None
+
+    platform = PLATFORM_HOSTS.get(host)
+    if platform:
+        handle = _profile_handle(platform, segments)
+        if handle:
+            return f"{platform}:{handle}"
+
+    # Прочие ссылки (и не-профильные ссылки платформ): домен + путь без меток
+    key = host + ('/' + '/'.join(segments) if segments else '')
+    query = _strip_tracking(query)
+    return f"{key}?{query}" if query else key